@@ -157,6 +157,11 @@ Description=Runs Piponic Monitoring System
 After=network.target
 
 [Service]
+# piponic tells systemd it is up once the first telemetry message is acked.
+# It keeps queueing readings while offline, so there is no start timeout.
+Type=notify
+NotifyAccess=main
+TimeoutStartSec=infinity
 ExecStart=/usr/bin/python3 piponic.py \
     --project_id=${PROJECT_ID} \
     --registry_id=${REGISTRY_ID} \
@@ -173,11 +178,13 @@ User=pi
 WantedBy=multi-user.target
 " > piponic.service
 
-# Install, start, and enable systemd service
+# Install, enable, and start systemd service. systemd only sees the new unit
+# file after daemon-reload. The start does not wait for piponic to report it
+# is ready, which can take until the device is online.
 mv piponic.service /etc/systemd/system/piponic.service
-systemctl start piponic.service
-systemctl enable piponic.service
 systemctl daemon-reload
+systemctl enable piponic.service
+systemctl start --no-block piponic.service
 
 echo ""
-echo "Installation complete. Piponic should now be running."
+echo "Installation complete. Piponic is starting, see: systemctl status piponic"
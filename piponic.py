@@ -38,66 +38,79 @@
 #          Only use this command if running manually. The install.sh
 #          script installs this to run automatically when the Raspberry Pi boots.
 #          Please see install.sh for more details.
+#
+#          To run the full loop against simulated hardware on a virtual clock:
+#
+#          $ python3 piponic.py --simulate --simulate_hours=24
 
 import argparse
-import datetime
 import json
 import os
 import ssl
+import sys
 import time
 
+# First, so the startup trace covers every import
+import src.startup as startup
 
-import jwt
-import paho.mqtt.client as mqtt
+# The simulated hardware replaces RPi.GPIO, board, busio etc.,
+# so it must be registered before any of the src drivers are imported
+SIMULATE = '--simulate' in sys.argv
+if SIMULATE:
+    import src.simulator as simulator
+    simulator.install()
 
-from gpiozero import LED
-from threading import Lock
+import paho.mqtt.client as mqtt
 
 import src.device as dev 
 import src.relay as relay
 import src.adc as adc
 import src.temp as temp
 import src.pins as pins
-import src.water_level as WL
-import src.control as control
+import src.outbox as outbox
+import src.telemetry as telemetry
+import src.connection as connection
+import src.leak as leak
+import src.actuator as actuator
+import src.dosing as dosing
+import src.topology as topology
+import src.log as log
+import src.gateway as gateway
+import src.metrics as metrics
+
+# src.control, src.runtime (asyncio) and src.credentials (jwt, cryptography)
+# are imported where they are used, as they are slow to import on a Pi Zero
+# and not every run needs them
+startup.mark('imports')
 
 CONTROL_LOOPS_ENABLED=False #disable multithreaded control loops
 WATER_LEVEL_CTRL_ENABLED=False # Whether to automatically control water level
-
-def create_jwt(project_id, private_key_file, algorithm):
-    """Create a JWT (https://jwt.io) to establish an MQTT connection."""
-    token = {
-        'iat': datetime.datetime.utcnow(),
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=60),
-        'aud': project_id
-    }
-    with open(private_key_file, 'r') as f:
-        private_key = f.read()
-    print('Creating JWT using {} from private key file {}'.format(
-        algorithm, private_key_file))
-    return jwt.encode(token, private_key, algorithm=algorithm)
+ADC_CONTINUOUS_ENABLED=False # Convert every ADC channel continuously using the ADS1115 ALERT/RDY pin
+LEAK_MONITOR_ENABLED=True # Check for leaks several times a second and cut off the relays
 
 def parse_command_line_args():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(
         description='Example Google Cloud IoT MQTT device connection code.')
+    # Cloud IoT credentials are not needed when running against simulated hardware
     parser.add_argument(
         '--project_id',
         default=os.environ.get("GOOGLE_CLOUD_PROJECT"),
-        required=True,
+        required=not SIMULATE,
         help='GCP cloud project name.')
     parser.add_argument(
-        '--registry_id', required=True, help='Cloud IoT registry id')
+        '--registry_id', required=not SIMULATE, help='Cloud IoT registry id')
     parser.add_argument(
         '--device_id',
-        required=True,
+        required=not SIMULATE,
+        default='simulated-device',
         help='Cloud IoT device id')
     parser.add_argument(
-        '--private_key_file', required=True, help='Path to private key file.')
+        '--private_key_file', required=not SIMULATE, help='Path to private key file.')
     parser.add_argument(
         '--algorithm',
         choices=('RS256', 'ES256'),
-        required=True,
+        required=not SIMULATE,
         help='Which encryption algorithm to use to generate the JWT.')
     parser.add_argument(
         '--cloud_region', default='us-central1', help='GCP cloud region')
@@ -121,132 +134,467 @@ def parse_command_line_args():
         default='event',
         help=('Indicates whether the message to be published is a '
               'telemetry event or a device state message.'))
+    parser.add_argument(
+        '--simulate',
+        action='store_true',
+        help=('Run against simulated sensors and relays on a virtual clock, '
+              'publishing to an in-process loopback instead of Cloud IoT.'))
+    parser.add_argument(
+        '--simulate_hours',
+        type=float,
+        default=24,
+        help='Simulated time to run for when --simulate is given.')
+    parser.add_argument(
+        '--outbox_path',
+        default='outbox.db',
+        help=('SQLite file that holds telemetry until the MQTT bridge acks it. '
+              'Defaults to a scratch directory when --simulate is given.'))
+    parser.add_argument(
+        '--outbox_max_mb',
+        type=float,
+        default=50,
+        help='Disk space the telemetry outbox may use before dropping the oldest messages.')
+    parser.add_argument(
+        '--max_in_flight',
+        type=int,
+        default=10,
+        help=('Most telemetry messages published but not yet acked by the MQTT bridge. '
+              'The rest wait in the outbox.'))
+    parser.add_argument(
+        '--ack_timeout_secs',
+        type=float,
+        default=600,
+        help='Seconds to wait for the MQTT bridge to ack a message before sending it again.')
+    parser.add_argument(
+        '--telemetry_format',
+        choices=('json', 'binary'),
+        default='json',
+        help=('json publishes one JSON document per update. binary records every '
+              'reading and publishes batches in the compact format of src/telemetry.py '
+              'to the "batch" events subfolder.'))
+    parser.add_argument(
+        '--jwt_expires_minutes',
+        type=float,
+        default=60,
+        help='Lifetime of each JWT. A new one is minted and used shortly before expiry.')
+    parser.add_argument(
+        '--runtime',
+        choices=('threaded', 'asyncio'),
+        default='threaded',
+        help=('threaded runs the original blocking main loop. asyncio schedules '
+              'sensing, publishing, control and relay pulses as tasks at a fixed rate.'))
+    parser.add_argument(
+        '--telemetry_batch_size',
+        type=int,
+        default=10,
+        help='Samples per message when --telemetry_format=binary.')
+    parser.add_argument(
+        '--gateway_id',
+        default=None,
+        help=('Connect as this Cloud IoT gateway and attach --device_id to it, '
+              'instead of connecting as --device_id.'))
+    parser.add_argument(
+        '--metrics_port',
+        type=int,
+        default=9109,
+        help='Local port serving metrics in the Prometheus text format on /metrics. 0 turns it off.')
+    parser.add_argument(
+        '--metrics_interval_minutes',
+        type=float,
+        default=0,
+        help='Also publish a summary of the metrics to the "metrics" events subfolder this often. 0 turns it off.')
+    parser.add_argument(
+        '--topology',
+        default=None,
+        help=('JSON file mapping tanks to their temperature probes, ADC addresses '
+              'and relays, see src/topology.py. Defaults to one tank wired as in src/pins.py.'))
+    parser.add_argument(
+        '--log_level',
+        choices=('debug', 'info', 'warn', 'error'),
+        default='info',
+        help=('Least severe log records written out. Every level is kept in memory '
+              'for a dump_log command.'))
+    parser.add_argument(
+        '--log_file',
+        default=None,
+        help='Append log records to this file instead of the console.')
+    parser.add_argument(
+        '--journald',
+        action='store_true',
+        help='Send log records to the systemd journal instead of the console.')
+    parser.add_argument(
+        '--log_ring_size',
+        type=int,
+        default=1000,
+        help='Most recent log records kept in memory for a dump_log command.')
+    parser.add_argument(
+        '--profile_startup', '--profile-startup',
+        action='store_true',
+        help='Log how long each startup phase took, once the first message is acked.')
 
     return parser.parse_args()
 
 
+def create_client(args):
+    """Create the MQTT client for Cloud IoT, or a loopback client when simulating."""
+    # A gateway connects, and signs its JWT, as itself
+    client_id = 'projects/{}/locations/{}/registries/{}/devices/{}'.format(
+        args.project_id,
+        args.cloud_region,
+        args.registry_id,
+        args.gateway_id or args.device_id)
+
+    if args.simulate:
+        return simulator.create_client(client_id)
+
+    client = mqtt.Client(client_id=client_id)
+    client.tls_set(ca_certs=args.ca_certs, tls_version=ssl.PROTOCOL_TLSv1_2)
+    return client
+
 def main():
     args = parse_command_line_args()
 
+    # Written out from a background thread, so logging never waits on the console or disk
+    log.configure(args.log_level, path=args.log_file, journald=args.journald,
+                  ring_size=args.log_ring_size)
+    log.start()
+
+    if args.profile_startup:
+        startup.on_ready(lambda phases: log.info(
+            'Startup trace', total_secs=round(phases[-1][1], 3),
+            **{name: round(secs, 3) for name, since_start, secs in phases}))
+    startup.mark('arguments')
+
+    if args.simulate:
+        simulator.clock().duration_secs = args.simulate_hours * 3600
+
     # Create the MQTT client and connect to Cloud IoT.
-    client = mqtt.Client(
-        client_id='projects/{}/locations/{}/registries/{}/devices/{}'.format(
-            args.project_id,
-            args.cloud_region,
-            args.registry_id,
-            args.device_id))
-    client.username_pw_set(
-        username='unused',
-        password=create_jwt(
-            args.project_id,
-            args.private_key_file,
-            args.algorithm))
-    client.tls_set(ca_certs=args.ca_certs, tls_version=ssl.PROTOCOL_TLSv1_2)
+    client = create_client(args)
+    startup.mark('mqtt_client')
 
+    # Hardware bring-up, once: each bus, pin and probe is set up the first time it is used
     device = dev.Device()
+    if args.topology is not None:
+        # Monitor several tanks from this Pi
+        device.configure_tanks(topology.load(args.topology))
+        log.info('Monitoring tanks', tanks=','.join(tank.name for tank in device.tanks))
+    startup.mark('hardware')
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            startup.mark('connected')
+        device.on_connect(client, userdata, flags, rc)
+
+    # Runs the network loop, and reconnects and resubscribes when the link drops
+    mqtt_connection = connection.ConnectionManager(client, args.mqtt_bridge_hostname,
+                                                   args.mqtt_bridge_port,
+                                                   on_connect=on_connect,
+                                                   on_disconnect=device.on_disconnect)
+    device.attach_connection(mqtt_connection)
+
+    # The JWT password expires, so it is refreshed in the background
+    jwt_manager = None
+    if not args.simulate:
+        import src.credentials as credentials
+        jwt_manager = credentials.JWTManager(client, args.project_id,
+                                             args.private_key_file, args.algorithm,
+                                             reconnect=lambda: mqtt_connection.reconnect(timeout=60),
+                                             is_connected=mqtt_connection.is_connected,
+                                             lifetime_mins=args.jwt_expires_minutes)
+        jwt_manager.install()
+
+    if ADC_CONTINUOUS_ENABLED:
+        device.adc_sensors.start_continuous()
        
-    # Callbacks for when MQTT events occur
-    client.on_connect = device.on_connect
+    # Callbacks for when MQTT events occur. Connects and disconnects
+    # reach the device through the connection manager.
     client.on_publish = device.on_publish
-    client.on_disconnect = device.on_disconnect
     client.on_subscribe = device.on_subscribe
     client.on_message = device.on_message
 
-    # Connect and start the MQTT client
-    client.connect(args.mqtt_bridge_hostname, args.mqtt_bridge_port)
-    client.loop_start()
+    # All telemetry goes through a durable outbox, so nothing is lost while offline
+    outbox_path = args.outbox_path
+    if args.simulate:
+        outbox_path = os.path.join(simulator.data_dir(), 'outbox.db')
+    telemetry_outbox = outbox.Outbox(client, outbox_path,
+                                     max_bytes=int(args.outbox_max_mb * 1024 * 1024),
+                                     max_in_flight=args.max_in_flight,
+                                     ack_timeout_secs=args.ack_timeout_secs,
+                                     # Tell systemd we are up once the first message gets through
+                                     on_delivered=lambda count: startup.ready())
+    telemetry_outbox.start()
+    startup.mark('outbox')
 
     # This is the topic that the device will publish telemetry events
     # (temperature data) to.
     mqtt_telemetry_topic = '/devices/{}/events'.format(args.device_id)
 
+    # Subfolder of the telemetry topic for batched binary telemetry
+    mqtt_batch_topic = '{}/batch'.format(mqtt_telemetry_topic)
+
+    # Subfolder of the telemetry topic for the readings of each tank
+    mqtt_tank_topic = '{}/tanks'.format(mqtt_telemetry_topic)
+
+    # Subfolder of the telemetry topic for periodic metrics summaries
+    mqtt_metrics_topic = '{}/metrics'.format(mqtt_telemetry_topic)
+
+    # Subfolder of the telemetry topic for log dumps, sent when a dump_log command asks
+    mqtt_log_topic = '{}/logs'.format(mqtt_telemetry_topic)
+    device.attach_outbox(telemetry_outbox, log_topic=mqtt_log_topic)
+
+    # Subfolder of the telemetry topic for alarms as they are raised and cleared
+    mqtt_alarm_topic = '{}/alarms'.format(mqtt_telemetry_topic)
+
     # This is the topic that the device will receive configuration updates on.
     mqtt_config_topic = '/devices/{}/config'.format(args.device_id)
 
     # This is the topic that the device will recieve commands from
     mqtt_command_topic = '/devices/{}/commands/#'.format(args.device_id)
 
-    # Subscribe to the config topic.
-    client.subscribe(mqtt_config_topic, qos=1)
+    mqtt_gateway = None
+    if args.gateway_id is not None:
+        # This device is attached, and subscribed to its config and commands,
+        # on every connect of the gateway's connection
+        mqtt_gateway = gateway.Gateway(mqtt_connection, args.gateway_id)
+        mqtt_gateway.attach(args.device_id, device.on_message)
+        log.info('Attaching devices through gateway', gateway=args.gateway_id,
+                 devices=','.join(mqtt_gateway.attached()))
+    else:
+        # Subscribe to the config topic, again after every reconnect
+        mqtt_connection.subscribe(mqtt_config_topic, qos=1)
+
+        # Subscribe to the commands topic
+        mqtt_connection.subscribe(mqtt_command_topic, qos=1)
+
+    # Connect and start the MQTT client. Connecting and the TLS handshake
+    # carry on in the background while the rest starts up.
+    mqtt_connection.start()
+    startup.mark('connecting')
+
+    if jwt_manager is not None:
+        jwt_manager.start()
+
+    def publish_alarm(event):
+        """Queue an alarm event for publishing straight away, from whichever thread saw it"""
+        telemetry_outbox.put(mqtt_alarm_topic, json.dumps({
+            'alarm': event.name,
+            'raised': event.raised,
+            'value': event.value,
+            'threshold': event.threshold,
+            'timestamp': time.time(),
+        }), qos=1)
+    device.alarms.add_listener(publish_alarm)
 
-    # Subscribe to the commands topic
-    client.subscribe(mqtt_command_topic, qos=1)
+    #temporary control fix - initialize the peristaltic pump here
+    # Every tank's relays, the primary tank's are the ones in src/pins.py
+    for pin in topology.relay_pins(device.tanks):
+        relay.init_pullup(pin)
+
+    # Works out each pH dose from the error, with gains from the device config
+    ph_dosing = dosing.PHDosingController(device.config_store)
+
+    # Times relay pulses in the background, so dosing never blocks the loop
+    actuators = actuator.ActuatorService()
+    actuators.start()
 
     if CONTROL_LOOPS_ENABLED:
+        import src.control as control
+
         # Start controller to maintain pH in a healthy range
-        pH_control_thread = control.pHController()
+        pH_control_thread = control.pHController(actuators, ph_dosing)
         pH_control_thread.start()
 
         # Start controller to maintain water level
-        wl_control_thread = control.waterLevelController()
+        wl_control_thread = control.waterLevelController(actuators)
         wl_control_thread.start()
 
-    #temporary control fix - initialize the peristaltic pump here
-    relay.init_pullup(pins.peristaltic_pump)
-    relay.init_pullup(pins.Water_level_solenoid)
-    min_pH_accuracy = 0.5
+    if LEAK_MONITOR_ENABLED:
+        # Sample the leak sensors between sensor cycles, and cut off the relays on a leak
+        # The leak sensors are on the primary tank's ADC, a leak cuts off every tank's relays
+        leak_monitor = leak.LeakMonitor(device, cutoff_pins=topology.relay_pins(device.tanks),
+                                        realtime=not args.simulate)
+        leak_monitor.start()
 
-    # Start main application loop
-    while True:
+    # Batches readings when publishing binary telemetry
+    batcher = telemetry.TelemetryBatcher(batch_size=args.telemetry_batch_size)
+
+    # Latency histograms of the sensor reads, main loop and publish acks
+    metrics_server = metrics_reporter = None
+    if args.metrics_port:
         try:
-            # Get most recent device configuration
-            device_config = device.get_config()
+            metrics_server = metrics.MetricsServer(port=args.metrics_port)
+            metrics_server.start()
+        except OSError as e:
+            log.warn('Could not serve metrics', error=e)
+    if args.metrics_interval_minutes > 0:
+        metrics_reporter = metrics.MetricsReporter(
+            lambda summary: telemetry_outbox.put(mqtt_metrics_topic, json.dumps(summary), qos=1),
+            args.metrics_interval_minutes * 60)
+        metrics_reporter.start()
+    loop_cycle_seconds = metrics.histogram('piponic_loop_cycle_seconds',
+                                           'Time for one main loop cycle', runtime='threaded')
+    startup.mark('services')
+
+    # The first binary batch goes out straight away, to get back on the dashboard soon after boot
+    first_update = True
+
+    def publish_sensor_data(scheduled=False, urgent=False, fresh=True):
+        """Queue the latest sensor readings for publishing.
+
+        JSON telemetry is sent for scheduled and urgent updates only. Binary
+        telemetry records every fresh reading and is sent once a batch is
+        ready, or straight away if urgent.
+
+        Args:
+            fresh (bool): whether any sensor was read since the last call,
+                          readings that did not change are not batched again
+        """
+        nonlocal first_update
+        if args.telemetry_format == 'binary':
+            payload = None
+            if fresh:
+                payload = batcher.add(time.time(), device.get_sensor_values())
+            if payload is None and (urgent or first_update):
+                payload = batcher.flush()
+            if payload is not None:
+                log.info('Publishing batch of sensor data', bytes=len(payload))
+                telemetry_outbox.put(mqtt_batch_topic, payload, qos=1)
+        elif scheduled or urgent:
+            sensor_data = device.get_sensor_data()
+            log.info('Publishing sensor data', data=sensor_data)
+            telemetry_outbox.put(mqtt_telemetry_topic, sensor_data, qos=1)
+
+        if (scheduled or urgent) and len(device.tanks) > 1:
+            # One message per tank, including the primary tank
+            for tank in device.tanks:
+                telemetry_outbox.put(mqtt_tank_topic, device.get_tank_data(tank.name), qos=1)
+
+        if first_update:
+            first_update = False
+            startup.mark('first_publish_queued')
+
+    if args.runtime == 'asyncio':
+        import src.runtime as runtime
+
+        loop = executor = None
+        if args.simulate:
+            loop = simulator.new_event_loop()
+            executor = simulator.InlineExecutor()
+        async_runtime = runtime.AsyncRuntime(device, publish_sensor_data,
+                                             ph_dosing=ph_dosing,
+                                             water_level_control=WATER_LEVEL_CTRL_ENABLED,
+                                             actuators=actuators,
+                                             executor=executor, loop=loop)
+        try:
+            async_runtime.run()
+        except BaseException as e:
+            # Exit main loop if there is an error so we can clean up
+            log.info('Main loop stopped', reason=repr(e))
 
-            # Update sensor measurements 
-            device.update_sensor_data()
+    # Start main application loop
+    while args.runtime == 'threaded':
+        try:
+            cycle_started = time.perf_counter()
 
-            # Fetch sensor data
-            sensor_data = device.get_sensor_data()
+            # Get most recent device configuration, an immutable snapshot
+            device_config = device.get_config()
 
-            # Publish sensor readings
-            print('Publishing sensor data: ', sensor_data)
-            client.publish(mqtt_telemetry_topic, sensor_data, qos=1)
+            # Batches are never older than the configured update interval
+            batcher.max_age_secs = device_config.update_interval_minutes * 60
 
             # Loop that checks sensor readings every minute
             # If there are errors detected, we post an update
             # Otherwise, we just post updates at 'update_interval_minutes'
-            for i in range(device_config['update_interval_minutes']):
-                device.update_sensor_data()
-
-                if device.error_detected():             
-                    print('[WARN] Unhealthy sensor readings detected. Publishing update early.')
-
-                    # Publish sensor readings
-                    sensor_data = device.get_sensor_data()
-                    print('Publishing sensor data: ', sensor_data)
-                    client.publish(mqtt_telemetry_topic, sensor_data, qos=1)
+            for i in range(device_config.update_interval_minutes):
+                # Only read the sensors whose sampling interval has elapsed.
+                # Every sensor is due on the first pass, which is the full
+                # read at startup.
+                due = device.update_due_sensors()
+
+                error_detected = device.error_detected()
+                if error_detected:
+                    log.warn('Unhealthy sensor readings detected. Publishing update early.')
+
+                # Publish sensor readings, batching them only if any were read
+                publish_sensor_data(scheduled=(i == 0), urgent=error_detected, fresh=bool(due))
                 
                 #pH control moved to here because multi-threading with control throws tricky error
-                if(abs(device.pH-float(device_config['target_ph']))>min_pH_accuracy):
-                        #turn on peristaltic pump
-                        relay.on_pu(pins.peristaltic_pump)
-                        time.sleep(1)
-                        relay.off_pu(pins.peristaltic_pump)
+                # Pulses no longer block, so only dose on a fresh reading and
+                # never while the last dose is still running
+                if 'pH' in due and not actuators.busy(pins.peristaltic_pump):
+                    dose_secs = ph_dosing.update(device.pH, time.monotonic())
+                    if dose_secs > 0:
+                        #turn on peristaltic pump, without waiting for it
+                        actuators.pulse(pins.peristaltic_pump, dose_secs)
 
                 if WATER_LEVEL_CTRL_ENABLED:
                     # If water level is low, turn on solenoid
-                    if(device.water_level == 0):                         
-                        relay.on_pu(pins.Water_level_solenoid)
-                        time.sleep(1)
-                        relay.off_pu(pins.Water_level_solenoid)
+                    if('water_level' in due and not actuators.busy(pins.Water_level_solenoid) and
+                            device.water_level == 0):
+                        actuators.pulse(pins.Water_level_solenoid, 1)
 
+            loop_cycle_seconds.observe(time.perf_counter() - cycle_started)
             time.sleep(60) # Sleep for a minute
         except:
             break # Exit main loop if there is an error so we can clean up
 
-    print("Killed main sensor loop")
+    log.info('Killed main sensor loop')
     
     # Kill control threads if main loop exits    
-    print("Killing control loops... May take up to 30 seconds...") 
+    log.info('Killing control loops... May take up to 30 seconds...')
     if CONTROL_LOOPS_ENABLED:
         pH_control_thread.kill()
         wl_control_thread.kill()
         pH_control_thread.join()
         wl_control_thread.join()
 
+    # Cut short any pulse in progress, every relay ends up off
+    actuators.stop(timeout=5)
+    log.info('Relay pulses', pulses=actuators.pulses, on_secs=actuators.on_secs)
+    log.info('Relays', relays=relay.stats())
+    log.info('pH dosing', **ph_dosing.stats())
+    log.info('I2C bus', **adc.i2c_bus.stats())
+    if metrics_reporter is not None:
+        metrics_reporter.kill()
+    if metrics_server is not None:
+        metrics_server.kill()
+    log.info('Relay GPIO writes', writes=relay.writes, skipped_as_no_ops=relay.skipped_writes)
+
+    if LEAK_MONITOR_ENABLED:
+        leak_monitor.kill()
+        leak_monitor.join(timeout=5)
+        log.info('Leak monitor', samples=leak_monitor.samples,
+                 read_errors=leak_monitor.read_errors, trips=leak_monitor.trips)
+
+    # Stop background temperature conversions
+    temp.stop()
+    if ADC_CONTINUOUS_ENABLED:
+        device.adc_sensors.stop_continuous()
+
     # Disconnect and clean up MQTT client
-    client.disconnect()
-    client.loop_stop()
+    if jwt_manager is not None:
+        jwt_manager.kill()
+    log.info('MQTT connection', **mqtt_connection.stats())
+    if mqtt_gateway is not None:
+        log.info('Gateway', **mqtt_gateway.stats())
+        mqtt_gateway.detach_all()
+    mqtt_connection.stop(timeout=10)
+
+    # Unsent telemetry stays on disk and is replayed on the next start
+    payload = batcher.flush()
+    if payload is not None:
+        telemetry_outbox.put(mqtt_batch_topic, payload, qos=1)
+    log.info('Telemetry messages waiting in outbox', pending=telemetry_outbox.pending())
+    log.info('Publish acks', **telemetry_outbox.stats())
+    telemetry_outbox.close()
+
+    # Everything still queued is written out
+    log.stop()
+
+    if args.simulate:
+        print(simulator.report())
+        simulator.uninstall()
+
     print("PiPonic application exited");
 
 if __name__ == '__main__':
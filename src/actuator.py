@@ -0,0 +1,264 @@
+'''
+File: actuator.py
+
+Purpose: Timed relay pulses without blocking the caller. Callers ask for a
+         pulse (pin, duration, priority) and return straight away. The
+         relay is switched on at once if it is idle, and one service thread
+         switches it off again when its timer on a hashed timer wheel
+         expires. Pulses on the same pin queue up by priority. Pulses on
+         different pins overlap. The service, not the caller, owns turning
+         relays off, so a relay stays on no longer than asked even if the
+         caller dies. Each pulse reports how long the relay was really on.
+
+Date: October 18, 2026
+
+Usage:
+    import src.actuator as actuator
+    actuators = actuator.ActuatorService()
+    actuators.start()
+    pulse = actuators.pulse(pins.peristaltic_pump, 1.0)
+    pulse.wait()          # optional, block until it is over
+    pulse.on_secs         # how long the relay was on
+    actuators.stop()      # switches every relay off
+'''
+
+import heapq
+import itertools
+import time
+from threading import Condition, Event, Lock, Thread
+
+import src.log as log
+import src.relay as relay
+
+# How the service thread waits on its condition. The simulator swaps in
+# a version that counts the timeout in virtual time.
+wait = Condition.wait
+
+class TimerWheel(object):
+    """Hashed timer wheel. Scheduling and cancelling are O(1).
+
+    Timers are kept in <slots> buckets of <tick_secs> each, by deadline.
+    A timer further away than one turn of the wheel waits in its bucket
+    until the wheel has come round enough times.
+
+    Args:
+        tick_secs (float): resolution of the wheel
+        slots (int): number of buckets
+    """
+
+    def __init__(self, tick_secs=0.01, slots=512):
+        self.tick_secs = tick_secs
+        self.slots = [dict() for i in range(slots)]
+        self.count = 0
+        self.ids = itertools.count()
+        # Last tick that expire() has processed
+        self.tick = None
+
+    def schedule(self, deadline, item):
+        """Call expire() at or after <deadline> to get <item> back. Returns a handle for cancel()."""
+        tick = int(deadline / self.tick_secs)
+        handle = (tick % len(self.slots), next(self.ids))
+        self.slots[handle[0]][handle[1]] = (deadline, item)
+        self.count += 1
+        return handle
+
+    def cancel(self, handle):
+        if self.slots[handle[0]].pop(handle[1], None) is not None:
+            self.count -= 1
+
+    def expire(self, now):
+        """Remove and return the items whose deadline is at or before <now>, soonest first"""
+        current = int(now / self.tick_secs)
+        if self.tick is None:
+            # First call, timers may have been scheduled at any time up to now
+            self.tick = current - len(self.slots)
+        # Only the buckets the wheel has moved past since the last call, at most
+        # one turn. The last call's bucket again, it may hold timers later in its tick.
+        first = max(self.tick, current - len(self.slots) + 1)
+        expired = []
+        for tick in range(first, current + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            for timer_id, (deadline, item) in list(bucket.items()):
+                if deadline <= now:
+                    del bucket[timer_id]
+                    expired.append((deadline, timer_id, item))
+        self.tick = current
+        self.count -= len(expired)
+        expired.sort(key=lambda entry: entry[:2])
+        return [item for deadline, timer_id, item in expired]
+
+    def next_deadline(self):
+        """Earliest deadline on the wheel, None if it is empty"""
+        if self.count == 0:
+            return None
+        return min(deadline for bucket in self.slots for deadline, item in bucket.values())
+
+    def __len__(self):
+        return self.count
+
+class Pulse(object):
+    """A request to switch a relay on for a while. Filled in as it runs."""
+
+    def __init__(self, pin, secs, priority):
+        self.pin = pin
+        self.secs = secs
+        self.priority = priority
+        self.requested = time.monotonic()
+        self.started = None
+        self.ended = None
+        # False if the relay could not be switched on, e.g. locked out during a leak
+        self.ran = None
+        self.done = Event()
+
+    @property
+    def on_secs(self):
+        """How long the relay was really on, 0 if it never switched on"""
+        if self.started is None or self.ended is None:
+            return 0.0
+        return self.ended - self.started
+
+    def wait(self, timeout=None):
+        """Block until the pulse is over. Returns False on timeout."""
+        return self.done.wait(timeout)
+
+class ActuatorService(Thread):
+    """
+    Runs relay pulses on one timer wheel in its own thread.
+
+    Args:
+        active_low (bool): whether the relays switch on when their pin is driven low
+        tick_secs (float): timer wheel resolution
+        max_queued (int): most pulses waiting on one pin. Beyond it, the
+                          lowest priority, newest pulse is dropped.
+    """
+
+    def __init__(self, active_low=True, tick_secs=0.01, max_queued=60):
+        super().__init__(daemon=True)
+        self.switch_on = relay.on_pu if active_low else relay.on
+        self.switch_off = relay.off_pu if active_low else relay.off
+        self.max_queued = max_queued
+
+        # Everything below is guarded by self.changed
+        self.changed = Condition(Lock())
+        self.wheel = TimerWheel(tick_secs)
+        self.active = {}       # pin -> Pulse switched on now
+        self.queued = {}       # pin -> heap of (-priority, sequence, Pulse)
+        self.sequence = itertools.count()
+
+        # Statistics, per pin
+        self.pulses = {}
+        self.on_secs = {}
+        self.refused = 0
+        self.dropped = 0
+
+        # Check whether to kill thread
+        self.killThread = False
+
+    def pulse(self, pin, secs, priority=0):
+        """Switch the relay on <pin> on for <secs> seconds. Returns at once.
+
+        If the pin is already pulsing, the pulse waits its turn behind
+        any queued pulses of the same or higher priority.
+
+        Returns:
+            (Pulse) : the request, whose done event is set once it is over
+        """
+        request = Pulse(pin, max(0.0, secs), priority)
+        with self.changed:
+            if self.killThread:
+                self.finish(request, ran=False)
+                return request
+            if pin not in self.active:
+                self.begin(request)
+            else:
+                queue = self.queued.setdefault(pin, [])
+                heapq.heappush(queue, (-priority, next(self.sequence), request))
+                if len(queue) > self.max_queued:
+                    # The largest entry is the lowest priority, most recent request
+                    drop = max(queue)
+                    queue.remove(drop)
+                    heapq.heapify(queue)
+                    self.dropped += 1
+                    self.finish(drop[2], ran=False)
+            self.changed.notify()
+        return request
+
+    def begin(self, request):
+        """Switch <request>'s relay on and start its timer. Call with self.changed held."""
+        if self.switch_on(request.pin) == -1:
+            # Locked out or failed, the relay is still off
+            self.refused += 1
+            self.finish(request, ran=False)
+            return
+        request.started = time.monotonic()
+        self.active[request.pin] = request
+        self.wheel.schedule(request.started + request.secs, request)
+
+    def end(self, request):
+        """Switch <request>'s relay off and start the next pulse on its pin. Call with self.changed held."""
+        try:
+            self.switch_off(request.pin)
+        except Exception as e:
+            log.error('Could not switch off relay', gpio=request.pin, error=e)
+        request.ended = time.monotonic()
+        del self.active[request.pin]
+        self.pulses[request.pin] = self.pulses.get(request.pin, 0) + 1
+        self.on_secs[request.pin] = self.on_secs.get(request.pin, 0.0) + request.on_secs
+        self.finish(request, ran=True)
+
+        queue = self.queued.get(request.pin)
+        while queue and request.pin not in self.active:
+            priority, sequence, following = heapq.heappop(queue)
+            self.begin(following)
+
+    def finish(self, request, ran):
+        request.ran = ran
+        request.done.set()
+
+    def run(self):
+        with self.changed:
+            try:
+                while not self.killThread:
+                    for request in self.wheel.expire(time.monotonic()):
+                        self.end(request)
+
+                    next_deadline = self.wheel.next_deadline()
+                    timeout = None if next_deadline is None else max(0.0, next_deadline - time.monotonic())
+                    # Woken early by new pulses and kill()
+                    wait(self.changed, timeout)
+            finally:
+                # Whatever happened, nothing is left switched on
+                self.all_off()
+
+    def all_off(self):
+        """Drop queued pulses and switch off every pulsing relay. Call with self.changed held."""
+        for queue in self.queued.values():
+            for priority, sequence, request in queue:
+                self.finish(request, ran=False)
+        self.queued.clear()
+        for request in list(self.active.values()):
+            self.end(request)
+
+    def busy(self, pin):
+        """Whether <pin> has a pulse running or queued"""
+        with self.changed:
+            return pin in self.active or bool(self.queued.get(pin))
+
+    def pending(self):
+        """Number of pulses running or queued"""
+        with self.changed:
+            return len(self.active) + sum(len(queue) for queue in self.queued.values())
+
+    def kill(self):
+        with self.changed:
+            self.killThread = True
+            self.changed.notify()
+
+    def stop(self, timeout=None):
+        """Stop the service, switching every relay off"""
+        self.kill()
+        if self.is_alive():
+            self.join(timeout)
+        else:
+            with self.changed:
+                self.all_off()
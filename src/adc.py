@@ -13,18 +13,289 @@ usage:
     sensors.read_leak()
     sensors.read_pH()
 
+    # All four channels in one locked pass
+    sample = sensors.read_all()
+    sample.pH, sample.leak, sample.timestamp
+
+    # Trade noise for speed on a single channel
+    sensors.configure_channel('battery', data_rate=860, gain=1)
+
+    # Filter bursts of conversions, see src/filters.py
+    sensors.configure_filters(device.get_config())
+    volts = sensors.read_filtered(['pH', 'leak'])
+
+    # Optional: convert every channel continuously, paced by the ALERT/RDY pin
+    sensors.start_continuous()
+    samples = sensors.read_buffer('pH')   # [(timestamp, volts), ...]
+    sensors.stop_continuous()
+
+    # A second ADS1115 on the same I2C bus, e.g. for another tank
+    tank2 = adc.adc_sensors(address=0x49)
+    tank2.read_pH()
+
+    # Calibrate with any number of buffer solutions, the probe in each in turn
+    sensors.calibrate_ph(1, 7.0)
+    sensors.calibrate_ph(2, 4.0)
+    sensors.calibrate_ph(3, 10.0)
+    sensors.calibration.history()    # every calibration version, see src/calibration.py
+
 
 
 Reference provided at: https://learn.adafruit.com/adafruit-4-channel-adc-breakouts/python-circuitpython
 
 '''
 
-import board
-import busio
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
-from threading import Lock
-import re
+from collections import deque, namedtuple
+from threading import Condition, Lock
+import RPi.GPIO as GPIO
+import heapq
+import itertools
+import time
+import src.calibration as calibration
+import src.filters as filters
+import src.log as log
+import src.metrics as metrics
+import src.pins as pins
+
+# One scan of every ADC channel. Voltages are in volts, timestamp is time.monotonic()
+ADCSample = namedtuple('ADCSample', ['timestamp', 'pH', 'pH_voltage', 'leak',
+                                     'battery', 'internal_leak'])
+
+# Default (data rate in samples/s, PGA gain) of each channel.
+# At 860 SPS a conversion takes ~1.2 ms, at 128 SPS ~7.8 ms. The pH probe
+# has a high output impedance and benefits from the slower, quieter rate.
+DEFAULT_CHANNEL_SETTINGS = {
+    'leak': (860, 1),
+    'pH': (128, 1),
+    'battery': (860, 1),
+    'internal_leak': (860, 1),
+}
+
+# Channel name to ADS1115 input
+CHANNELS = {'leak': 0, 'pH': 1, 'battery': 2, 'internal_leak': 3}
+
+# I2C address of an ADS1115 with its ADDR pin tied to GND. ADDR tied to
+# VDD, SDA or SCL gives the others, so up to four chips share one bus.
+DEFAULT_ADDRESS = 0x48
+ADDRESSES = (0x48, 0x49, 0x4A, 0x4B)
+
+# pH calibration of the ADS1115 at DEFAULT_ADDRESS, in the old text format.
+# Only read, to start the calibration store from.
+CALIBRATION_FILE = "src/pH_calibration_values.txt"
+
+# ADS1115 registers and config register fields (see the ADS1115 datasheet, section 9.6)
+REG_CONVERSION = 0x00
+REG_CONFIG = 0x01
+REG_LO_THRESH = 0x02
+REG_HI_THRESH = 0x03
+CONFIG_MUX_SINGLE = {0: 0x4000, 1: 0x5000, 2: 0x6000, 3: 0x7000}
+CONFIG_GAIN = {2/3: 0x0000, 1: 0x0200, 2: 0x0400, 4: 0x0600, 8: 0x0800, 16: 0x0A00}
+CONFIG_FULL_SCALE_VOLTS = {2/3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}
+CONFIG_DATA_RATE = {8: 0x0000, 16: 0x0020, 32: 0x0040, 64: 0x0060,
+                    128: 0x0080, 250: 0x00A0, 475: 0x00C0, 860: 0x00E0}
+CONFIG_MODE_CONTINUOUS = 0x0000
+CONFIG_MODE_SINGLE = 0x0100
+CONFIG_COMP_QUE_ONE = 0x0000
+CONFIG_COMP_QUE_DISABLE = 0x0003
+
+def check_channels(channels):
+    """A copy of <channels>, channel name to ADS1115 input
+
+    Raises:
+        ValueError: if it does not map every channel in CHANNELS to its own input
+    """
+    channels = dict(channels)
+    if sorted(channels) != sorted(CHANNELS) or sorted(channels.values()) != sorted(CHANNELS.values()):
+        raise ValueError('ADC channels must map {} to inputs 0 to 3'.format(
+            ', '.join(sorted(CHANNELS))))
+    return channels
+
+def calibration_path(address):
+    """pH calibration file of the ADS1115 at <address>, in the old text format"""
+    if address == DEFAULT_ADDRESS:
+        return CALIBRATION_FILE
+    return "src/pH_calibration_values_{:#x}.txt".format(address)
+
+def calibration_store_path(address):
+    """pH calibration store of the ADS1115 at <address>, see src/calibration.py"""
+    return "src/pH_calibration_{:#x}.json".format(address)
+
+class BusArbiter(object):
+    """Lock for a bus shared by several chips, so one transfer is on the bus at a time.
+
+    Threads waiting for the bus get it in order of priority, then in the
+    order they asked, instead of whichever thread the OS happens to wake.
+    A quick leak check is not stuck behind a queue of slow pH conversions.
+    Works wherever a Lock does, through acquire() and release().
+    """
+
+    def __init__(self):
+        self.changed = Condition(Lock())
+        self.busy = False
+        self.waiting = []        # heap of (-priority, ticket)
+        self.tickets = itertools.count()
+
+        # Statistics
+        self.claims = 0
+        self.contended = 0
+        self.wait_secs = 0.0
+
+    def acquire(self, priority=0):
+        """Wait for the bus. Higher <priority> goes first."""
+        with self.changed:
+            self.claims += 1
+            if not self.busy and not self.waiting:
+                self.busy = True
+                BUS_WAIT.observe(0.0)
+                return True
+            self.contended += 1
+            entry = (-priority, next(self.tickets))
+            heapq.heappush(self.waiting, entry)
+            started = time.monotonic()
+            with metrics.timer(BUS_WAIT):
+                self.changed.wait_for(lambda: not self.busy and self.waiting[0] == entry)
+            heapq.heappop(self.waiting)
+            self.busy = True
+            self.wait_secs += time.monotonic() - started
+            return True
+
+    def release(self):
+        with self.changed:
+            self.busy = False
+            if self.waiting:
+                self.changed.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def stats(self):
+        """Bus statistics, as a dictionary"""
+        with self.changed:
+            return {'claims': self.claims, 'contended': self.contended,
+                    'wait_secs': self.wait_secs}
+
+# Every ADS1115 shares the one I2C bus, and this lock
+i2c_bus = BusArbiter()
+
+# Time spent waiting for the I2C bus, long waits are stalls
+BUS_WAIT = metrics.histogram('piponic_i2c_bus_wait_seconds', 'Time waiting for the I2C bus')
+
+_i2c = None
+_i2c_lock = Lock()
+
+def shared_i2c():
+    """The I2C bus object, created once for every chip on the bus"""
+    global _i2c
+    with _i2c_lock:
+        if _i2c is None:
+            # Imported on first use rather than with this module: board probes
+            # the platform when imported, which fails anywhere but on a Pi
+            import board
+            import busio
+            _i2c = busio.I2C(board.SCL, board.SDA)
+        return _i2c
+
+class ContinuousAcquisition(object):
+    """Runs the ADS1115 in continuous-conversion mode, paced by its ALERT/RDY pin.
+
+    With the high threshold MSB set and the low threshold MSB clear, the
+    ADS1115 pulses ALERT/RDY low at the end of every conversion. A GPIO
+    edge callback then reads the result, switches the input multiplexer to
+    the next channel in the scan (which restarts conversion) and appends
+    the result to that channel's buffer. No Python thread polls the bus.
+
+    At 860 SPS, scanning two channels gives about 430 samples/s on each.
+    """
+
+    def __init__(self, sensors, channels, rdy_pin, buffer_len):
+        self.sensors = sensors
+        self.ads = sensors.ads
+        self.channels = tuple(channels)
+        self.rdy_pin = rdy_pin
+        self.buffers = {channel: deque(maxlen=buffer_len) for channel in self.channels}
+        self.last_volts = {channel: None for channel in self.channels}
+        self.position = 0
+        self.conversions = 0
+        self.running = False
+
+    def config_word(self, channel):
+        data_rate, gain = self.sensors.channel_settings[channel]
+        return (CONFIG_MUX_SINGLE[self.sensors.channels[channel]] | CONFIG_GAIN[gain] |
+                CONFIG_MODE_CONTINUOUS | CONFIG_DATA_RATE[data_rate] | CONFIG_COMP_QUE_ONE)
+
+    def start(self):
+        """Configure ALERT/RDY as a conversion-ready output and begin converting."""
+        GPIO.setmode(GPIO.BCM)
+        # ALERT/RDY is open drain, so it needs a pull-up
+        GPIO.setup(self.rdy_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+        self.sensors.sensor_lock.acquire()
+        try:
+            # The adafruit driver has no public API for the threshold registers
+            self.ads._write_register(REG_HI_THRESH, 0x8000)
+            self.ads._write_register(REG_LO_THRESH, 0x0000)
+            self.position = 0
+            self.running = True
+            self.ads._write_register(REG_CONFIG, self.config_word(self.channels[0]))
+        finally:
+            self.sensors.sensor_lock.release()
+
+        GPIO.add_event_detect(self.rdy_pin, GPIO.FALLING, callback=self.on_ready)
+
+    def stop(self):
+        """Stop converting and hand the chip back to single-shot reads."""
+        GPIO.remove_event_detect(self.rdy_pin)
+        self.sensors.sensor_lock.acquire()
+        try:
+            self.running = False
+            # Any single-shot config write powers the chip down after one conversion
+            data_rate, gain = self.sensors.channel_settings[self.channels[0]]
+            self.ads._write_register(REG_CONFIG, CONFIG_MUX_SINGLE[self.sensors.channels[self.channels[0]]] |
+                                     CONFIG_GAIN[gain] | CONFIG_MODE_SINGLE |
+                                     CONFIG_DATA_RATE[data_rate] | CONFIG_COMP_QUE_DISABLE)
+            # Make the adafruit driver rewrite its own config on the next read
+            self.ads._last_pin_read = None
+        finally:
+            self.sensors.sensor_lock.release()
+
+    def on_ready(self, pin):
+        """GPIO callback: a conversion has finished on the current channel."""
+        self.sensors.sensor_lock.acquire()
+        try:
+            if not self.running:
+                return
+            channel = self.channels[self.position]
+            raw = self.ads._read_register(REG_CONVERSION)
+            # Move on to the next channel straight away so the chip keeps converting
+            if len(self.channels) > 1:
+                self.position = (self.position + 1) % len(self.channels)
+                self.ads._write_register(REG_CONFIG, self.config_word(self.channels[self.position]))
+            gain = self.sensors.channel_settings[channel][1]
+        finally:
+            self.sensors.sensor_lock.release()
+
+        if raw & 0x8000:
+            raw -= 1 << 16
+        volts = raw * CONFIG_FULL_SCALE_VOLTS[gain] / 32768
+        self.last_volts[channel] = volts
+        self.buffers[channel].append((time.monotonic(), volts))
+        self.conversions += 1
+
+    def latest(self, channel):
+        """Most recent voltage on <channel>, or None before the first conversion"""
+        return self.last_volts[channel]
+
+    def drain(self, channel):
+        """Remove and return every buffered (timestamp, volts) on <channel>"""
+        buffer = self.buffers[channel]
+        samples = []
+        while buffer:
+            samples.append(buffer.popleft())
+        return samples
 
 class adc_sensors:
     """Class which interfaces with the sensors attached to the ADC. Includes: 
@@ -36,12 +307,21 @@ class adc_sensors:
         This class is implemented using the Singleton Design pattern. This 
         allows global access to a single instance of this class. See here
         (https://python-3-patterns-idioms-test.readthedocs.io/en/latest/Singleton.html)
-        for more details.
+        for more details. There is one instance per ADS1115, by I2C address.
+
+        Args:
+            address (int): I2C address of the ADS1115, see ADDRESSES
+            channels (dict): channel name to ADS1115 input, CHANNELS by default.
+                             Only used when the instance is first created,
+                             see use_channels() to change them later.
     """
     class __adc_sensors():
-        def __init__(self):
-            # Only allow one thread to access sensors at a time
-            self.sensor_lock = Lock()
+        def __init__(self, address=DEFAULT_ADDRESS, channels=None):
+            # Only allow one thread on the I2C bus at a time, across every chip
+            self.sensor_lock = i2c_bus
+
+            self.address = address
+            self.channels = check_channels(CHANNELS if channels is None else channels)
 
             # Init ADC communication via I2C
             self.ads=0
@@ -61,158 +341,340 @@ class adc_sensors:
             self.pH_sensor = 0
             self.init_pH()
 
-            # Default pH calibration values
-            with open(r"src/pH_calibration_values.txt","r") as calibration_file:
-                    for line in calibration_file:
-                            #ignore text after comments
-                            line = line.partition('#')[0] 
-                            line = line.rstrip()
-                            
-                            if("pH_intercept" in line):
-                                temp = re.findall(r"[-+]?\d*\.\d+|\d+", line) # find floats in line
-                                temp = list(map(float,temp))
-                                self.pH_intercept = temp[0]
-                                print('pH intercept: ',self.pH_intercept)
-
-                            if("pH_offset" in line):
-                                temp = re.findall(r"[-+]?\d*\.\d+|\d+",line) #find floats in line
-                                temp = list(map(float,temp))
-                                self.pH_offset = temp[0]
-                                print('pH offset: ',self.pH_offset)
-
-                            if("pH_slope" in line):
-                                temp = re.findall(r"[-+]?\d*\.\d+|\d+", line) #find floating number
-                                temp = list(map(float,temp))
-                                self.pH_slope = temp[0]
-                                print('pH slope: ', self.pH_slope)
-
-           
-            self.calibration_pH_1 = None
+            # Data rate and gain of each channel, applied before each conversion
+            self.channel_settings = dict(DEFAULT_CHANNEL_SETTINGS)
+
+            # Continuous acquisition, when started with start_continuous()
+            self.acquisition = None
+
+            # Filter pipeline and burst size of each channel, raw single
+            # conversions until configure_filters() is called
+            self.filter_lock = Lock()
+            self.filters = {channel: filters.FilterPipeline() for channel in CHANNELS}
+            self.burst_samples = {channel: 1 for channel in CHANNELS}
+
+            # Conversion times and failures, to find slow channels and I2C errors
+            address_label = '{:#x}'.format(address)
+            self.read_seconds = {channel: metrics.histogram(
+                'piponic_adc_read_seconds', 'Time for one ADC conversion',
+                address=address_label, channel=channel) for channel in CHANNELS}
+            self.read_errors = metrics.counter('piponic_adc_errors', 'Failed ADC conversions',
+                                               address=address_label)
+
+            # pH calibration. A chip without calibrations of its own starts from
+            # its old calibration file, or else from the default chip's.
+            self.calibration = calibration.CalibrationStore(
+                calibration_store_path(address),
+                fallbacks=(calibration_path(address), calibration_store_path(DEFAULT_ADDRESS),
+                           CALIBRATION_FILE))
+            self.use_calibration(self.calibration.current)
      
         def init_i2c(self):
-            # Define i2c object
-            i2c = busio.I2C(board.SCL, board.SDA)
-            self.ads = ADS.ADS1115(i2c) 
+            # Imported here for the same reason as in shared_i2c()
+            import adafruit_ads1x15.ads1115 as ADS
+            # The i2c object is shared by every chip on the bus
+            self.ads = ADS.ADS1115(shared_i2c(), address=self.address)
     
     ############# Initialize all the ADC pins ##################
+
+        def input_pin(self, channel):
+            import adafruit_ads1x15.ads1115 as ADS
+            return (ADS.P0, ADS.P1, ADS.P2, ADS.P3)[self.channels[channel]]
+
+        def analog_in(self, channel):
+            from adafruit_ads1x15.analog_in import AnalogIn
+            return AnalogIn(self.ads, self.input_pin(channel))
     
         def init_leak(self):
-            self.leak_sensor= AnalogIn(self.ads,ADS.P0)
+            self.leak_sensor= self.analog_in('leak')
              
         def init_pH(self):
-            self.pH_sensor= AnalogIn(self.ads,ADS.P1)
+            self.pH_sensor= self.analog_in('pH')
             
         def init_battery(self):
-            self.battery_sensor= AnalogIn(self.ads,ADS.P2)       
+            self.battery_sensor= self.analog_in('battery')
     
         def init_internal_leak(self):
-            self.internal_leak= AnalogIn(self.ads,ADS.P3)     
+            self.internal_leak= self.analog_in('internal_leak')
+
+        def use_channels(self, channels):
+            """Read each channel from the ADS1115 input in <channels> from now on
+
+            Raises:
+                ValueError: if <channels> does not map every channel to its own input
+                RuntimeError: while continuous acquisition is running
+            """
+            channels = check_channels(channels)
+            self.sensor_lock.acquire()
+            try:
+                if channels == self.channels:
+                    return
+                if self.acquisition is not None:
+                    raise RuntimeError('Cannot change ADC channels during continuous acquisition')
+                self.channels = channels
+                self.init_battery()
+                self.init_internal_leak()
+                self.init_leak()
+                self.init_pH()
+            finally:
+                self.sensor_lock.release()
     
+        def configure_channel(self, channel, data_rate=None, gain=None):
+            """Set the data rate and/or PGA gain used when converting <channel>
+
+            Args:
+                channel (str): one of 'leak', 'pH', 'battery', 'internal_leak'
+                data_rate (int): samples per second, e.g. 128 or 860
+                gain (float): PGA gain, e.g. 2/3, 1, 2, 4, 8 or 16
+            """
+            if channel not in self.channel_settings:
+                raise ValueError('Unknown ADC channel: {}'.format(channel))
+            self.sensor_lock.acquire()
+            try:
+                old_data_rate, old_gain = self.channel_settings[channel]
+                self.channel_settings[channel] = (
+                    old_data_rate if data_rate is None else data_rate,
+                    old_gain if gain is None else gain)
+            finally:
+                self.sensor_lock.release()
+
+        def convert(self, channel, analog_in):
+            """Single conversion of <channel> with its own settings. Call with sensor_lock held.
+
+            While continuous acquisition is running, the latest buffered
+            conversion of <channel> is returned instead.
+
+            Raises:
+                RuntimeError: if continuous acquisition is running but not
+                              scanning <channel>, or has not converted it yet
+            """
+            if self.acquisition is not None:
+                if channel not in self.acquisition.buffers:
+                    # A single-shot conversion would rewrite the config register
+                    # and be filed under a scanned channel by the ALERT/RDY callback
+                    raise RuntimeError('ADC channel {} is not in the continuous scan'.format(channel))
+                volts = self.acquisition.latest(channel)
+                if volts is not None:
+                    return volts
+                raise RuntimeError('No conversion finished yet on ADC channel {}'.format(channel))
+            data_rate, gain = self.channel_settings[channel]
+            try:
+                with metrics.timer(self.read_seconds[channel]):
+                    if self.ads.data_rate != data_rate:
+                        self.ads.data_rate = data_rate
+                    if self.ads.gain != gain:
+                        self.ads.gain = gain
+                    return analog_in.voltage
+            except Exception:
+                self.read_errors.inc()
+                raise
+
+        def start_continuous(self, channels=tuple(CHANNELS), rdy_pin=pins.ADC0_ALERT_RDY,
+                             buffer_len=1024):
+            """Convert <channels> continuously, paced by the ALERT/RDY interrupt
+
+            Every read is served from the scan until stop_continuous(). A
+            single-shot conversion would disturb it, so reading a channel
+            that is not scanned raises RuntimeError: scan every channel you read.
+
+            Args:
+                channels (tuple): channel names to scan round-robin
+                rdy_pin (int): BCM GPIO wired to the ADS1115 ALERT/RDY pin
+                buffer_len (int): samples kept per channel
+            """
+            for channel in channels:
+                if channel not in CHANNELS:
+                    raise ValueError('Unknown ADC channel: {}'.format(channel))
+            if self.acquisition is not None:
+                self.stop_continuous()
+            acquisition = ContinuousAcquisition(self, channels, rdy_pin, buffer_len)
+            acquisition.start()
+            self.acquisition = acquisition
+
+        def stop_continuous(self):
+            """Return to single-shot conversions"""
+            if self.acquisition is not None:
+                acquisition = self.acquisition
+                self.acquisition = None
+                acquisition.stop()
+
+        def read_buffer(self, channel):
+            """Remove and return the buffered (timestamp, volts) samples of <channel>"""
+            if self.acquisition is None or channel not in self.acquisition.buffers:
+                return []
+            return self.acquisition.drain(channel)
+
     ############### READ functions ############################
-        def read_leak(self):
+        def read_all(self):
+            """Scan all four channels under a single lock acquisition
+
+            Returns:
+                (ADCSample) : immutable sample of every channel
+            """
             self.sensor_lock.acquire()
-            leak = self.leak_sensor.voltage
-            self.sensor_lock.release()
-            return leak 
+            try:
+                leak = self.convert('leak', self.leak_sensor)
+                pH_voltage = self.convert('pH', self.pH_sensor)
+                battery = self.convert('battery', self.battery_sensor)
+                internal_leak = self.convert('internal_leak', self.internal_leak)
+            finally:
+                self.sensor_lock.release()
+            return ADCSample(time.monotonic(), self.pH_from_voltage(pH_voltage), pH_voltage,
+                             leak, battery, internal_leak)
+
+        def configure_filters(self, config):
+            """Set each channel's filter pipeline and burst size from the device configuration
+
+            A channel whose filter spec is unchanged keeps its filter state.
+            """
+            with self.filter_lock:
+                for channel in CHANNELS:
+                    filter_key, burst_key = filters.config_keys(channel)
+                    spec, burst = filters.DEFAULT_FILTERS[channel]
+                    spec = config.get(filter_key, spec)
+                    if spec != self.filters[channel].spec:
+                        self.filters[channel] = filters.parse(spec)
+                    self.burst_samples[channel] = int(config.get(burst_key, burst))
+
+        def read_filtered(self, channels, priority=0):
+            """Convert a burst of each of <channels> under a single lock acquisition, and filter them
+
+            Args:
+                channels (iterable): channel names, see CHANNELS
+                priority (int): place in the queue for the I2C bus, higher goes first
+
+            Returns:
+                (dict) : channel name to filtered volts
+            """
+            analog_ins = {'leak': self.leak_sensor, 'pH': self.pH_sensor,
+                          'battery': self.battery_sensor, 'internal_leak': self.internal_leak}
+            bursts = {}
+            self.sensor_lock.acquire(priority)
+            try:
+                for channel in channels:
+                    count = self.burst_samples[channel]
+                    if self.acquisition is not None and channel in self.acquisition.buffers:
+                        # Continuous acquisition only has the latest conversion to give
+                        count = 1
+                    bursts[channel] = [self.convert(channel, analog_ins[channel])
+                                       for _ in range(count)]
+            finally:
+                self.sensor_lock.release()
+
+            # Filtered after the I2C bus is free again
+            now = time.monotonic()
+            with self.filter_lock:
+                return {channel: self.filters[channel].process(samples, now)
+                        for channel, samples in bursts.items()}
+
+        def read_channels(self, channels, priority=0):
+            """Convert only <channels> under a single lock acquisition
+
+            Args:
+                channels (iterable): channel names, see CHANNELS
+                priority (int): place in the queue for the I2C bus, higher goes first
+
+            Returns:
+                (dict) : channel name to volts
+            """
+            analog_ins = {'leak': self.leak_sensor, 'pH': self.pH_sensor,
+                          'battery': self.battery_sensor, 'internal_leak': self.internal_leak}
+            volts = {}
+            self.sensor_lock.acquire(priority)
+            try:
+                for channel in channels:
+                    volts[channel] = self.convert(channel, analog_ins[channel])
+            finally:
+                self.sensor_lock.release()
+            return volts
+
+        def pH_from_voltage(self, pH_voltage):
+            """Convert a pH probe voltage to pH with the current calibration"""
+            # One tuple, so a calibration in another thread never mixes old and new
+            slope, intercept = self.pH_coefficients
+            return slope * pH_voltage + intercept
+
+        def use_calibration(self, pH_calibration):
+            """Convert pH with <pH_calibration> from now on"""
+            self.pH_coefficients = (pH_calibration.slope, pH_calibration.intercept)
+            log.info('pH calibration', address='{:#x}'.format(self.address),
+                     version=pH_calibration.version, slope=pH_calibration.slope,
+                     intercept=pH_calibration.intercept, points=len(pH_calibration.points))
+
+        def read_leak(self):
+            return self.read_channels(['leak'])['leak']
 
         def read_pH(self):
-            self.sensor_lock.acquire()
-            pH_voltage = self.pH_sensor.voltage
-            pH = self.pH_intercept +(pH_voltage-self.pH_offset)*(self.pH_slope)
-            self.sensor_lock.release()
-            return pH
+            # Filtered, so noise does not trigger a dose
+            return self.pH_from_voltage(self.read_filtered(['pH'])['pH'])
 
         def read_battery(self):
-            self.sensor_lock.acquire()
-            battery_voltage = self.battery_sensor.voltage
-            self.sensor_lock.release()
-            return battery_voltage
+            return self.read_channels(['battery'])['battery']
     
         def read_internal_leak(self):
-            self.sensor_lock.acquire()
-            internal_leak = self.internal_leak.voltage
-            self.sensor_lock.release()
-            return internal_leak
+            return self.read_channels(['internal_leak'])['internal_leak']
 
-        def calibrate_ph_1(self, calibration_pH_1):
-            
-            # set the pH_offset to be the middle of the
-            self.sensor_lock.acquire()
-            self.pH_offset = self.pH_sensor.voltage # read the pH meter's voltage in the known solution 1
-            self.calibration_pH_1 = calibration_pH_1
-            self.sensor_lock.release()
+        def calibrate_ph(self, number, buffer_pH):
+            """Record calibration point <number> with the probe in a buffer solution of <buffer_pH>
 
-            #write the new pH offset to the src/pH_calibration_values.txt file
-            with open(r"src/pH_calibration_values.txt","r+") as calibration_file:
-                all_lines = calibration_file.readlines()
-                calibration_file.seek(0)
+            Point 1 starts a new calibration, which only moves the current
+            line to pass through it. Points 2 and up each refit the line to
+            every point so far by least squares. Wait at least 5 minutes
+            after moving the probe to a new solution.
 
-                for line in all_lines:
-                    if('pH_offset' not in line):
-                            #match = re.search(r"[-+]?\d*\.\d+|\d+",line) 
-                            #rewrite whole line
-                            calibration_file.write(line)
+            Returns:
+                (src.calibration.Calibration) : the new calibration, already in use
 
-                new_line = "pH_offset "+str(self.pH_offset)+"\n"
-                calibration_file.write(new_line) 
-                calibration_file.truncate()
+            Raises:
+                ValueError: if the point is out of order or does not fit
+            """
+            self.sensor_lock.acquire()
+            try:
+                volts = self.convert('pH', self.pH_sensor) # read the pH meter's voltage in the known solution
+            finally:
+                self.sensor_lock.release()
+            # Written to disk outside the I2C lock
+            pH_calibration = self.calibration.add_point(number, volts, buffer_pH)
+            self.use_calibration(pH_calibration)
+            return pH_calibration
+
+        def restore_calibration(self, version):
+            """Go back to an earlier calibration version, see src/calibration.py"""
+            pH_calibration = self.calibration.restore(version)
+            self.use_calibration(pH_calibration)
+            return pH_calibration
 
-        def calibrate_pH_1(self,calibration_pH_1):
-            self.calibrate_ph_1(calibration_pH_1)
-        
-        def calibrate_pH_2(self,calibration_pH_2):
-            self.calibrate_ph_2(calibration_pH_2)
+        def calibrate_ph_1(self, calibration_pH_1):
+            return self.calibrate_ph(1, calibration_pH_1)
 
         def calibrate_ph_2(self, calibration_pH_2):
-            #this function constructs a linear function of the form:
-            # y = m(x-offset)+b
-            # or
-            # pH = (slope)*(voltage-offset_voltage)+ pH_at_offset_voltage
+            return self.calibrate_ph(2, calibration_pH_2)
 
-            self.sensor_lock.acquire()
+        def calibrate_pH_1(self,calibration_pH_1):
+            return self.calibrate_ph(1, calibration_pH_1)
 
-            v2 = self.pH_sensor.voltage # read the pH meter's voltage in the known solution 2
-            try:    
-                #calculate slope of pH-voltage curve (should be negative)
-                self.pH_slope = float((self.calibration_pH_1-calibration_pH_2)/(self.pH_offset-v2))
-            except:
-                print('Divide by zero error: You must place the pH probe in the second solution and wait at least 5 minutes before calibrating with the second datapoint')
-            #pH curve 'intercept' anchored around first datapoint
-            self.pH_intercept = self.calibration_pH_1
-
-            self.sensor_lock.release()
-
-            with open(r"src/pH_calibration_values.txt","r+") as calibration_file:
-                all_lines = calibration_file.readlines()
-                calibration_file.seek(0)
-
-                for line in all_lines:
-                    if('pH_intercept' not in line):
-                        if('pH_slope' not in line): 
-                            #rewrite old line
-                            calibration_file.write(line)
-
-                new_line = "pH_slope "+str(self.pH_slope)+"\n"
-                calibration_file.write(new_line) 
-                new_line = "pH_intercept "+str(self.pH_intercept)+"\n"
-                calibration_file.write(new_line) 
-                calibration_file.truncate()
-    # The current singleton instance of __adc_sensors
-    instance = None
+        def calibrate_pH_2(self,calibration_pH_2):
+            return self.calibrate_ph(2, calibration_pH_2)
+
+    # The singleton instance of __adc_sensors for each I2C address
+    instances = {}
 
     # To ensure there is only one instance created across multiple threads
     instance_lock = Lock()
 
-    def __init__(self):
+    def __init__(self, address=DEFAULT_ADDRESS, channels=None):
         """
-        Creates single instance of the __adc_sensors class.
+        Creates single instance of the __adc_sensors class per address.
         This ensures that there is only one object interfacing
-        the adc in the application
+        each adc in the application
         """
         adc_sensors.instance_lock.acquire()
-        if not adc_sensors.instance:
-            adc_sensors.instance = adc_sensors.__adc_sensors()
-        adc_sensors.instance_lock.release()
+        try:
+            if address not in adc_sensors.instances:
+                adc_sensors.instances[address] = adc_sensors.__adc_sensors(address, channels)
+            self.instance = adc_sensors.instances[address]
+        finally:
+            adc_sensors.instance_lock.release()
 
     def __getattr__(self, name):
         """
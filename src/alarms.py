@@ -0,0 +1,158 @@
+'''
+File: alarms.py
+
+Purpose: Alarm rules for the sensor readings. The thresholds in the device
+         configuration are compiled into a flat table of rules, which is
+         checked in a single pass over each sample. Every alarm has its own
+         state: it is raised once its condition has held for a minimum
+         duration, and cleared only once the reading is back past the
+         threshold by a hysteresis band. Only these edges are reported, so
+         a condition that lasts an hour produces one event, not sixty.
+
+Date: October 18, 2026
+
+Usage:
+    import src.alarms as alarms
+    engine = alarms.AlarmEngine(device.get_config())
+    for event in engine.evaluate(time.monotonic(), device.get_sensor_values()):
+        print(event)     # AlarmEvent(name='pH_low', raised=True, ...)
+    engine.active()      # names of the alarms currently raised
+    engine.add_listener(on_alarm)    # called with every AlarmEvent, from any thread
+    engine.add_listener(cut_off_relays, first=True)    # ahead of every other listener
+'''
+
+from collections import namedtuple
+from threading import Lock, RLock
+
+import src.log as log
+
+# Order of the values passed to evaluate(), matches src.device.SENSOR_METRICS
+METRICS = ('temperature', 'pH', 'leak', 'water_level', 'battery_voltage', 'internal_leak')
+
+ABOVE = 1
+BELOW = -1
+
+# name, metric, direction, threshold setting, hysteresis setting, minimum duration setting
+RULES = (
+    ('leak', 'leak', ABOVE, 'leak_threshold_volts', 'leak_hysteresis_volts', 'leak_min_duration_secs'),
+    ('internal_leak', 'internal_leak', ABOVE, 'leak_threshold_volts', 'leak_hysteresis_volts', 'leak_min_duration_secs'),
+    ('pH_low', 'pH', BELOW, 'min_ph', 'ph_hysteresis', 'alarm_min_duration_secs'),
+    ('pH_high', 'pH', ABOVE, 'max_ph', 'ph_hysteresis', 'alarm_min_duration_secs'),
+    ('temperature_low', 'temperature', BELOW, 'min_temperature', 'temperature_hysteresis', 'alarm_min_duration_secs'),
+    ('temperature_high', 'temperature', ABOVE, 'max_temperature', 'temperature_hysteresis', 'alarm_min_duration_secs'),
+    ('low_battery', 'battery_voltage', BELOW, 'low_battery_volts', 'battery_hysteresis_volts', 'alarm_min_duration_secs'),
+)
+
+# Messages printed when an alarm is raised, as before the rule engine
+MESSAGES = {
+    'leak': 'Leak detected',
+    'internal_leak': 'Leak detected',
+    'pH_low': 'pH outside of healthy range',
+    'pH_high': 'pH outside of healthy range',
+    'temperature_low': 'Temperature outside of healthy range',
+    'temperature_high': 'Temperature outside of healthy range',
+    'low_battery': 'Low battery voltage detected',
+}
+
+AlarmEvent = namedtuple('AlarmEvent', ['name', 'raised', 'value', 'threshold', 'timestamp'])
+
+class AlarmEngine(object):
+    """Evaluates the alarm rules and keeps the state of each alarm. Thread-safe.
+
+    Args:
+        config (src.config.ConfigSnapshot): thresholds, hysteresis and durations
+    """
+
+    def __init__(self, config):
+        self.lock = Lock()
+        # Held from an evaluation's state change until its listeners are
+        # done, so events reach listeners in the order they happened.
+        # Reentrant, so a listener may evaluate a sample itself.
+        self.notify_lock = RLock()
+        self.rules = ()
+        self.active_since = {}     # alarm name -> when it was raised
+        self.pending_since = {}    # alarm name -> when its condition started to hold
+        self.listeners = []
+        self.compile(config)
+
+    def compile(self, config):
+        """Build the rule table from <config>. Alarm state carries over."""
+        rules = []
+        for name, metric, direction, threshold, hysteresis, min_duration in RULES:
+            threshold = float(config[threshold])
+            # In direction-normalised form a reading is bad above <threshold>
+            # and good again at or below <threshold> - <hysteresis>
+            rules.append((name, METRICS.index(metric), direction, threshold,
+                          direction * threshold, float(config[hysteresis]),
+                          float(config[min_duration])))
+        with self.lock:
+            self.rules = tuple(rules)
+
+    def on_config_changed(self, config, changes):
+        """Config subscriber, recompiles the rules"""
+        self.compile(config)
+
+    def evaluate(self, now, values):
+        """Check one sample against every rule
+
+        Args:
+            now (float): time.monotonic() of the sample
+            values (tuple): readings in METRICS order, None for missing ones
+
+        Returns:
+            (list) : AlarmEvents for the alarms raised or cleared by this sample
+        """
+        with self.notify_lock:
+            events = self.update_state(now, values)
+
+            # Whichever thread saw the edge, every listener hears about it once
+            for event in events:
+                for listener in self.listeners:
+                    try:
+                        listener(event)
+                    except Exception as e:
+                        log.error('Alarm listener failed', error=e)
+        return events
+
+    def update_state(self, now, values):
+        """Apply one sample to the alarm state. Returns the AlarmEvents it caused."""
+        events = []
+        with self.lock:
+            for name, index, direction, threshold, limit, hysteresis, min_duration in self.rules:
+                value = values[index]
+                if value is None:
+                    continue
+                excess = direction * value - limit
+                if name in self.active_since:
+                    if excess <= -hysteresis:
+                        del self.active_since[name]
+                        events.append(AlarmEvent(name, False, value, threshold, now))
+                elif excess > 0:
+                    started = self.pending_since.setdefault(name, now)
+                    if now - started >= min_duration:
+                        del self.pending_since[name]
+                        self.active_since[name] = now
+                        events.append(AlarmEvent(name, True, value, threshold, now))
+                else:
+                    self.pending_since.pop(name, None)
+        return events
+
+    def add_listener(self, listener, first=False):
+        """Call listener(event) for every AlarmEvent. Listeners run on the evaluating thread,
+        one evaluation at a time, so they should be quick.
+
+        Args:
+            listener (function): called with each AlarmEvent
+            first (bool): call it before the listeners already added, e.g.
+                          for a safety cutoff that must not wait on a publish
+        """
+        # Replaced rather than changed, so evaluate() can go through it without the lock
+        if first:
+            self.listeners = [listener] + self.listeners
+        else:
+            self.listeners = self.listeners + [listener]
+
+    def active(self):
+        """Names of the alarms currently raised"""
+        with self.lock:
+            return sorted(self.active_since)
@@ -0,0 +1,239 @@
+'''
+File: calibration.py
+
+Purpose: Versioned, crash-safe storage of pH probe calibrations. A
+         calibration is fitted to any number of (probe voltage, buffer pH)
+         points by least squares, and kept as the slope and intercept of
+         pH = slope * volts + intercept, so converting a reading is one
+         multiply-add. With a single point, only the intercept is moved and
+         the slope is kept. Every calibration is saved as a new version, so
+         a bad one can be undone. The file is written to a temporary file,
+         synced and renamed over the old one, so a power cut leaves either
+         the old or the new calibration on disk, never half of one.
+
+         Calibrations in the old text format (pH_offset, pH_slope and
+         pH_intercept lines) are read as version 0.
+
+Date: October 18, 2026
+
+Usage:
+    import src.calibration as calibration
+    store = calibration.CalibrationStore('src/pH_calibration_0x48.json',
+                                         fallbacks=('src/pH_calibration_values.txt',))
+    slope, intercept = store.current.slope, store.current.intercept
+    store.add_point(1, 1.51, 7.0)    # first point of a new calibration
+    store.add_point(2, 2.02, 4.0)    # each point refits and saves a new version
+    store.restore(3)                 # make version 3 current again, as a new version
+    store.history()
+'''
+
+import json
+import math
+import os
+import tempfile
+import time
+from collections import namedtuple
+from threading import Lock
+
+import src.log as log
+
+# slope and intercept give pH = slope * volts + intercept. points are the
+# (volts, pH) pairs fitted, rms_error the fit's root mean square error in pH.
+Calibration = namedtuple('Calibration', ['version', 'timestamp', 'slope', 'intercept',
+                                         'points', 'rms_error'])
+
+# Versions kept in the file, the current one included
+MAX_HISTORY = 20
+
+def fit(points, slope=None):
+    """Least squares line through <points>
+
+    Args:
+        points (list): (volts, pH) pairs
+        slope (float): slope to keep if there is only one point
+
+    Returns:
+        (tuple) : (slope, intercept, rms error in pH)
+
+    Raises:
+        ValueError: if the points do not pin down a line
+    """
+    n = len(points)
+    if n == 0:
+        raise ValueError('No calibration points')
+    mean_volts = math.fsum(volts for volts, pH in points) / n
+    mean_pH = math.fsum(pH for volts, pH in points) / n
+    if n == 1:
+        if slope is None:
+            raise ValueError('A single calibration point needs a slope to keep')
+    else:
+        # Centred sums, which lose less precision than the raw ones
+        spread = math.fsum((volts - mean_volts) ** 2 for volts, pH in points)
+        if spread < 1e-12:
+            raise ValueError('Calibration points need at least two different voltages. '
+                             'Leave the probe in the second solution for at least 5 minutes.')
+        slope = math.fsum((volts - mean_volts) * (pH - mean_pH) for volts, pH in points) / spread
+    intercept = mean_pH - slope * mean_volts
+    rms_error = math.sqrt(math.fsum((slope * volts + intercept - pH) ** 2
+                                    for volts, pH in points) / n)
+    return slope, intercept, rms_error
+
+def parse_legacy(text):
+    """Read a calibration in the old text format, as version 0
+
+    Raises:
+        ValueError: if a setting is missing or not a number
+    """
+    values = {}
+    for line in text.splitlines():
+        # Ignore text after comments
+        fields = line.partition('#')[0].split()
+        if len(fields) >= 2 and fields[0] in ('pH_offset', 'pH_slope', 'pH_intercept'):
+            values[fields[0]] = float(fields[1])
+    try:
+        # pH = intercept + (volts - offset) * slope
+        slope = values['pH_slope']
+        intercept = values['pH_intercept'] - values['pH_offset'] * slope
+    except KeyError as e:
+        raise ValueError('{} is missing'.format(e))
+    return Calibration(0, None, slope, intercept, (), None)
+
+def _from_dict(entry):
+    return Calibration(int(entry['version']), entry.get('timestamp'), float(entry['slope']),
+                       float(entry['intercept']),
+                       tuple((float(volts), float(pH)) for volts, pH in entry.get('points', ())),
+                       entry.get('rms_error'))
+
+def _to_dict(calibration):
+    entry = calibration._asdict()
+    entry['points'] = [list(point) for point in calibration.points]
+    return entry
+
+def read(path):
+    """The calibration versions in <path>, oldest first, in either format"""
+    with open(path) as calibration_file:
+        text = calibration_file.read()
+    if not path.endswith('.json'):
+        return [parse_legacy(text)]
+    try:
+        versions = [_from_dict(entry) for entry in json.loads(text)['versions']]
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError('Invalid calibration file {}: {}'.format(path, e))
+    if not versions:
+        raise ValueError('Invalid calibration file {}: no versions'.format(path))
+    return versions
+
+def write_atomic(path, text):
+    """Replace the file at <path> with <text>, so that it is either all old or all new"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path),
+                                     suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as temp_file:
+            temp_file.write(text)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    # Make the rename itself survive a power cut
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+class CalibrationStore(object):
+    """
+    The calibration versions of one pH probe, saved to a JSON file. Thread-safe.
+
+    Args:
+        path (str): JSON file of this probe's calibrations
+        fallbacks (tuple): files to start from if <path> does not exist yet,
+                           in order, e.g. an old text calibration file or
+                           another probe's store
+    """
+
+    def __init__(self, path, fallbacks=()):
+        self.path = path
+        self.lock = Lock()
+
+        for source in (path,) + tuple(fallbacks):
+            if os.path.exists(source):
+                versions = read(source)
+                break
+        else:
+            raise FileNotFoundError('No pH calibration file, looked for {}'.format(
+                ', '.join((path,) + tuple(fallbacks))))
+        if source != path:
+            # Saved with the first calibration of this probe, until then the file is left alone
+            versions = versions[-1:]
+        self.versions = versions
+
+    @property
+    def current(self):
+        """The calibration in use. Replaced, never changed, so no lock is needed to read it."""
+        return self.versions[-1]
+
+    def history(self):
+        """Every calibration version kept, oldest first"""
+        with self.lock:
+            return list(self.versions)
+
+    def add_point(self, number, volts, pH):
+        """Add a calibration point, refit and save
+
+        Args:
+            number (int): 1 starts a new calibration, 2 and up add to the current one
+            volts (float): probe voltage in the buffer solution
+            pH (float): pH of the buffer solution
+
+        Returns:
+            (Calibration) : the new calibration
+
+        Raises:
+            ValueError: if <number> is not a positive whole number or the points cannot be fitted
+        """
+        if isinstance(number, bool) or not isinstance(number, int) or number < 1:
+            raise ValueError('Invalid pH calibration number: {!r}'.format(number))
+        with self.lock:
+            current = self.versions[-1]
+            points = () if number == 1 else current.points
+            if len(points) != number - 1:
+                raise ValueError('pH calibration point {} given after {} points'.format(
+                    number, len(points)))
+            points += ((float(volts), float(pH)),)
+            slope, intercept, rms_error = fit(points, slope=current.slope)
+            calibration = self.save(slope, intercept, points, rms_error)
+        if slope >= 0:
+            log.warn('pH calibration slope is not negative, check the buffer solutions',
+                     slope=slope)
+        return calibration
+
+    def restore(self, version):
+        """Make an earlier <version> current again, saved as a new version
+
+        Raises:
+            ValueError: if <version> is not kept
+        """
+        with self.lock:
+            for calibration in self.versions:
+                if calibration.version == version:
+                    return self.save(calibration.slope, calibration.intercept,
+                                     calibration.points, calibration.rms_error)
+        raise ValueError('pH calibration version {} is not kept'.format(version))
+
+    def save(self, slope, intercept, points, rms_error):
+        """Save a new version. Call with self.lock held."""
+        calibration = Calibration(self.versions[-1].version + 1, time.time(), slope, intercept,
+                                  tuple(points), rms_error)
+        versions = (self.versions + [calibration])[-MAX_HISTORY:]
+        write_atomic(self.path, json.dumps({'versions': [_to_dict(entry) for entry in versions]},
+                                           indent=1) + '\n')
+        # Only once it is safely on disk
+        self.versions = versions
+        return calibration
@@ -0,0 +1,247 @@
+'''
+File: config.py
+
+Purpose: Versioned, read-only snapshots of the device configuration.
+         Settings arriving from Cloud IoT are merged into the current
+         configuration, converted to their types and validated once, and
+         published as a new immutable snapshot with a higher version.
+         Readers take the current snapshot with a single reference read and
+         no lock, and can never see a half-applied update. Subscribers,
+         such as the sampling scheduler and the controllers, are told which
+         settings changed.
+
+Date: October 18, 2026
+
+Usage:
+    import src.config as config
+    store = config.ConfigStore(config.DEFAULT_CONFIG)
+    store.subscribe(lambda snapshot, diff: print(diff))
+    store.update({'target_ph': '6.5'})   # raises ValueError if invalid
+    current = store.current              # no lock needed
+    current.target_ph                    # 6.5, already a float
+    current['target_ph']                 # dictionary-style access also works
+'''
+
+import math
+from collections import namedtuple
+from threading import RLock
+
+import src.filters as filters
+import src.log as log
+import src.scheduler as scheduler
+
+def _number(value):
+    # bool is an int, but True is not a sensible threshold
+    if isinstance(value, bool):
+        raise ValueError('expected a number, got {!r}'.format(value))
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError('expected a finite number, got {!r}'.format(value))
+    return number
+
+def _whole_number(value):
+    number = _number(value)
+    if number != int(number):
+        raise ValueError('expected a whole number, got {!r}'.format(value))
+    return int(number)
+
+def _filter_spec(value):
+    if not isinstance(value, str):
+        raise ValueError('expected a filter spec, got {!r}'.format(value))
+    # Raises ValueError if the spec is invalid
+    return filters.parse(value).spec
+
+def _burst_samples(value):
+    number = _whole_number(value)
+    if not 1 <= number <= filters.MAX_BURST_SAMPLES:
+        raise ValueError('must be 1 to {}, got {!r}'.format(filters.MAX_BURST_SAMPLES, value))
+    return number
+
+def _positive(convert):
+    def check(value):
+        value = convert(value)
+        if value <= 0:
+            raise ValueError('must be positive, got {!r}'.format(value))
+        return value
+    return check
+
+def _non_negative(convert):
+    def check(value):
+        value = convert(value)
+        if value < 0:
+            raise ValueError('must not be negative, got {!r}'.format(value))
+        return value
+    return check
+
+# Every setting with its converter and default value
+FIELDS = {
+    'max_ph': (_number, 10.0),
+    'min_ph': (_number, 5.0),
+    'max_temperature': (_number, 25.0),
+    'min_temperature': (_number, 15.0),
+    'target_ph': (_number, 7.0),
+    'update_interval_minutes': (_positive(_whole_number), 30),
+    'low_battery_volts': (_non_negative(_number), 1.0),
+    'leak_threshold_volts': (_non_negative(_number), 0.25),
+    # Alarms, see src/alarms.py. A raised alarm clears once the reading is
+    # back past its threshold by the hysteresis, and only fires once its
+    # condition has held for the minimum duration.
+    'ph_hysteresis': (_non_negative(_number), 0.1),
+    'temperature_hysteresis': (_non_negative(_number), 0.5),
+    'leak_hysteresis_volts': (_non_negative(_number), 0.05),
+    'battery_hysteresis_volts': (_non_negative(_number), 0.05),
+    'alarm_min_duration_secs': (_non_negative(_number), 120.0),
+    'leak_min_duration_secs': (_non_negative(_number), 0.0),
+    # pH dosing, see src/dosing.py. The dose gain and dead time describe the
+    # tank: how far a second of pumping raises the pH, and how long a dose
+    # takes to reach the probe. Kp, Ki and Kd are in seconds of pumping.
+    'ph_dose_gain': (_positive(_number), 0.02),
+    'ph_dead_time_secs': (_non_negative(_number), 120.0),
+    'ph_feed_forward': (_non_negative(_number), 0.5),
+    'ph_kp': (_non_negative(_number), 10.0),
+    'ph_ki': (_non_negative(_number), 0.002),
+    'ph_kd': (_non_negative(_number), 0.0),
+    'ph_deadband': (_non_negative(_number), 0.05),
+    'ph_min_pulse_secs': (_non_negative(_number), 0.2),
+    'ph_max_pulse_secs': (_positive(_number), 10.0),
+    'ph_min_dose_interval_secs': (_non_negative(_number), 300.0),
+}
+
+# Sampling interval and jitter of each sensor, see src/scheduler.py
+for _sensor in scheduler.SENSORS:
+    _interval_key, _jitter_key = scheduler.config_keys(_sensor)
+    _interval, _jitter = scheduler.DEFAULT_SCHEDULE[_sensor]
+    FIELDS[_interval_key] = (_positive(_number), float(_interval))
+    FIELDS[_jitter_key] = (_non_negative(_number), float(_jitter))
+
+# Filter pipeline and burst size of each ADC channel, see src/filters.py
+for _channel, (_spec, _burst) in filters.DEFAULT_FILTERS.items():
+    _filter_key, _burst_key = filters.config_keys(_channel)
+    FIELDS[_filter_key] = (_filter_spec, _spec)
+    FIELDS[_burst_key] = (_burst_samples, _burst)
+
+DEFAULT_CONFIG = {name: default for name, (convert, default) in FIELDS.items()}
+
+def _validate(values):
+    """Checks that involve more than one setting. Returns a list of problems."""
+    problems = []
+    if values['min_ph'] > values['max_ph']:
+        problems.append('min_ph is above max_ph')
+    if values['min_temperature'] > values['max_temperature']:
+        problems.append('min_temperature is above max_temperature')
+    if not values['min_ph'] <= values['target_ph'] <= values['max_ph']:
+        problems.append('target_ph is outside min_ph to max_ph')
+    if values['ph_min_pulse_secs'] > values['ph_max_pulse_secs']:
+        problems.append('ph_min_pulse_secs is above ph_max_pulse_secs')
+    return problems
+
+class ConfigSnapshot(namedtuple('ConfigSnapshot', ['version'] + list(FIELDS))):
+    """One version of the device configuration. Immutable.
+
+    Settings are attributes, e.g. snapshot.target_ph. For code that treats
+    the configuration as a dictionary, snapshot['target_ph'] and
+    snapshot.get('target_ph') work too.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in FIELDS:
+                raise KeyError(key)
+            return getattr(self, key)
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        return key in FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in FIELDS else default
+
+    def as_dict(self):
+        """The settings, without the version"""
+        values = self._asdict()
+        del values['version']
+        return dict(values)
+
+def diff(old, new):
+    """Settings that differ between two snapshots, as {name: (old value, new value)}"""
+    return {name: (getattr(old, name), getattr(new, name))
+            for name in FIELDS if getattr(old, name) != getattr(new, name)}
+
+class ConfigStore(object):
+    """Holds the current configuration snapshot and applies updates to it.
+
+    Args:
+        initial (dict): settings to start from, on top of DEFAULT_CONFIG
+    """
+
+    def __init__(self, initial=None):
+        # Serialises updates and their notifications, readers never take it
+        self.update_lock = RLock()
+        self.subscribers = []
+        self.current = ConfigSnapshot(version=0, **self.convert(DEFAULT_CONFIG, initial or {}))
+
+    @staticmethod
+    def convert(base, changes):
+        """Merge <changes> into <base> and convert every setting to its type
+
+        Settings that are not in FIELDS are ignored.
+
+        Raises:
+            ValueError: listing every invalid setting
+        """
+        values = dict(base)
+        problems = []
+        for name, value in changes.items():
+            if name not in FIELDS:
+                continue
+            convert, default = FIELDS[name]
+            try:
+                values[name] = convert(value)
+            except (TypeError, ValueError) as e:
+                problems.append('{}: {}'.format(name, e))
+        if not problems:
+            problems = _validate(values)
+        if problems:
+            raise ValueError('Invalid configuration: ' + '; '.join(problems))
+        return values
+
+    def update(self, changes):
+        """Apply <changes> on top of the current configuration
+
+        Either every setting is applied or, if any is invalid, none are.
+        Subscribers are called with the new snapshot and the diff, unless
+        nothing changed.
+
+        Returns:
+            (ConfigSnapshot) : the current snapshot after the update
+
+        Raises:
+            ValueError: if a setting is invalid
+        """
+        with self.update_lock:
+            old = self.current
+            new = ConfigSnapshot(version=old.version + 1, **self.convert(old.as_dict(), changes))
+            changed = diff(old, new)
+            if not changed:
+                return old
+            # Publishing the new snapshot is a single reference assignment
+            self.current = new
+
+            # Notify in order of version. Subscribers should be quick.
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber(new, changed)
+                except Exception as e:
+                    log.error('Config subscriber failed', error=e)
+        return new
+
+    def subscribe(self, subscriber):
+        """Call subscriber(snapshot, diff) after every change"""
+        with self.update_lock:
+            self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        with self.update_lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
@@ -0,0 +1,262 @@
+'''
+File: connection.py
+
+Purpose: Owns the MQTT connection. A ConnectionManager thread runs the
+         paho network loop, reconnects with jittered exponential backoff
+         when the link drops, and resubscribes to the config and command
+         topics every time it connects. Other threads wait for the link
+         on a condition variable instead of polling, and the manager keeps
+         uptime and reconnect counts.
+
+Date: October 18, 2026
+
+Usage:
+    import src.connection as connection
+    conn = connection.ConnectionManager(client, 'mqtt.googleapis.com', 8883,
+                                        on_connect=device.on_connect,
+                                        on_disconnect=device.on_disconnect)
+    conn.subscribe('/devices/my-device/config', qos=1)
+    conn.start()
+    conn.wait_connected(timeout=30)
+    conn.reconnect()    # e.g. to pick up a new JWT
+    conn.stats()
+'''
+
+import random
+import time
+from threading import Condition, Lock, Thread
+
+import src.log as log
+
+# paho's MQTT_ERR_SUCCESS, kept here so this module does not need paho itself
+MQTT_ERR_SUCCESS = 0
+
+# Connection states
+DISCONNECTED = 'disconnected'
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+STOPPED = 'stopped'
+
+class ConnectionManager(Thread):
+    """
+    Runs an MQTT client's network loop and keeps it connected.
+
+    The client's on_connect and on_disconnect callbacks are replaced by the
+    manager's, which pass the events on to <on_connect> and <on_disconnect>.
+    Use this instead of client.connect() and client.loop_start().
+
+    Args:
+        client (mqtt.Client): client to keep connected
+        host (str): MQTT bridge hostname
+        port (int): MQTT bridge port
+        keepalive (int): MQTT keepalive in seconds
+        on_connect (function): paho on_connect callback to forward to
+        on_disconnect (function): paho on_disconnect callback to forward to
+        min_backoff_secs (float): shortest wait before reconnecting
+        max_backoff_secs (float): longest wait before reconnecting
+        connect_timeout_secs (float): give up on a connection attempt with no CONNACK after this long
+        rng (random.Random): source of backoff jitter
+    """
+
+    def __init__(self, client, host, port, keepalive=60, on_connect=None, on_disconnect=None,
+                 min_backoff_secs=1, max_backoff_secs=120, connect_timeout_secs=30, rng=None):
+        super().__init__(daemon=True)
+        self.client = client
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.forward_connect = on_connect
+        self.forward_disconnect = on_disconnect
+        self.min_backoff_secs = min_backoff_secs
+        self.max_backoff_secs = max_backoff_secs
+        self.connect_timeout_secs = connect_timeout_secs
+        self.rng = rng if rng is not None else random.Random()
+
+        client.on_connect = self.on_connect
+        client.on_disconnect = self.on_disconnect
+
+        # Connection state, guarded by self.changed. Not held while calling
+        # into paho, which calls back into the manager with its own locks held
+        self.changed = Condition(Lock())
+        self.state = DISCONNECTED
+        self.subscriptions = {}    # topic -> qos
+        self.failures = 0          # failed attempts since the last connection
+        self.reconnect_requested = False
+
+        # Statistics
+        self.connects = 0
+        self.attempts = 0
+        self.connected_since = None
+        self.connected_secs = 0.0
+        self.started = time.monotonic()
+        self.last_error = None
+
+        # Check whether to kill thread
+        self.killThread = False
+
+    def subscribe(self, topic, qos=0):
+        """Subscribe to <topic> now if connected, and again after every reconnect"""
+        with self.changed:
+            self.subscriptions[topic] = qos
+            connected = self.state == CONNECTED
+        if connected:
+            self.client.subscribe(topic, qos=qos)
+
+    def on_connect(self, client, userdata, flags, rc):
+        """paho on_connect callback"""
+        with self.changed:
+            if rc == MQTT_ERR_SUCCESS:
+                self.state = CONNECTED
+                self.connects += 1
+                self.failures = 0
+                self.connected_since = time.monotonic()
+                subscriptions = list(self.subscriptions.items())
+            else:
+                # paho closes the socket after a refused CONNACK
+                self.last_error = 'CONNACK {}'.format(rc)
+                subscriptions = []
+            self.changed.notify_all()
+
+        # A clean session has no subscriptions, so make them again
+        for topic, qos in subscriptions:
+            client.subscribe(topic, qos=qos)
+
+        if self.forward_connect is not None:
+            self.forward_connect(client, userdata, flags, rc)
+
+    def on_disconnect(self, client, userdata, rc):
+        """paho on_disconnect callback"""
+        with self.changed:
+            self.mark_disconnected()
+            if rc != MQTT_ERR_SUCCESS:
+                self.last_error = 'disconnect {}'.format(rc)
+
+        if self.forward_disconnect is not None:
+            self.forward_disconnect(client, userdata, rc)
+
+    def mark_disconnected(self):
+        """Call with self.changed held"""
+        if self.connected_since is not None:
+            self.connected_secs += time.monotonic() - self.connected_since
+            self.connected_since = None
+        if self.state != STOPPED:
+            self.state = DISCONNECTED
+        self.changed.notify_all()
+
+    def is_connected(self):
+        return self.state == CONNECTED
+
+    def wait_connected(self, timeout=None):
+        """Block until connected. Returns False if <timeout> seconds pass first."""
+        with self.changed:
+            return self.changed.wait_for(
+                lambda: self.state in (CONNECTED, STOPPED), timeout) and self.state == CONNECTED
+
+    def reconnect(self, timeout=None):
+        """Drop the connection and connect again straight away, e.g. to use new credentials
+
+        Returns:
+            (bool) : whether the new connection was made within <timeout> seconds
+        """
+        with self.changed:
+            target = self.connects + 1
+            self.reconnect_requested = True
+            self.changed.notify_all()
+        self.client.disconnect()
+        with self.changed:
+            return self.changed.wait_for(
+                lambda: self.connects >= target or self.state == STOPPED, timeout) \
+                and self.state == CONNECTED
+
+    def backoff_secs(self):
+        """Jittered exponential backoff: a random wait up to twice as long per failure"""
+        ceiling = min(self.max_backoff_secs, self.min_backoff_secs * 2 ** self.failures)
+        return self.rng.uniform(self.min_backoff_secs, max(self.min_backoff_secs, ceiling))
+
+    def run(self):
+        while not self.killThread:
+            with self.changed:
+                if self.reconnect_requested:
+                    self.reconnect_requested = False
+                elif self.attempts > 0:
+                    delay = self.backoff_secs()
+                    log.info('MQTT reconnecting', delay_secs=round(delay, 1))
+                    # Woken early by kill() or reconnect()
+                    self.changed.wait_for(lambda: self.killThread or self.reconnect_requested, delay)
+                    self.reconnect_requested = False
+                if self.killThread:
+                    break
+                self.state = CONNECTING
+                self.attempts += 1
+                connects = self.connects
+                self.changed.notify_all()
+
+            try:
+                if self.attempts == 1:
+                    rc = self.client.connect(self.host, self.port, self.keepalive)
+                else:
+                    rc = self.client.reconnect()
+            except (OSError, ValueError) as e:
+                rc = e
+
+            if rc == MQTT_ERR_SUCCESS:
+                self.run_network_loop()
+            else:
+                log.error('MQTT connection failed', result=rc)
+
+            with self.changed:
+                if self.connects == connects:
+                    self.failures += 1
+                if rc != MQTT_ERR_SUCCESS:
+                    self.last_error = str(rc)
+                self.mark_disconnected()
+
+        with self.changed:
+            self.state = STOPPED
+            self.changed.notify_all()
+
+    def run_network_loop(self):
+        """Service the socket until the connection drops. Blocks in select(), not a poll."""
+        deadline = time.monotonic() + self.connect_timeout_secs
+        while not self.killThread:
+            rc = self.client.loop(timeout=1.0)
+            if rc != MQTT_ERR_SUCCESS:
+                return
+            if self.state == CONNECTING and time.monotonic() > deadline:
+                log.error('MQTT bridge did not answer the connection request')
+                self.client.disconnect()
+                return
+
+    def uptime_secs(self):
+        """Seconds the current connection has been up, 0 if not connected"""
+        with self.changed:
+            if self.connected_since is None:
+                return 0.0
+            return time.monotonic() - self.connected_since
+
+    def stats(self):
+        """Connection statistics, as a dictionary"""
+        with self.changed:
+            now = time.monotonic()
+            uptime = now - self.connected_since if self.connected_since is not None else 0.0
+            return {
+                'state': self.state,
+                'uptime_secs': uptime,
+                'connected_fraction': (self.connected_secs + uptime) / max(now - self.started, 1e-9),
+                'connects': self.connects,
+                'reconnects': max(0, self.connects - 1),
+                'attempts': self.attempts,
+                'last_error': self.last_error,
+            }
+
+    def kill(self):
+        with self.changed:
+            self.killThread = True
+            self.changed.notify_all()
+        self.client.disconnect()
+
+    def stop(self, timeout=None):
+        """Disconnect and wait for the network loop to finish"""
+        self.kill()
+        if self.is_alive():
+            self.join(timeout)
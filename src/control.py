@@ -20,16 +20,25 @@ import src.relay as relay
 import src.water_level as water_level
 import src.adc as adc
 import src.device as dev
+import src.log as log
 
 class pHController(Thread):
     """
     PH controlling class that executes in its own thread.
     The purpose of this class is to maintain the pH of the
     system within a healthy range
+
+    Args:
+        actuators (src.actuator.ActuatorService): times pump pulses without
+                  blocking this thread. None to switch the pump directly.
+        dosing (src.dosing.PHDosingController): works out how long to pump for.
+               None to pump for a fixed time whenever the pH is at or below target.
     """
 
-    def __init__(self):
+    def __init__(self, actuators=None, dosing=None):
         super().__init__()
+        self.actuators = actuators
+        self.dosing = dosing
         
         # Get ADC sensors object to read pH
         self.adc_sensors = adc.adc_sensors()
@@ -53,13 +62,16 @@ class pHController(Thread):
 
         # The pH to maintain the system at
         self.device = dev.Device()
-        self.desired_pH = self.device.get_config()['target_ph']
+        self.desired_pH = self.device.get_config().target_ph
+
+        # Follow target pH changes from the device configuration
+        self.device.config_store.subscribe(self.on_config_changed)
 
         # Check whether to kill thread
         self.killThread = False
     
     def run(self):
-        print("Starting pH control loop...")
+        log.info('Starting pH control loop')
 
         # Control loop where pH is checked and if it is too low, pH-increasing solution (KOH, or CaOH) is added
         while not self.killThread:
@@ -67,43 +79,58 @@ class pHController(Thread):
                 # Get current pH value
                 pH = self.adc_sensors.read_pH()
 
-                # Update desired pH based on device configuration
-                self.desired_pH = self.device.get_config()['target_ph']
-
                 # desired_pH should be set as the minimum value you want your pH to be at.
-                if (pH<=self.desired_pH):	                
-                    print('Peristalitic Pump started')
+                if self.dosing is not None:
+                    pump_on_time_secs = self.dosing.update(pH, time.monotonic())
+                else:
+                    pump_on_time_secs = self.pH_pump_on_time_secs if pH<=self.desired_pH else 0
+
+                if (pump_on_time_secs > 0):	                
+                    log.info('Peristaltic pump started', secs=pump_on_time_secs)
                     # Turn on peristaltic pump
-                    relay.on(pins.peristaltic_pump)
-                    time.sleep(self.pH_pump_on_time_secs)
-                    relay.off(pins.peristaltic_pump)
+                    if self.actuators is not None:
+                        self.actuators.pulse(pins.peristaltic_pump, pump_on_time_secs)
+                    else:
+                        relay.on(pins.peristaltic_pump)
+                        time.sleep(pump_on_time_secs)
+                        relay.off(pins.peristaltic_pump)
                 
                 time.sleep(self.pH_check_interval_secs)
             except:
-                print("[ERROR] Exeception on pH control thread, killing thread.")
+                log.error('Exception on pH control thread, killing thread')
                 break
         
         # Ensure the pump is OFF before exiting
         try:
             relay.off(pins.peristaltic_pump)
         except:
-            print("[ERROR] Failed to turn off pH pump when closing")
+            log.error('Failed to turn off pH pump when closing')
 
-        print("Killed pH control loop")
+        log.info('Killed pH control loop')
         return
 
+    def on_config_changed(self, config, changes):
+        if 'target_ph' in changes:
+            self.desired_pH = config.target_ph
+
     def kill(self):
         self.killThread = True
+        self.device.config_store.unsubscribe(self.on_config_changed)
 
 class waterLevelController(Thread):
     """
     Water level controlling class that executes in its own thread.
     The purpose of this class is to maintain the water level of the
     system within a healthy range
+
+    Args:
+        actuators (src.actuator.ActuatorService): times solenoid pulses without
+                  blocking this thread. None to switch the solenoid directly.
     """
 
-    def __init__(self):
+    def __init__(self, actuators=None):
         super().__init__()
+        self.actuators = actuators
         
         # Check if water level is healthy this often
         self.water_level_check_interval_secs = 30
@@ -132,7 +159,7 @@ class waterLevelController(Thread):
         self.killThread = True
 
     def run(self):
-        print("Starting water level control loop")
+        log.info('Starting water level control loop')
 
         # Loop that turns on the water level solenoid if water level is too low
         while not self.killThread:
@@ -141,24 +168,27 @@ class waterLevelController(Thread):
 
                 # If the water level is low, turn on solenoid             
                 # TODO: is this always a binary variable for water level??? Should it be threshold?
-                # TODO: if leak happens, we keep pumping water!!?
+                # During a leak the solenoid is locked out, see src/leak.py
                 if(self.water_level_sensor.read() == 0):
-                    print("Started water level solenoid")
-                    relay.on_pu(pins.Water_level_solenoid)
-                    time.sleep(self.water_level_on_time_secs)
-                    relay.off_pu(pins.Water_level_solenoid)
+                    log.info('Started water level solenoid')
+                    if self.actuators is not None:
+                        self.actuators.pulse(pins.Water_level_solenoid, self.water_level_on_time_secs)
+                    else:
+                        relay.on_pu(pins.Water_level_solenoid)
+                        time.sleep(self.water_level_on_time_secs)
+                        relay.off_pu(pins.Water_level_solenoid)
                 
                 # Wait to check again
                 time.sleep(self.water_level_check_interval_secs)
             except: 
-                print("[ERROR] Exception on water level control thread, killing it")
+                log.error('Exception on water level control thread, killing it')
                 break
             
         # Turn off water level solenoid before exiting
         try:
             relay.off_pu(pins.Water_level_solenoid)
         except:
-            print("[ERROR] Failed to turn off water level solenoid")
+            log.error('Failed to turn off water level solenoid')
 
-        print("Killed water level control loop")
+        log.info('Killed water level control loop')
         return
@@ -0,0 +1,125 @@
+'''
+File: credentials.py
+
+Purpose: Keeps the MQTT bridge credentials fresh. Google Cloud IoT only
+         checks the JWT password when a client connects, and drops the
+         connection once the token expires. JWTManager parses the private
+         key once, mints a new token in the background shortly before the
+         current one expires, installs it on the client, and then does a
+         controlled reconnect. Signing happens before the old connection
+         is closed, so the link is only down for one TCP/TLS handshake.
+
+Date: October 18, 2026
+
+Usage:
+    import src.credentials as credentials
+    jwt_manager = credentials.JWTManager(client, project_id, 'rsa_private.pem', 'RS256',
+                                         reconnect=mqtt_connection.reconnect)
+    jwt_manager.install()    # set the first token before connecting
+    jwt_manager.start()      # refresh in the background from now on
+'''
+
+import time
+from threading import Event, Thread
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+
+import src.log as log
+
+class JWTManager(Thread):
+    """
+    Background thread that refreshes the client's JWT before it expires.
+
+    Args:
+        client (mqtt.Client): client whose username/password is kept fresh
+        project_id (str): GCP project, the token's audience
+        private_key_file (str): path to the device's private key
+        algorithm (str): 'RS256' or 'ES256'
+        reconnect (function): called after a new token is installed while
+                              connected, to reconnect with it. None to only
+                              install tokens and let the next connect use them.
+        is_connected (function): returns whether the client is connected
+        lifetime_mins (float): how long each token is valid for
+        refresh_margin_mins (float): how long before expiry to refresh
+        retry_secs (float): wait before retrying a failed refresh
+    """
+
+    def __init__(self, client, project_id, private_key_file, algorithm,
+                 reconnect=None, is_connected=None, lifetime_mins=60,
+                 refresh_margin_mins=5, retry_secs=30):
+        super().__init__(daemon=True)
+        self.client = client
+        self.project_id = project_id
+        self.algorithm = algorithm
+        self.reconnect = reconnect
+        self.is_connected = is_connected if is_connected is not None else (lambda: True)
+        self.lifetime_secs = lifetime_mins * 60
+        self.refresh_margin_secs = refresh_margin_mins * 60
+        self.retry_secs = retry_secs
+
+        # Parse the key once, instead of re-reading the PEM file for every token
+        with open(private_key_file, 'rb') as f:
+            self.private_key = serialization.load_pem_private_key(f.read(), password=None)
+        log.info('Loaded private key', algorithm=algorithm, path=private_key_file)
+
+        self.expires_at = None
+        self.rotations = 0
+        self.failures = 0
+        self.last_reconnect_secs = None
+
+        self.killed = Event()
+
+    def create_jwt(self):
+        """Create a JWT (https://jwt.io) to establish an MQTT connection.
+
+        Returns:
+            (str, float) : the token and when it expires, in seconds since the epoch
+        """
+        issued_at = int(time.time())
+        expires_at = issued_at + int(self.lifetime_secs)
+        token = {
+            'iat': issued_at,
+            'exp': expires_at,
+            'aud': self.project_id
+        }
+        return jwt.encode(token, self.private_key, algorithm=self.algorithm), expires_at
+
+    def install(self):
+        """Mint a token and set it as the client's password"""
+        token, expires_at = self.create_jwt()
+        self.client.username_pw_set(username='unused', password=token)
+        self.expires_at = expires_at
+        return token
+
+    def seconds_until_refresh(self):
+        if self.expires_at is None:
+            return 0
+        return max(0, self.expires_at - self.refresh_margin_secs - time.time())
+
+    def rotate(self):
+        """Install a new token and, if connected, reconnect with it"""
+        self.install()
+        self.rotations += 1
+        if self.reconnect is not None and self.is_connected():
+            started = time.monotonic()
+            self.reconnect()
+            self.last_reconnect_secs = time.monotonic() - started
+            log.info('Rotated JWT, reconnected', reconnect_secs=round(self.last_reconnect_secs, 3))
+        else:
+            # Not connected: the next (re)connect picks the new token up
+            log.info('Rotated JWT')
+
+    def run(self):
+        while not self.killed.wait(self.seconds_until_refresh()):
+            try:
+                self.rotate()
+            except Exception as e:
+                self.failures += 1
+                log.error('Failed to refresh JWT', error=e)
+                # Try again soon, but not in a tight loop
+                if self.killed.wait(self.retry_secs):
+                    break
+
+    def kill(self):
+        self.killed.set()
@@ -36,15 +36,38 @@ import os
 import ssl
 import time
 
-from gpiozero import LED
 from threading import Lock
 import RPi.GPIO as GPIO
 import src.relay as relay
-import src.adc as adc
 import src.temp as temp
 import src.pins as pins
-import src.water_level as WL
-import src.control as control
+import src.history as history
+import src.scheduler as scheduler
+import src.config as configuration
+import src.alarms as alarms
+import src.topology as topology
+import src.metrics as metrics
+import src.log as log
+
+# Sensor readings kept in the on-device history, in the order they are recorded
+SENSOR_METRICS = ('temperature', 'pH', 'leak', 'water_level', 'battery_voltage', 'internal_leak')
+
+# Sensor in src.scheduler.SENSORS that each metric comes from
+SENSOR_METRIC_SOURCES = ('temperature', 'pH', 'leak', 'water_level', 'battery', 'leak')
+
+# ADC channels read for each sensor in src.scheduler.SENSORS
+SENSOR_ADC_CHANNELS = {
+    'pH': ('pH',),
+    'leak': ('leak', 'internal_leak'),
+    'battery': ('battery',),
+}
+
+# Time to read the due sensors of every tank
+UPDATE_SECONDS = metrics.histogram('piponic_update_sensor_data_seconds',
+                                   'Time taken by update_sensor_data()')
+
+# PUBACKs received from the MQTT bridge
+PUBLISH_ACKS = metrics.counter('piponic_publish_acks', 'PUBACKs received')
 
 def error_str(rc):
     """Convert a Paho error to a human readable string."""
@@ -57,89 +80,157 @@ class Device(object):
             # Initialise sensor readings
             self.temperature = 0
             self.temp = temp
+            # Start temperature conversions in the background so the first read is ready
+            temp.start()
             self.pH = 7
             self.leak = 0
-            self.adc_sensors = adc.adc_sensors()
-            self.water_level_sensor = WL.water_level()
             self.water_level = 0
             self.battery_voltage = 0
             self.internal_leak = 0
+
+            # Tanks monitored, the primary tank first. Its readings are the
+            # fields above, the other tanks' are in tank_readings.
+            self.configure_tanks((topology.DEFAULT_TANK,))
+
+            # Local history of sensor readings, for trends and offline periods
+            self.history = history.TimeSeriesStore(SENSOR_METRICS)
             
-            # Since the configuration is updated from multiple threads
-            # create a mutex to handle synchronisation
-            self.config_lock = Lock() 
-
-            # Initialise device configuration to default
-            DEFAULT_DEVICE_CONFIG = {
-              'max_ph': 10,
-              'min_ph': 5,
-              'max_temperature': 25,
-              'min_temperature': 15,
-              'target_ph': 7,
-              'update_interval_minutes': 30,
-              'low_battery_volts' : 1,
-              'leak_threshold_volts' : 0.25,
-            };        
-            self.update_config(DEFAULT_DEVICE_CONFIG)
+            # Device configuration, defaults in src/config.py. Each update
+            # makes a new immutable snapshot, so readers need no lock
+            self.config_store = configuration.ConfigStore()
+            log.info('Configuration', config=self.config_store.current.as_dict())
+            self.configure_filters(self.get_config())
+
+            # When each sensor is next due to be read
+            self.sampling = scheduler.SamplingScheduler(self.get_config())
+
+            # Apply new sampling intervals straight away
+            self.config_store.subscribe(self.on_config_changed)
+
+            # Alarm rules compiled from the thresholds in the configuration
+            self.alarms = alarms.AlarmEngine(self.get_config())
+            self.config_store.subscribe(self.alarms.on_config_changed)
             
             # Is device connected
             self.connected = False
+
+            # MQTT connection manager, see attach_connection()
+            self.connection = None
+
+            # Durable telemetry queue, see attach_outbox()
+            self.outbox = None
+
+            # Topic log dumps are published on, see attach_outbox()
+            self.log_topic = None
             
-        def update_sensor_data(self):
+        def update_sensor_data(self, sensors=None):
             """Read Sensor Data
+
+            Args:
+                sensors (list): names from src.scheduler.SENSORS to read, all of them by default
             """
-            self.temperature = temp.read()
+            if sensors is None:
+                sensors = scheduler.SENSORS
+            with metrics.timer(UPDATE_SECONDS):
+                self.read_sensors(sensors)
+
+        def read_sensors(self, sensors):
+            primary = self.tank_sensors[0]
+            if 'temperature' in sensors:
+                self.temperature = primary.read_temperature()
+
+            channels = [channel for sensor in sensors
+                        for channel in SENSOR_ADC_CHANNELS.get(sensor, ())]
             try:
-                self.pH =               self.adc_sensors.read_pH()
-                self.leak =             self.adc_sensors.read_leak()
-                self.battery_voltage =  self.adc_sensors.read_battery()
-                self.internal_leak =    self.adc_sensors.read_internal_leak()
+                for metric, value in primary.read_adc(channels).items():
+                    setattr(self, metric, value)
             except Exception as e:
-                print(e)
-                print('Error ADC or I2C Error')
+                log.error('ADC or I2C error', error=e)
                 self.exit()
 
+            if 'water_level' in sensors:
+                try:
+                    self.water_level =      self.water_level_sensor.read()
+                except:
+                    log.error('Water level not read correctly')
+                    self.exit()
+
+            # Only record fresh readings, the rest are missing for this sample
+            self.history.add(time.time(), tuple(
+                value if source in sensors else None
+                for value, source in zip(self.get_sensor_values(), SENSOR_METRIC_SOURCES)))
+
+            for tank_sensors in self.tank_sensors[1:]:
+                self.update_tank_data(tank_sensors, sensors, channels)
+
+            log.debug('Sensors successfully read', sensors=','.join(sensors))
+
+        def update_tank_data(self, tank_sensors, sensors, channels):
+            """Read one of the other tanks. A faulty tank does not stop the others."""
+            readings = self.tank_readings[tank_sensors.tank.name]
             try:
-                self.water_level =      self.water_level_sensor.read()
-            except:
-                print('Water Level not read correctly')
-                self.exit()
+                if 'temperature' in sensors:
+                    temperature = tank_sensors.read_temperature()
+                    readings['temperature'] = None if temperature == -1 else temperature
+                readings.update(tank_sensors.read_adc(channels))
+                if 'water_level' in sensors:
+                    readings['water_level'] = tank_sensors.read_water_level()
+            except Exception as e:
+                log.error('Could not read tank sensors', tank=tank_sensors.tank.name, error=e)
 
-            print('All sensors successfully read!')   
+        def configure_tanks(self, tanks):
+            """Monitor every tank in <tanks>, see src/topology.py
+
+            Args:
+                tanks (tuple): the tanks, the primary tank first
+            """
+            old_probes = set(tank.temperature_probe for tank in getattr(self, 'tanks', ()))
+            self.tanks = tuple(tanks)
+            self.tank_sensors = [topology.TankSensors(tank) for tank in self.tanks]
+            # Each conversion holds up the others on the one-wire bus
+            for probe_id in old_probes - set(tank.temperature_probe for tank in self.tanks):
+                temp.unwatch(probe_id)
+            # The primary tank's sensors, as used by calibration and the leak monitor
+            self.adc_sensors = self.tank_sensors[0].adc_sensors
+            self.water_level_sensor = self.tank_sensors[0].water_level_sensor
+            self.tank_readings = {tank.name: dict.fromkeys(SENSOR_METRICS) for tank in self.tanks[1:]}
+            # Once the configuration is loaded, in __init__ the first time
+            if getattr(self, 'config_store', None) is not None:
+                self.configure_filters(self.get_config())
+
+        def configure_filters(self, config):
+            """Give every tank's ADC the filter pipelines in <config>, see src/filters.py"""
+            for tank_sensors in self.tank_sensors:
+                tank_sensors.adc_sensors.configure_filters(config)
+
+        def update_due_sensors(self):
+            """Read only the sensors whose sampling interval has elapsed
 
-        def error_detected(self): 
-            """Check if there are any errors with any of the sensor readings
-            
             Returns:
-                (bool) : whether the device has an error or not
+                (list) : names of the sensors that were read
             """
-            # By default there are no errors detected
-            error_detected = False
+            due = self.sampling.due()
+            if due:
+                self.update_sensor_data(due)
+            return due
 
-            # Get configuration for thresholds
-            config = self.get_config()
-            
-            # Check leak sensors 
-            if (self.leak > config['leak_threshold_volts'] or self.internal_leak > config['leak_threshold_volts']):
-                print("[WARN] Leak detected")
-                error_detected = True
-
-            # Check pH value
-            if (self.pH < config['min_ph'] or self.pH > config['max_ph']):
-                print("[WARN] pH outside of healthy range")
-                error_detected = True
-
-            # Check temperature
-            if (self.temperature < config['min_temperature'] or self.temperature > config['max_temperature'] ):
-                print("[WARN] Temperature outside of healthy range") 
-                error_detected = True
+        def error_detected(self): 
+            """Check the sensor readings against the alarm rules
             
-            # Check battery level
-            if(self.battery_voltage < config['low_battery_volts'] ):
-                print("[WARN] Low battery voltage detected")
-                error_detected = True
+            Only changes are reported: an alarm that stays raised is not
+            reported again until it has cleared.
 
-            return error_detected
+            Returns:
+                (bool) : whether an alarm was raised or cleared
+            """
+            events = self.alarms.evaluate(time.monotonic(), self.get_sensor_values())
+            for event in events:
+                if event.raised:
+                    log.warn(alarms.MESSAGES[event.name], alarm=event.name,
+                             value=event.value, threshold=event.threshold)
+                else:
+                    log.info('Alarm cleared', alarm=event.name, value=event.value)
+            return len(events) > 0
 
         def get_sensor_data(self):
             """Gets sensor data, formatted as JSON"""
@@ -150,65 +241,114 @@ class Device(object):
                                 'battery_voltage': self.battery_voltage,
                                 'internal_leak': self.internal_leak})
 
-        def update_config(self, config):
+        def get_tank_data(self, name):
+            """Gets the sensor data of tank <name>, formatted as JSON"""
+            if name == self.tanks[0].name:
+                readings = dict(zip(SENSOR_METRICS, self.get_sensor_values()))
+            else:
+                readings = dict(self.tank_readings[name])
+            readings['tank'] = name
+            return json.dumps(readings)
+
+        def get_sensor_values(self):
+            """Gets sensor readings as a tuple, in the order of SENSOR_METRICS
+
+            A failed temperature read (-1) is returned as None.
+            """
+            temperature = None if self.temperature == -1 else self.temperature
+            return (temperature, self.pH, self.leak, self.water_level,
+                    self.battery_voltage, self.internal_leak)
+
+        def update_config(self, changes):
             """Updates the device configuration in a Thread-safe manner
 
             Args:
-                config (dictionary): the new configuration
+                changes (dictionary): settings to change, the rest are kept
+
+            Returns:
+                (src.config.ConfigSnapshot) : the new configuration
+
+            Raises:
+                ValueError: if a setting is invalid, in which case nothing changes
             """
-            self.config_lock.acquire()
-            self.config = config
-            print("Configuration updated to: ", self.config)
-            self.config_lock.release()
+            return self.config_store.update(changes)
+
+        def on_config_changed(self, config, changes):
+            """Called with the new configuration and {setting: (old, new)} after every change"""
+            log.info('Configuration changed', version=config.version, changes=changes)
+            if any(setting.endswith(('_interval_secs', '_jitter_secs')) for setting in changes):
+                self.sampling.configure(config)
+            if any(setting.endswith(('_filter', '_burst_samples')) for setting in changes):
+                self.configure_filters(config)
 
         def get_config(self):
-            """Gets device configuration in a Thread-safe manner"""
-            self.config_lock.acquire()
-            config = self.config
-            self.config_lock.release()
-            return config
+            """Gets the current device configuration. Lock-free, the snapshot is immutable."""
+            return self.config_store.current
+
+        def attach_outbox(self, outbox, log_topic=None):
+            """Route MQTT connection and PUBACK events to a telemetry outbox
+
+            Args:
+                outbox (src.outbox.Outbox): the outbox telemetry is published through
+                log_topic (str): topic to publish log dumps on, when a dump_log command asks
+            """
+            self.outbox = outbox
+            self.log_topic = log_topic
+            if self.connected:
+                outbox.on_connect()
+
+        def attach_connection(self, connection):
+            """Use a connection manager to wait for the MQTT link
+
+            Args:
+                connection (src.connection.ConnectionManager): manager of the MQTT client
+            """
+            self.connection = connection
 
         def exit(self): 
-            GPIO.cleanup()
+            relay.cleanup()
 
         def wait_for_connection(self, timeout):
             """Wait for the device to become connected."""
-            total_time = 0
-            while not self.connected and total_time < timeout:
-                time.sleep(1)
-                total_time += 1
-
-            if not self.connected:
+            if not self.connection.wait_connected(timeout):
                 raise RuntimeError('Could not connect to MQTT bridge.')
 
         def on_connect(self, unused_client, unused_userdata, unused_flags, rc):
             """Callback for when a device connects."""
-            print('Connection Result:', error_str(rc))
+            log.info('Connection result', result=error_str(rc))
+            if rc != 0:
+                # The bridge refused the connection, e.g. an expired JWT
+                return
             self.connected = True
+            if self.outbox is not None:
+                self.outbox.on_connect()
 
         def on_disconnect(self, unused_client, unused_userdata, rc):
             """Callback for when a device disconnects."""
-            print('Disconnected:', error_str(rc))
+            log.info('Disconnected', result=error_str(rc))
             self.connected = False
+            if self.outbox is not None:
+                self.outbox.on_disconnect()
 
-        def on_publish(self, unused_client, unused_userdata, unused_mid):
+        def on_publish(self, unused_client, unused_userdata, mid):
             """Callback when the device receives a PUBACK from the MQTT bridge."""
-            print('Published message acked.')
+            PUBLISH_ACKS.inc()
+            if self.outbox is not None:
+                self.outbox.ack(mid)
 
         def on_subscribe(self, unused_client, unused_userdata, unused_mid,
                          granted_qos):
             """Callback when the device receives a SUBACK from the MQTT bridge."""
-            print('Subscribed: ', granted_qos)
+            log.info('Subscribed', granted_qos=granted_qos)
             if granted_qos[0] == 128:
-                print('Subscription failed.')
+                log.error('Subscription failed')
 
         def on_message(self, unused_client, unused_userdata, message):
             """Callback when the device receives a message on a subscription."""
             payload = message.payload.decode('utf-8')
 
-            # Print what message we recieved for debugging purposes
-            print('Received message \'{}\' on topic \'{}\' with Qos {}'.format(
-                payload, message.topic, str(message.qos)))
+            # Log what message we recieved for debugging purposes
+            log.info('Received message', payload=payload, topic=message.topic, qos=message.qos)
 
             # The device will receive its latest config when it subscribes to the
             # config topic. If there is no configuration for the device, the device
@@ -222,27 +362,40 @@ class Device(object):
 
             # Configuration message recieved
             if "config" in message.topic:
-                new_config = self.get_config()
-
-                # Update configuration settings
-                for setting in data:
-                    if setting in self.config: 
-                        new_config[setting] = data[setting]
-
-                # Save the updated device configuration
-                self.update_config(new_config)
+                # Settings the device does not know are ignored
+                try:
+                    self.update_config(data)
+                except ValueError as e:
+                    log.error('Rejected configuration update', error=e)
             # Command receieved
             elif "command" in message.topic:      
-                # pH calibration command
+                # pH calibration command, points 1, 2, 3... in turn, see src/calibration.py
                 if( 'calibration_num' in data and 'ph' in data ):
-                    if (data['calibration_num'] == 1):
-                        self.adc_sensors.calibrate_ph_1(data['ph'])
-                    elif (data['calibration_num'] == 2):
-                        self.adc_sensors.calibrate_ph_2(data['ph'])
-                    else:
-                        print("[ERROR]: Invalid pH calibration number")
+                    try:
+                        self.adc_sensors.calibrate_ph(data['calibration_num'], data['ph'])
+                    except ValueError as e:
+                        log.error('Rejected pH calibration', calibration_num=data['calibration_num'],
+                                  error=e)
+                # Undo a bad calibration, e.g. {"restore_calibration": 3}
+                elif 'restore_calibration' in data:
+                    try:
+                        self.adc_sensors.restore_calibration(data['restore_calibration'])
+                    except ValueError as e:
+                        log.error('Could not restore pH calibration', error=e)
+                # Log dump command, e.g. {"dump_log": 100} for the last 100 records
+                elif 'dump_log' in data:
+                    self.publish_log(data['dump_log'])
             else:
-                print('Unrecognized message recieved')
+                log.warn('Unrecognized message recieved', topic=message.topic)
+
+        def publish_log(self, count):
+            """Publish the last <count> log records, all of them if <count> is not a number"""
+            if self.outbox is None or self.log_topic is None:
+                log.warn('Log dump requested, but there is no log topic')
+                return
+            if isinstance(count, bool) or not isinstance(count, int):
+                count = None
+            self.outbox.put(self.log_topic, log.dump_json(count), qos=1)
 
     # The current singleton instance of __device
     instance = None
@@ -0,0 +1,142 @@
+'''
+File: dosing.py
+
+Purpose: Works out how long to run the peristaltic pump for from how far
+         the pH is from its target, instead of a fixed pulse whenever the
+         error passes a threshold. A feed-forward term doses what the
+         tank model says the error needs, and PID terms correct for the
+         model being wrong and for the slow acid drift. A dose takes a while
+         to mix through to the pH probe, so doses still mixing in are added
+         to the reading before the error is worked out (a Smith predictor).
+         That way the controller does not dose again for a change it has
+         already made. The integral term is clamped so it cannot wind up
+         while the pump is held off, and doses are never closer together
+         than a minimum interval. Gains come from the device configuration.
+
+Date: October 18, 2026
+
+Usage:
+    import src.dosing as dosing
+    controller = dosing.PHDosingController(device.config_store)
+    secs = controller.update(device.pH, time.monotonic())
+    if secs > 0:
+        actuators.pulse(pins.peristaltic_pump, secs)
+    controller.stats()
+'''
+
+from collections import deque
+from threading import Lock
+
+class PHDosingController(object):
+    """PID pH dosing with feed-forward and dead-time compensation. Thread-safe.
+
+    The pump only adds base, so it can raise the pH but never lower it.
+
+    Settings used, from src.config:
+        target_ph: pH to hold the tank at
+        ph_dose_gain: pH rise per second of pumping, once mixed in
+        ph_dead_time_secs: time for a dose to mix through to the probe
+        ph_feed_forward: fraction of the modelled dose to give straight away
+        ph_kp, ph_ki, ph_kd: seconds of pumping per pH of error, per pH
+                             second of error, and per pH per second
+        ph_deadband: do not dose for errors this small
+        ph_min_pulse_secs: shortest pulse the pump can give
+        ph_max_pulse_secs: longest single pulse
+        ph_min_dose_interval_secs: shortest time between two doses
+
+    Args:
+        config_store (src.config.ConfigStore): device configuration, followed for changes
+    """
+
+    def __init__(self, config_store):
+        self.lock = Lock()
+        self.config = None
+        self.integral = 0.0          # pH seconds of error
+        self.last_predicted = None
+        self.last_time = None
+        self.last_dose_time = None
+        self.mixing = deque()        # (time, secs) of doses not yet seen by the probe
+
+        # Statistics
+        self.doses = 0
+        self.dosed_secs = 0.0
+        self.last_error = None
+
+        self.configure(config_store.current)
+        config_store.subscribe(self.on_config_changed)
+
+    def configure(self, config):
+        with self.lock:
+            self.config = config
+            # The integral was built up for the old gains and target
+            self.integral = 0.0
+
+    def on_config_changed(self, config, changes):
+        """Config subscriber, picks up new gains and targets"""
+        if any(name == 'target_ph' or name.startswith('ph_') for name in changes):
+            self.configure(config)
+
+    def predict(self, pH, now):
+        """<pH> plus the doses still mixing in. Call with self.lock held."""
+        config = self.config
+        while self.mixing and now - self.mixing[0][0] >= config.ph_dead_time_secs:
+            self.mixing.popleft()
+        return pH + config.ph_dose_gain * sum(secs for started, secs in self.mixing)
+
+    def update(self, pH, now):
+        """Decide on a dose for a fresh pH reading
+
+        Call once per reading, not more often, and run the returned dose.
+
+        Args:
+            pH (float): the reading
+            now (float): time.monotonic() of the reading
+
+        Returns:
+            (float) : seconds to run the pump for, 0 for no dose
+        """
+        with self.lock:
+            config = self.config
+            predicted = self.predict(pH, now)
+            error = config.target_ph - predicted
+            self.last_error = error
+
+            dt = 0.0 if self.last_time is None else max(0.0, now - self.last_time)
+            # Derivative of the predicted pH, which does not jump when a dose reaches the probe
+            slope = 0.0 if dt == 0.0 else (predicted - self.last_predicted) / dt
+            self.last_predicted = predicted
+            self.last_time = now
+
+            proportional = (config.ph_feed_forward / config.ph_dose_gain + config.ph_kp) * error
+            secs = proportional + config.ph_ki * self.integral - config.ph_kd * slope
+
+            # Anti-windup: stop integrating while the pump is flat out
+            if not (secs >= config.ph_max_pulse_secs and error > 0):
+                self.integral += error * dt
+            if config.ph_ki > 0:
+                # The integral term never asks for more than one full pulse, and
+                # never below zero, as the pump cannot take base back out
+                self.integral = min(max(self.integral, 0.0), config.ph_max_pulse_secs / config.ph_ki)
+
+            if error <= config.ph_deadband or secs < config.ph_min_pulse_secs:
+                return 0.0
+            if (self.last_dose_time is not None and
+                    now - self.last_dose_time < config.ph_min_dose_interval_secs):
+                return 0.0
+
+            secs = min(secs, config.ph_max_pulse_secs)
+            self.mixing.append((now, secs))
+            self.last_dose_time = now
+            self.doses += 1
+            self.dosed_secs += secs
+            return secs
+
+    def stats(self):
+        """Dosing statistics, as a dictionary"""
+        with self.lock:
+            return {
+                'doses': self.doses,
+                'dosed_secs': self.dosed_secs,
+                'last_error': self.last_error,
+                'integral': self.integral,
+            }
@@ -0,0 +1,189 @@
+'''
+File: filters.py
+
+Purpose: Signal conditioning between the raw ADC voltages and the readings
+         stored on the device, so electrical noise does not reach dosing
+         decisions. Each channel reads a burst of conversions at a time and
+         runs it through a pipeline of stages, given as a comma-separated
+         spec in the device configuration:
+
+             median                 the median of the burst, which drops spikes
+             ema:<alpha>            exponential moving average, 0 < alpha <= 1
+             kalman:<q>:<r>         scalar Kalman filter for a slowly moving level.
+                                    q is the process noise in volts^2 per second,
+                                    r the noise of one conversion in volts^2.
+
+         e.g. "median,kalman:1e-8:4e-6". An empty spec (or "none") passes
+         the latest conversion through unchanged. Stages work on a whole
+         block of samples at once: the Kalman filter folds a burst in as a
+         single measurement of its mean, with the noise divided by the
+         burst size, which is the same as one update per sample when the
+         samples are taken together.
+
+         The pH probe is filtered by default. The leak channels are not, so a
+         leak is seen on the first conversion that shows it, and the leak
+         monitor always reads single raw conversions.
+
+Date: October 18, 2026
+
+Usage:
+    import src.filters as filters
+    pipeline = filters.parse('median,kalman:1e-8:4e-6')   # raises ValueError if invalid
+    volts = pipeline.process([1.51, 1.50, 1.93, 1.51, 1.49], time.monotonic())
+    pipeline.reset()
+'''
+
+import math
+
+# Default (filter spec, samples per burst) of each ADC channel, see src.adc.CHANNELS.
+# A pH conversion takes ~7.8 ms, so a burst of 5 holds the I2C bus for ~40 ms.
+DEFAULT_FILTERS = {
+    'pH': ('median,kalman:1e-8:4e-6', 5),
+    'leak': ('', 1),
+    'battery': ('ema:0.3', 1),
+    'internal_leak': ('', 1),
+}
+
+# Longest burst, so one channel cannot hold the I2C bus for long
+MAX_BURST_SAMPLES = 32
+
+def config_keys(channel):
+    """Names of the configuration settings for <channel>'s filter spec and burst size"""
+    return channel + '_filter', channel + '_burst_samples'
+
+class MedianStage(object):
+    """Reduces a block to its median"""
+
+    def process(self, samples, now):
+        ordered = sorted(samples)
+        middle = len(ordered) // 2
+        if len(ordered) % 2:
+            return [ordered[middle]]
+        return [(ordered[middle - 1] + ordered[middle]) / 2]
+
+    def reset(self):
+        pass
+
+class EMAStage(object):
+    """Exponential moving average over every sample, returns the average after the block
+
+    Args:
+        alpha (float): weight of each new sample, 1 for no smoothing
+    """
+
+    def __init__(self, alpha):
+        if not 0 < alpha <= 1:
+            raise ValueError('ema alpha must be above 0 and at most 1, got {!r}'.format(alpha))
+        self.alpha = alpha
+        self.value = None
+
+    def process(self, samples, now):
+        if self.value is None:
+            self.value = samples[0]
+        # y_n = (1 - a)^n y_0 + sum of a (1 - a)^(n - k) x_k, summed in one pass
+        keep = 1 - self.alpha
+        n = len(samples)
+        self.value = keep ** n * self.value + math.fsum(
+            self.alpha * keep ** (n - 1 - k) * sample for k, sample in enumerate(samples))
+        return [self.value]
+
+    def reset(self):
+        self.value = None
+
+class KalmanStage(object):
+    """Scalar Kalman filter for a level that drifts as a random walk
+
+    Args:
+        process_variance (float): how far the true level wanders, in units^2 per second
+        measurement_variance (float): noise of one sample, in units^2
+    """
+
+    def __init__(self, process_variance, measurement_variance):
+        if process_variance < 0 or measurement_variance <= 0:
+            raise ValueError('kalman needs q >= 0 and r > 0, got {!r} and {!r}'.format(
+                process_variance, measurement_variance))
+        self.process_variance = process_variance
+        self.measurement_variance = measurement_variance
+        self.reset()
+
+    def process(self, samples, now):
+        # The samples of a block are taken together, so they are one
+        # measurement of their mean, with 1/n of the noise
+        measurement = math.fsum(samples) / len(samples)
+        variance = self.measurement_variance / len(samples)
+        if self.estimate is None:
+            self.estimate, self.variance = measurement, variance
+        else:
+            # Predict: the level may have moved since the last block
+            self.variance += self.process_variance * max(0.0, now - self.last_time)
+            # Update
+            self.gain = self.variance / (self.variance + variance)
+            self.estimate += self.gain * (measurement - self.estimate)
+            self.variance *= 1 - self.gain
+        self.last_time = now
+        return [self.estimate]
+
+    def reset(self):
+        self.estimate = None
+        self.variance = None
+        self.gain = None
+        self.last_time = None
+
+# Stage name to (class, number of arguments)
+STAGES = {
+    'median': (MedianStage, 0),
+    'ema': (EMAStage, 1),
+    'kalman': (KalmanStage, 2),
+}
+
+class FilterPipeline(object):
+    """Stages applied in turn to each burst of samples. Not thread-safe, keep one per channel.
+
+    Args:
+        stages (list): MedianStage, EMAStage and KalmanStage objects
+        spec (str): the spec the stages were made from
+    """
+
+    def __init__(self, stages=(), spec=''):
+        self.stages = list(stages)
+        self.spec = spec
+
+    def process(self, samples, now):
+        """Filter a burst of samples taken at <now>, oldest first. Returns the filtered value."""
+        samples = list(samples)
+        if not samples:
+            raise ValueError('No samples to filter')
+        for stage in self.stages:
+            samples = stage.process(samples, now)
+        return samples[-1]
+
+    def reset(self):
+        """Forget the filter state, e.g. after the probe was moved"""
+        for stage in self.stages:
+            stage.reset()
+
+def parse(spec):
+    """Build a FilterPipeline from a spec such as 'median,kalman:1e-8:4e-6'
+
+    Raises:
+        ValueError: if the spec is invalid
+    """
+    spec = spec.strip()
+    stages = []
+    if spec and spec != 'none':
+        for part in spec.split(','):
+            name, *args = part.strip().split(':')
+            if name not in STAGES:
+                raise ValueError('unknown filter {!r}, expected one of {}'.format(
+                    name, ', '.join(sorted(STAGES))))
+            cls, arg_count = STAGES[name]
+            if len(args) != arg_count:
+                raise ValueError('filter {} takes {} arguments, got {}'.format(name, arg_count, len(args)))
+            try:
+                args = [float(arg) for arg in args]
+            except ValueError:
+                raise ValueError('filter {} arguments must be numbers, got {!r}'.format(name, part))
+            if not all(math.isfinite(arg) for arg in args):
+                raise ValueError('filter {} arguments must be finite, got {!r}'.format(name, part))
+            stages.append(cls(*args))
+    return FilterPipeline(stages, spec)
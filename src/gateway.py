@@ -0,0 +1,180 @@
+'''
+File: gateway.py
+
+Purpose: Cloud IoT gateway mode. One piponic instance holds the MQTT
+         connection, authenticated as a gateway, and attaches any number of
+         logical devices to it with the gateway attach protocol. Each
+         attached device publishes telemetry to its own /devices/<id>/events
+         topic and gets its own config and commands. Incoming messages are
+         routed to the on_message handler of the device they are for. Cloud
+         IoT forgets attachments when the connection drops, so every device
+         is attached and subscribed again on each connect, before anything
+         else is published.
+
+         Attach, subscribe and publish are plain MQTT, so a local mosquitto
+         broker can stand in for the Cloud IoT bridge when testing.
+
+Date: October 18, 2026
+
+Usage:
+    import src.gateway as gateway
+    conn = connection.ConnectionManager(client, host, port, on_connect=device.on_connect)
+    gw = gateway.Gateway(conn, 'my-gateway')
+    gw.attach('my-device', device.on_message)
+    gw.stats()
+    gw.detach_all()
+'''
+
+import json
+import re
+from threading import Lock
+
+import src.log as log
+
+# Topic of a message for a device: /devices/<device id>/<kind>[/<subfolder>]
+DEVICE_TOPIC = re.compile(r'^/devices/([^/]+)/')
+
+def device_topic(device_id, kind, subfolder=None):
+    """MQTT topic of <device_id>, e.g. device_topic('node-1', 'events', 'batch')"""
+    topic = '/devices/{}/{}'.format(device_id, kind)
+    if subfolder:
+        topic += '/' + subfolder
+    return topic
+
+class Gateway(object):
+    """
+    Attaches devices to a gateway's MQTT connection and routes their messages.
+
+    The gateway steps in between the connection manager and its on_connect
+    callback, which it calls once every device is attached again, and
+    becomes the client's on_message callback.
+
+    Args:
+        connection (src.connection.ConnectionManager): the gateway's connection
+        gateway_id (str): Cloud IoT device ID of the gateway
+        on_message (function): paho on_message callback for the gateway's own
+                               config and commands
+    """
+
+    def __init__(self, connection, gateway_id, on_message=None):
+        self.connection = connection
+        self.client = connection.client
+        self.gateway_id = gateway_id
+        self.forward_message = on_message
+        self.forward_connect = connection.forward_connect
+        connection.forward_connect = self.on_connect
+        self.client.on_message = self.on_message
+
+        # Guarded by self.lock. Not held while calling into paho.
+        self.lock = Lock()
+        self.devices = {}      # device ID -> (on_message handler, authorization)
+
+        # Statistics
+        self.attaches = 0
+        self.routed = {}
+        self.unrouted = 0
+        self.errors = 0
+        self.last_error = None
+
+        # Errors about attached devices arrive on the gateway's errors topic
+        connection.subscribe(device_topic(gateway_id, 'errors'), qos=0)
+        connection.subscribe(device_topic(gateway_id, 'config'), qos=1)
+        connection.subscribe(device_topic(gateway_id, 'commands/#'), qos=1)
+
+    def attach(self, device_id, on_message, authorization=''):
+        """Attach <device_id> now if connected, and again after every reconnect
+
+        Args:
+            device_id (str): Cloud IoT device ID, bound to the gateway
+            on_message (function): paho on_message callback for the device's config and commands
+            authorization (str): the device's JWT, if the gateway is set up to need one
+        """
+        with self.lock:
+            self.devices[device_id] = (on_message, authorization)
+        if self.connection.is_connected():
+            self.send_attach(device_id, authorization)
+
+    def send_attach(self, device_id, authorization):
+        """Attach, then subscribe. Cloud IoT handles them in the order they are sent."""
+        self.client.publish(device_topic(device_id, 'attach'),
+                            json.dumps({'authorization': authorization}), qos=1)
+        self.client.subscribe(device_topic(device_id, 'config'), qos=1)
+        self.client.subscribe(device_topic(device_id, 'commands/#'), qos=1)
+        with self.lock:
+            self.attaches += 1
+
+    def detach(self, device_id):
+        """Stop routing messages for <device_id> and tell Cloud IoT"""
+        with self.lock:
+            attached = self.devices.pop(device_id, None) is not None
+        if attached and self.connection.is_connected():
+            self.client.publish(device_topic(device_id, 'detach'), '', qos=1)
+
+    def detach_all(self):
+        with self.lock:
+            device_ids = list(self.devices)
+        for device_id in device_ids:
+            self.detach(device_id)
+
+    def on_connect(self, client, userdata, flags, rc):
+        """paho on_connect callback, attaches every device before anything else is sent"""
+        if rc == 0:
+            with self.lock:
+                devices = list(self.devices.items())
+            for device_id, (on_message, authorization) in devices:
+                self.send_attach(device_id, authorization)
+
+        if self.forward_connect is not None:
+            self.forward_connect(client, userdata, flags, rc)
+
+    def on_message(self, client, userdata, message):
+        """paho on_message callback, hands the message to the device it is for"""
+        match = DEVICE_TOPIC.match(message.topic)
+        device_id = match.group(1) if match else None
+
+        if device_id == self.gateway_id and message.topic.startswith(
+                device_topic(self.gateway_id, 'errors')):
+            payload = message.payload.decode('utf-8')
+            with self.lock:
+                self.errors += 1
+                self.last_error = payload
+            log.error('Gateway error', payload=payload)
+            return
+
+        with self.lock:
+            handler = self.devices.get(device_id, (None, None))[0]
+            if handler is not None:
+                self.routed[device_id] = self.routed.get(device_id, 0) + 1
+            elif device_id != self.gateway_id:
+                self.unrouted += 1
+
+        if handler is None and device_id == self.gateway_id:
+            handler = self.forward_message
+        if handler is None:
+            if device_id == self.gateway_id:
+                log.info('Gateway message', topic=message.topic)
+            else:
+                log.warn('No device attached for message', topic=message.topic)
+            return
+        try:
+            handler(client, userdata, message)
+        except Exception as e:
+            # One device's bad message must not stop the network loop
+            log.error('Message handler failed', device=device_id, error=e)
+
+    def attached(self):
+        """IDs of the attached devices"""
+        with self.lock:
+            return sorted(self.devices)
+
+    def stats(self):
+        """Gateway statistics, as a dictionary"""
+        with self.lock:
+            return {
+                'devices': len(self.devices),
+                'attaches': self.attaches,
+                'routed': dict(self.routed),
+                'unrouted': self.unrouted,
+                'errors': self.errors,
+                'last_error': self.last_error,
+            }
@@ -0,0 +1,220 @@
+'''
+File: history.py
+
+Purpose: On-device history of sensor readings with a fixed memory budget.
+         Keeps raw samples for the last hour, plus min/mean/max rollups at
+         1-minute resolution for two weeks and at 1-hour resolution for
+         90 days. Every tier is a preallocated ring of array('d') columns,
+         so memory use never grows after startup (about 4.7 MB with the
+         default sizes and six metrics).
+
+Date: October 18, 2026
+
+Usage:
+    import src.history as history
+    store = history.TimeSeriesStore(('pH', 'temperature'))
+    store.add(time.time(), (6.9, 21.5))
+    store.raw('pH', since=time.time() - 600)       # [(t, value), ...]
+    store.rollups('pH', 'minute')                  # [(t, min, mean, max), ...]
+'''
+
+import math
+from array import array
+from threading import Lock
+
+# Resolution of each rollup tier, in seconds
+MINUTE = 60
+HOUR = 3600
+
+class RingBuffer(object):
+    """Fixed-capacity ring of rows, stored column-wise in array('d')."""
+
+    def __init__(self, columns, capacity):
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self.data = [array('d', [0.0]) * capacity for column in self.columns]
+        self.start = 0
+        self.length = 0
+
+    def append(self, row):
+        index = (self.start + self.length) % self.capacity
+        if self.length == self.capacity:
+            # Full, overwrite the oldest row
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.length += 1
+        for column, value in zip(self.data, row):
+            column[index] = value
+
+    def column(self, name):
+        return self.data[self.columns.index(name)]
+
+    def indices(self):
+        """Physical indices of the stored rows, oldest first"""
+        for i in range(self.length):
+            yield (self.start + i) % self.capacity
+
+    def first_index_at_or_after(self, timestamp):
+        """Logical position of the first row whose first column is >= <timestamp>"""
+        times = self.data[0]
+        low, high = 0, self.length
+        while low < high:
+            middle = (low + high) // 2
+            if times[(self.start + middle) % self.capacity] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def rows(self, names, since=None):
+        """Rows of the named columns, oldest first, optionally only those at or after <since>"""
+        columns = [self.data[0]] + [self.column(name) for name in names]
+        first = 0 if since is None else self.first_index_at_or_after(since)
+        result = []
+        for i in range(first, self.length):
+            index = (self.start + i) % self.capacity
+            result.append(tuple(column[index] for column in columns))
+        return result
+
+    def __len__(self):
+        return self.length
+
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in self.data)
+
+class Rollup(object):
+    """Running min/sum/max/count of each metric within one time bucket."""
+
+    def __init__(self, num_metrics):
+        self.num_metrics = num_metrics
+        self.reset(None)
+
+    def reset(self, bucket_start):
+        self.bucket_start = bucket_start
+        self.mins = [math.inf] * self.num_metrics
+        self.maxs = [-math.inf] * self.num_metrics
+        self.sums = [0.0] * self.num_metrics
+        self.counts = [0] * self.num_metrics
+
+    def add(self, values):
+        for i, value in enumerate(values):
+            if value is None or value != value:
+                continue # Skip missing readings and NaN
+            if value < self.mins[i]:
+                self.mins[i] = value
+            if value > self.maxs[i]:
+                self.maxs[i] = value
+            self.sums[i] += value
+            self.counts[i] += 1
+
+    def merge(self, mins, means, maxs, counts):
+        """Fold in a finished bucket of a finer tier"""
+        for i in range(self.num_metrics):
+            if not counts[i]:
+                continue
+            self.mins[i] = min(self.mins[i], mins[i])
+            self.maxs[i] = max(self.maxs[i], maxs[i])
+            self.sums[i] += means[i] * counts[i]
+            self.counts[i] += counts[i]
+
+    def summary(self):
+        """(mins, means, maxs, counts), with NaN for metrics that had no samples"""
+        nan = math.nan
+        means = [self.sums[i] / self.counts[i] if self.counts[i] else nan
+                 for i in range(self.num_metrics)]
+        mins = [v if self.counts[i] else nan for i, v in enumerate(self.mins)]
+        maxs = [v if self.counts[i] else nan for i, v in enumerate(self.maxs)]
+        return mins, means, maxs, list(self.counts)
+
+class TimeSeriesStore(object):
+    """Tiered, fixed-size history of a set of metrics. Thread-safe.
+
+    Args:
+        metrics (tuple): names of the metrics, in the order values are passed to add()
+        raw_capacity (int): raw samples kept; one hour at up to one sample per second
+        minute_capacity (int): 1-minute rollups kept; two weeks by default
+        hour_capacity (int): 1-hour rollups kept; 90 days by default
+    """
+
+    def __init__(self, metrics, raw_capacity=3600, minute_capacity=14*24*60,
+                 hour_capacity=90*24):
+        self.metrics = tuple(metrics)
+        self.lock = Lock()
+        self.raw_buffer = RingBuffer(('time',) + self.metrics, raw_capacity)
+
+        rollup_columns = ['time']
+        for metric in self.metrics:
+            rollup_columns += [metric + '.min', metric + '.mean', metric + '.max', metric + '.count']
+        self.tiers = {
+            'minute': RingBuffer(rollup_columns, minute_capacity),
+            'hour': RingBuffer(rollup_columns, hour_capacity),
+        }
+        self.minute = Rollup(len(self.metrics))
+        self.hour = Rollup(len(self.metrics))
+
+    def add(self, timestamp, values):
+        """Record one sample
+
+        Args:
+            timestamp (float): seconds since the epoch, non-decreasing
+            values (sequence): one value per metric, None if missing
+        """
+        minute_start = timestamp - timestamp % MINUTE
+        hour_start = timestamp - timestamp % HOUR
+        with self.lock:
+            self.raw_buffer.append([timestamp] + [math.nan if v is None else v for v in values])
+
+            if self.minute.bucket_start is None:
+                self.minute.reset(minute_start)
+                self.hour.reset(hour_start)
+            elif minute_start != self.minute.bucket_start:
+                self.flush_minute()
+                self.minute.reset(minute_start)
+                if hour_start != self.hour.bucket_start:
+                    self.flush_hour()
+                    self.hour.reset(hour_start)
+            self.minute.add(values)
+
+    def flush_minute(self):
+        mins, means, maxs, counts = self.minute.summary()
+        self.tiers['minute'].append(self.rollup_row(self.minute.bucket_start, mins, means, maxs, counts))
+        self.hour.merge(mins, means, maxs, counts)
+
+    def flush_hour(self):
+        mins, means, maxs, counts = self.hour.summary()
+        self.tiers['hour'].append(self.rollup_row(self.hour.bucket_start, mins, means, maxs, counts))
+
+    def rollup_row(self, bucket_start, mins, means, maxs, counts):
+        row = [bucket_start]
+        for i in range(len(self.metrics)):
+            row += [mins[i], means[i], maxs[i], counts[i]]
+        return row
+
+    def raw(self, metric, since=None):
+        """Raw samples of <metric> as a list of (timestamp, value)"""
+        with self.lock:
+            return self.raw_buffer.rows((metric,), since)
+
+    def rollups(self, metric, resolution='minute', since=None):
+        """Finished rollups of <metric> as a list of (bucket start, min, mean, max)
+
+        Args:
+            resolution (str): 'minute' or 'hour'
+        """
+        if resolution not in self.tiers:
+            raise ValueError('Unknown resolution: {}'.format(resolution))
+        with self.lock:
+            return self.tiers[resolution].rows(
+                (metric + '.min', metric + '.mean', metric + '.max'), since)
+
+    def latest(self, metric):
+        """Most recent (timestamp, value) of <metric>, or None if empty"""
+        with self.lock:
+            if not len(self.raw_buffer):
+                return None
+            index = (self.raw_buffer.start + self.raw_buffer.length - 1) % self.raw_buffer.capacity
+            return self.raw_buffer.data[0][index], self.raw_buffer.column(metric)[index]
+
+    def nbytes(self):
+        """Memory held by the sample arrays"""
+        return self.raw_buffer.nbytes() + sum(tier.nbytes() for tier in self.tiers.values())
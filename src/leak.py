@@ -0,0 +1,157 @@
+'''
+File: leak.py
+
+Purpose: Fast path for leaks. LeakMonitor samples the two leak channels
+         every few hundred milliseconds in its own thread, instead of
+         waiting for the once-a-minute sensor cycle. The samples go through
+         the device's alarm engine, so a leak alarm is raised the same way
+         wherever it is seen. Whenever a leak alarm is raised, the relays
+         that add liquid to the tank are switched off and locked out until
+         every leak alarm has cleared.
+
+Date: October 18, 2026
+
+Usage:
+    import src.leak as leak
+    monitor = leak.LeakMonitor(device)
+    monitor.start()
+    ...
+    monitor.kill()
+    monitor.join()
+'''
+
+import os
+import time
+from threading import Lock, Thread, current_thread
+
+import src.alarms as alarms
+import src.log as log
+import src.pins as pins
+import src.relay as relay
+
+# Relays switched off and locked out during a leak. All are active low.
+CUTOFF_PINS = (pins.Water_level_solenoid, pins.peristaltic_pump)
+
+# Alarms from src.alarms that count as a leak
+LEAK_ALARMS = ('leak', 'internal_leak')
+
+# Leak samples go ahead of other conversions waiting for the I2C bus
+BUS_PRIORITY = 1
+
+class LeakMonitor(Thread):
+    """
+    Samples the leak sensors at a high rate in its own thread.
+
+    Args:
+        device (Device): the device singleton, for its ADC and alarm engine
+        interval_secs (float): time between leak samples
+        cutoff_pins (tuple): active-low relays to switch off during a leak
+        realtime (bool): try to run the thread under the SCHED_FIFO policy,
+                         so it is woken ahead of everything else. Needs root.
+    """
+
+    def __init__(self, device, interval_secs=0.25, cutoff_pins=CUTOFF_PINS, realtime=False):
+        super().__init__(daemon=True)
+        self.device = device
+        self.interval_secs = interval_secs
+        self.cutoff_pins = cutoff_pins
+        self.realtime = realtime
+
+        # Leak alarms currently raised, guarded by self.lock
+        self.lock = Lock()
+        self.leaking = set()
+
+        self.samples = 0
+        self.read_errors = 0
+        self.trips = 0
+        # Seconds from the start of the sample that saw the leak to the relays being off
+        self.last_cutoff_secs = None
+        self.sample_started = None
+
+        # Alarms are heard whichever thread evaluated them. First, so the relays
+        # are off before any other listener, e.g. the alarm publish, does I/O
+        device.alarms.add_listener(self.on_alarm, first=True)
+
+        # Check whether to kill thread
+        self.killThread = False
+
+    def on_alarm(self, event):
+        """Alarm listener: cut off the relays on a leak, release them once all leaks clear"""
+        if event.name not in LEAK_ALARMS:
+            return
+        with self.lock:
+            if event.raised:
+                self.leaking.add(event.name)
+                self.cut_off()
+            else:
+                self.leaking.discard(event.name)
+                if not self.leaking:
+                    for pin in self.cutoff_pins:
+                        relay.release(pin)
+                    log.info('Leak cleared, relays released')
+
+    def cut_off(self):
+        """Switch the cutoff relays off and keep them off. Call with self.lock held."""
+        for pin in self.cutoff_pins:
+            relay.lock_out(pin)
+        try:
+            # All of them in one GPIO call
+            relay.apply({pin: False for pin in self.cutoff_pins})
+        except Exception as e:
+            log.error('Could not switch off relays together', error=e)
+            for pin in self.cutoff_pins:
+                # One faulty relay must not keep the others on
+                try:
+                    relay.off_pu(pin)
+                except Exception as e:
+                    log.error('Could not switch off relay', gpio=pin, error=e)
+        self.trips += 1
+        if current_thread() is self:
+            self.last_cutoff_secs = time.monotonic() - self.sample_started
+        log.warn('Leak: relays switched off')
+
+    def sample(self):
+        """Read both leak channels and check them against the leak alarms"""
+        self.sample_started = time.monotonic()
+        volts = self.device.adc_sensors.read_channels(LEAK_ALARMS, priority=BUS_PRIORITY)
+        self.samples += 1
+
+        # Keep the device's readings fresh for the next publish
+        self.device.leak = volts['leak']
+        self.device.internal_leak = volts['internal_leak']
+
+        values = tuple(volts.get(metric) for metric in alarms.METRICS)
+        self.device.alarms.evaluate(self.sample_started, values)
+
+    def set_realtime_priority(self):
+        try:
+            # On Linux this applies to the calling thread only
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(1))
+        except (AttributeError, OSError) as e:
+            log.warn('Leak monitor running without real-time priority', error=e)
+
+    def run(self):
+        log.info('Starting leak monitor')
+        if self.realtime:
+            self.set_realtime_priority()
+
+        deadline = time.monotonic()
+        while not self.killThread:
+            try:
+                self.sample()
+            except Exception as e:
+                # A glitch on the bus must not stop leak monitoring
+                self.read_errors += 1
+                log.error('Leak monitor read failed', error=e)
+
+            # Sample at a fixed rate, not a fixed gap after each read
+            deadline += self.interval_secs
+            now = time.monotonic()
+            if deadline < now:
+                deadline = now
+            time.sleep(deadline - now)
+
+        log.info('Killed leak monitor')
+
+    def kill(self):
+        self.killThread = True
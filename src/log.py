@@ -0,0 +1,309 @@
+'''
+File: log.py
+
+Purpose: Structured logging that stays off the hot path. Logging a record
+         only appends it to two in-memory queues and never waits on I/O: a
+         fixed-size ring of the most recent records, and a queue that a
+         background thread writes out to the console, a file or journald.
+         On a Pi Zero with a slow SD card or serial console, a print could
+         hold up the sensor loop or paho's network thread. A message
+         repeated in a burst is rate limited, and the number of dropped
+         repeats goes out with the next copy of it, or on its own once the
+         rate limit period is over. The ring also keeps
+         records below the output level, so it can be dumped over MQTT to
+         debug a device remotely.
+
+Date: October 18, 2026
+
+Usage:
+    import src.log as log
+    log.configure(level='info', path='/var/log/piponic.log')   # or journald=True
+    log.start()
+    log.info('Publishing sensor data', bytes=120)
+    log.warn('Water level low', reading=0.2)
+    log.error('Could not read sensors', tank='tank1', error=e)
+    log.dump(100)           # the last 100 records, as dictionaries
+    log.stop()              # writes out everything still queued
+'''
+
+import datetime
+import json
+import sys
+import time
+from collections import deque, namedtuple
+from threading import Event, Lock, Thread
+
+import src.metrics as metrics
+
+Record = namedtuple('Record', ['time', 'level', 'message', 'fields'])
+
+DEBUG, INFO, WARN, ERROR = 10, 20, 30, 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warn': WARN, 'error': ERROR}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+# Console prefixes, as the messages had when they were printed
+PREFIXES = {DEBUG: '[DEBUG] ', INFO: '', WARN: '[WARN] ', ERROR: '[ERROR] '}
+
+# syslog priorities, for journald
+PRIORITIES = {DEBUG: 7, INFO: 6, WARN: 4, ERROR: 3}
+
+DROPPED = metrics.counter('piponic_log_dropped', 'Log records not written out, the writer fell behind')
+SUPPRESSED = metrics.counter('piponic_log_suppressed', 'Repeated log records dropped by rate limiting')
+
+def _value(value):
+    # Fields are kept JSON-friendly, so that the ring can be dumped as is
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+def format_text(record):
+    """One line for the console or a file: message, then key=value fields"""
+    text = PREFIXES[record.level] + record.message
+    if record.fields:
+        text += ' ' + ' '.join('{}={}'.format(key, value) for key, value in record.fields)
+    return text
+
+def as_dict(record):
+    return {'time': record.time, 'level': LEVEL_NAMES[record.level],
+            'message': record.message, 'fields': dict(record.fields)}
+
+class ConsoleSink(object):
+    def write(self, records):
+        sys.stdout.write(''.join(format_text(record) + '\n' for record in records))
+        sys.stdout.flush()
+
+    def close(self):
+        pass
+
+class FileSink(object):
+    """Appends timestamped lines to <path>"""
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def write(self, records):
+        self.file.write(''.join('{} {}\n'.format(
+            datetime.datetime.fromtimestamp(record.time).isoformat(timespec='milliseconds'),
+            format_text(record)) for record in records))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class JournaldSink(object):
+    """Sends records to the systemd journal, with their fields as journal fields.
+
+    Needs python3-systemd, e.g. sudo apt install python3-systemd
+    """
+
+    def __init__(self):
+        from systemd import journal
+        self.journal = journal
+
+    def write(self, records):
+        for record in records:
+            fields = {'PIPONIC_' + key.upper(): str(value) for key, value in record.fields}
+            self.journal.send(format_text(record), PRIORITY=PRIORITIES[record.level],
+                              SYSLOG_IDENTIFIER='piponic', **fields)
+
+    def close(self):
+        pass
+
+class RingLogger(object):
+    """
+    Keeps recent records in a ring and queues them for a LogWriter.
+
+    Appending to a deque needs no lock, so logging is safe from any thread,
+    including paho's callbacks. Only the rate limiter takes a lock, and it
+    is never held for more than a dictionary lookup.
+
+    Args:
+        ring_size (int): records kept for dump()
+        queue_size (int): records waiting to be written out before the oldest are dropped
+        burst (int): copies of one message let through per rate limit period
+        period_secs (float): rate limit period
+        max_limits (int): messages rate limited at once before finished periods are
+                          forgotten early, rather than by the writer
+    """
+
+    def __init__(self, ring_size=1000, queue_size=10000, burst=5, period_secs=10, max_limits=1000):
+        self.ring = deque(maxlen=ring_size)
+        self.queue = deque(maxlen=queue_size)
+        self.level = INFO
+        self.burst = burst
+        self.period_secs = period_secs
+        self.max_limits = max_limits
+
+        self.limit_lock = Lock()
+        self.limits = {}       # (level, message) -> [period start, count, suppressed]
+
+        # Set to wake the writer early, e.g. for an error
+        self.wake = Event()
+
+    def log(self, level, message, fields):
+        if len(self.limits) > self.max_limits:
+            self.expire()
+        now = time.monotonic()
+        with self.limit_lock:
+            limit = self.limits.get((level, message))
+            if limit is None or now - limit[0] >= self.period_secs:
+                suppressed = limit[2] if limit is not None else 0
+                limit = self.limits[level, message] = [now, 0, 0]
+            else:
+                suppressed = 0
+            limit[1] += 1
+            if limit[1] > self.burst:
+                limit[2] += 1
+                SUPPRESSED.inc()
+                return
+
+        fields = tuple((key, _value(value)) for key, value in fields.items())
+        if suppressed:
+            fields += (('suppressed', suppressed),)
+        self.append(Record(time.time(), level, message, fields))
+
+    def append(self, record):
+        self.ring.append(record)
+        if record.level >= self.level:
+            if len(self.queue) == self.queue.maxlen:
+                DROPPED.inc()
+            self.queue.append(record)
+            if record.level >= ERROR:
+                self.wake.set()
+
+    def expire(self):
+        """Forget the rate limits whose period is over
+
+        A message with copies suppressed in that period is logged once more,
+        with just the count, so a burst that does not come back is not lost.
+        """
+        now = time.monotonic()
+        with self.limit_lock:
+            expired = [(key, limit[2]) for key, limit in self.limits.items()
+                       if now - limit[0] >= self.period_secs]
+            for key, suppressed in expired:
+                del self.limits[key]
+        for (level, message), suppressed in expired:
+            if suppressed:
+                self.append(Record(time.time(), level, message, (('suppressed', suppressed),)))
+
+    def take(self):
+        """Remove and return the records waiting to be written out"""
+        records = []
+        try:
+            while True:
+                records.append(self.queue.popleft())
+        except IndexError:
+            return records
+
+    def dump(self, count=None):
+        """The last <count> records, oldest first, as dictionaries. Every record if count is None."""
+        records = list(self.ring)
+        if count is not None:
+            records = records[-count:] if count > 0 else []
+        return [as_dict(record) for record in records]
+
+class LogWriter(Thread):
+    """
+    Writes out queued records in its own thread.
+
+    Args:
+        logger (RingLogger): logger to write out the records of
+        sink: ConsoleSink, FileSink or JournaldSink
+        interval_secs (float): real time between writes. Errors are written straight away.
+    """
+
+    def __init__(self, logger, sink, interval_secs=0.2):
+        super().__init__(daemon=True)
+        self.logger = logger
+        self.sink = sink
+        self.interval_secs = interval_secs
+
+        # Check whether to kill thread
+        self.killThread = False
+
+    def run(self):
+        while not self.killThread:
+            # Event.wait times out in real time, even under the simulator's virtual clock
+            self.logger.wake.wait(self.interval_secs)
+            self.logger.wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        self.logger.expire()
+        records = self.logger.take()
+        if records:
+            try:
+                self.sink.write(records)
+            except Exception as e:
+                DROPPED.inc(len(records))
+                sys.stderr.write('[ERROR] Could not write log records: {}\n'.format(e))
+
+    def kill(self):
+        self.killThread = True
+        self.logger.wake.set()
+
+LOGGER = RingLogger()
+
+writer = None
+
+def configure(level='info', path=None, journald=False, ring_size=1000):
+    """Choose what is written out and where. Call before start().
+
+    Args:
+        level (str): debug, info, warn or error. The ring keeps every level.
+        path (str): file to append to, instead of the console
+        journald (bool): send to the systemd journal, instead of the console
+        ring_size (int): records kept for dump()
+    """
+    global writer
+    if journald:
+        try:
+            sink = JournaldSink()
+        except ImportError:
+            print('[WARN] python3-systemd is not installed, logging to the console')
+            sink = ConsoleSink()
+    elif path is not None:
+        sink = FileSink(path)
+    else:
+        sink = ConsoleSink()
+    LOGGER.level = LEVELS[level]
+    if LOGGER.ring.maxlen != ring_size:
+        LOGGER.ring = deque(LOGGER.ring, maxlen=ring_size)
+    writer = LogWriter(LOGGER, sink)
+
+def start():
+    """Start writing out records. Records logged before now are written first."""
+    global writer
+    if writer is None:
+        writer = LogWriter(LOGGER, ConsoleSink())
+    writer.start()
+
+def stop():
+    """Write out everything still queued and stop the writer"""
+    if writer is not None and writer.is_alive():
+        writer.kill()
+        writer.join()
+        writer.sink.close()
+
+def debug(message, **fields):
+    LOGGER.log(DEBUG, message, fields)
+
+def info(message, **fields):
+    LOGGER.log(INFO, message, fields)
+
+def warn(message, **fields):
+    LOGGER.log(WARN, message, fields)
+
+def error(message, **fields):
+    LOGGER.log(ERROR, message, fields)
+
+def dump(count=None):
+    """The last <count> records, oldest first, as dictionaries"""
+    return LOGGER.dump(count)
+
+def dump_json(count=None):
+    """The last <count> records as a JSON document, for publishing"""
+    return json.dumps({'records': dump(count), 'dropped': DROPPED.value,
+                       'suppressed': SUPPRESSED.value})
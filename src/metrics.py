@@ -0,0 +1,300 @@
+'''
+File: metrics.py
+
+Purpose: Lightweight instrumentation for the hot paths: sensor reads, I2C
+         conversions, the main loop and publish acks. Counters and
+         fixed-bucket histograms are sharded by thread. Each thread only
+         ever writes its own shard, so recording a value takes no lock and
+         never makes a sensor read wait on a scrape. Readers add the shards
+         up. Metrics are served in the Prometheus text format on a local
+         HTTP endpoint, and can be published as a periodic MQTT message,
+         to find slow probes and I2C stalls across the fleet.
+
+Date: October 18, 2026
+
+Usage:
+    import src.metrics as metrics
+    reads = metrics.histogram('piponic_adc_read_seconds', 'ADC conversion time', channel='pH')
+    with metrics.timer(reads):
+        ...
+    metrics.counter('piponic_publish_acks', 'PUBACKs received').inc()
+
+    metrics.render()               # Prometheus text format
+    metrics.snapshot()             # the same as a dictionary, for MQTT
+    server = metrics.MetricsServer(port=9109)
+    server.start()                 # GET http://localhost:9109/metrics
+'''
+
+import bisect
+import time
+from threading import Lock, Thread, local
+
+# Histogram bucket upper bounds in seconds, from a fast I2C conversion to a
+# DS18B20 conversion with retries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Longer buckets for publish acks, which cross the network
+ACK_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+class _Sharded(object):
+    """Per-thread cells of numbers. A thread only writes its own cell."""
+
+    def __init__(self, size):
+        self.size = size
+        self.local = local()
+        # Only taken the first time a thread records a value
+        self.cells_lock = Lock()
+        self.cells = []
+
+    def cell(self):
+        cell = getattr(self.local, 'cell', None)
+        if cell is None:
+            cell = [0] * self.size
+            with self.cells_lock:
+                self.cells.append(cell)
+            self.local.cell = cell
+        return cell
+
+    def total(self):
+        """Sum of every thread's cell. Values recorded meanwhile may or may not be included."""
+        with self.cells_lock:
+            cells = list(self.cells)
+        return [sum(column) for column in zip(*cells)] if cells else [0] * self.size
+
+class Counter(object):
+    """A count that only goes up"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.shards = _Sharded(1)
+
+    def inc(self, amount=1):
+        self.shards.cell()[0] += amount
+
+    @property
+    def value(self):
+        return self.shards.total()[0]
+
+    def samples(self):
+        yield self.name + '_total', self.labels, self.value
+
+class Histogram(object):
+    """Counts of observations in fixed buckets, plus their sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket, one for above the last bucket, then the sum
+        self.shards = _Sharded(len(self.buckets) + 2)
+
+    def observe(self, value):
+        cell = self.shards.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def state(self):
+        """(cumulative bucket counts, count, sum)"""
+        total = self.shards.total()
+        cumulative = []
+        running = 0
+        for count in total[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, total[-1]
+
+    def quantile(self, q):
+        """Estimate of the <q> quantile: the upper bound of the bucket it falls in
+
+        Above the last bucket this is the last bound, a lower bound on the
+        true value, so that the snapshot stays valid JSON.
+        """
+        cumulative, count, total = self.state()
+        if count == 0:
+            return None
+        rank = q * count
+        for bound, seen in zip(self.buckets, cumulative):
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def samples(self):
+        cumulative, count, total = self.state()
+        for bound, seen in zip(self.buckets, cumulative):
+            yield self.name + '_bucket', self.labels + (('le', repr(float(bound))),), seen
+        yield self.name + '_bucket', self.labels + (('le', '+Inf'),), count
+        yield self.name + '_sum', self.labels, total
+        yield self.name + '_count', self.labels, count
+
+class Registry(object):
+    """Every metric by name and labels"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.metrics = {}     # (name, labels) -> metric
+
+    def get(self, cls, name, help_text, labels, **kwargs):
+        """The metric with <name> and <labels>, made the first time it is asked for"""
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = cls(name, help_text, key[1], **kwargs)
+                    self.metrics[key] = metric
+        if not isinstance(metric, cls):
+            raise ValueError('Metric {} is already a {}'.format(name, metric.kind))
+        return metric
+
+    def collect(self):
+        with self.lock:
+            return sorted(self.metrics.items(), key=lambda item: item[0])
+
+REGISTRY = Registry()
+
+def counter(name, help_text='', **labels):
+    """The counter <name> with <labels>. Keep it rather than looking it up on every call."""
+    return REGISTRY.get(Counter, name, help_text, labels)
+
+def histogram(name, help_text='', buckets=DEFAULT_BUCKETS, **labels):
+    """The histogram <name> with <labels>. Keep it rather than looking it up on every call."""
+    return REGISTRY.get(Histogram, name, help_text, labels, buckets=buckets)
+
+class timer(object):
+    """Context manager that observes the seconds spent inside it in <histogram>"""
+
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        # perf_counter, so the simulator's virtual clock does not hide slow code
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in labels) + '}'
+
+def render(registry=REGISTRY):
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    described = set()
+    for (name, labels), metric in registry.collect():
+        if name not in described:
+            described.add(name)
+            lines.append('# HELP {} {}'.format(name, metric.help_text))
+            lines.append('# TYPE {} {}'.format(name, metric.kind))
+        for sample, sample_labels, value in metric.samples():
+            lines.append('{}{} {}'.format(sample, _format_labels(sample_labels), value))
+    return '\n'.join(lines) + '\n'
+
+def snapshot(registry=REGISTRY):
+    """Compact summary of every metric, for a metrics message
+
+    Returns:
+        (dict) : counters as their value, histograms as count, sum, p50 and p99
+    """
+    summary = {}
+    for (name, labels), metric in registry.collect():
+        key = name + _format_labels(labels)
+        if isinstance(metric, Histogram):
+            cumulative, count, total = metric.state()
+            summary[key] = {'count': count, 'sum': total,
+                            'p50': metric.quantile(0.5), 'p99': metric.quantile(0.99)}
+        else:
+            summary[key] = metric.value
+    return summary
+
+def _handler_class(registry):
+    """HTTP request handler serving <registry>. http.server is slow to import, so only done when serving."""
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render(registry).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # One line per scrape would flood the log
+            pass
+
+    return MetricsHandler
+
+class MetricsServer(Thread):
+    """
+    Serves the metrics for Prometheus on http://<host>:<port>/metrics in its own thread.
+
+    Args:
+        port (int): TCP port to listen on
+        host (str): address to listen on, only this machine by default
+    """
+
+    def __init__(self, port=9109, host='127.0.0.1'):
+        super().__init__(daemon=True)
+        from http.server import HTTPServer
+        self.server = HTTPServer((host, port), _handler_class(REGISTRY))
+
+    def run(self):
+        # Not imported at the top, src/log.py counts its dropped records here
+        import src.log as log
+        log.info('Serving metrics', port=self.server.server_address[1])
+        self.server.serve_forever()
+
+    def kill(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class MetricsReporter(Thread):
+    """
+    Calls report(snapshot()) every <interval_secs> in its own thread, e.g. to publish over MQTT.
+
+    Args:
+        report (function): called with the metrics summary
+        interval_secs (float): time between reports
+    """
+
+    def __init__(self, report, interval_secs):
+        super().__init__(daemon=True)
+        self.report = report
+        self.interval_secs = interval_secs
+
+        # Check whether to kill thread
+        self.killThread = False
+
+    def run(self):
+        import src.log as log
+        deadline = time.monotonic()
+        while not self.killThread:
+            deadline += self.interval_secs
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            if self.killThread:
+                break
+            try:
+                self.report(snapshot())
+            except Exception as e:
+                log.error('Could not report metrics', error=e)
+
+    def kill(self):
+        self.killThread = True
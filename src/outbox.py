@@ -0,0 +1,259 @@
+'''
+File: outbox.py
+
+Purpose: Durable store-and-forward queue for telemetry. Every message is
+         first appended to a SQLite database in WAL mode, so nothing is lost
+         while the MQTT link is down or the process restarts. A background
+         thread replays stored messages in batches while connected, with a
+         bounded number of unacknowledged messages handed to paho at a time,
+         and deletes them once the bridge acks them. See src/tracker.py for
+         how acks are matched to messages and when unacked messages are sent
+         again. Disk use is capped: if the cap is reached, the oldest
+         messages are dropped first.
+
+Date: October 18, 2026
+
+Usage:
+    import src.outbox as outbox
+    box = outbox.Outbox(client, 'outbox.db')
+    box.start()
+    box.put('/devices/my-device/events', payload)
+
+    # From the MQTT callbacks
+    box.on_connect()
+    box.on_disconnect()
+    box.ack(mid)
+
+    box.stats()       # stored, published, ack latency percentiles, ...
+'''
+
+import sqlite3
+import time
+from threading import Condition, Lock, Thread
+
+import src.log as log
+import src.tracker as tracker
+
+# paho's MQTT_ERR_SUCCESS, kept here so this module does not need paho itself
+MQTT_ERR_SUCCESS = 0
+
+# Approximate per-row storage overhead of SQLite, in bytes
+ROW_OVERHEAD_BYTES = 64
+
+# Fraction of the stored messages dropped at once when the disk cap is hit
+DROP_FRACTION = 0.1
+
+# Most row ids bound in one statement, below SQLite's limit of 999 variables
+MAX_IDS_PER_STATEMENT = 500
+
+class Outbox(Thread):
+    """
+    Disk-backed telemetry queue that replays to an MQTT client in its own thread.
+
+    Args:
+        client (mqtt.Client): client to publish with
+        path (str): SQLite database file
+        max_bytes (int): cap on stored payload bytes
+        max_in_flight (int): most messages published but not yet acked
+        batch_size (int): most messages read from disk per pass
+        ack_timeout_secs (float): after this long without an ack, a message is sent again
+        on_delivered (function): called with the number of messages acked, from the replay thread
+    """
+
+    def __init__(self, client, path='outbox.db', max_bytes=50*1024*1024,
+                 max_in_flight=10, batch_size=50, ack_timeout_secs=600, on_delivered=None):
+        super().__init__(daemon=True)
+        self.client = client
+        self.path = path
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.ack_timeout_secs = ack_timeout_secs
+        self.acks = tracker.PublishTracker(max_in_flight, ack_timeout_secs)
+        self.on_delivered = on_delivered
+
+        # Guards the database connection
+        self.db_lock = Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self.db.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode NORMAL cannot corrupt the database on power loss
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                        'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                        'topic TEXT NOT NULL, '
+                        'payload BLOB NOT NULL, '
+                        'qos INTEGER NOT NULL, '
+                        'created REAL NOT NULL)')
+        # Counted once here, then kept up to date as rows come and go
+        self.recount()
+
+        # Replay state, guarded by self.state. paho calls on_publish while
+        # holding its own mutex, so this is never held around client.publish()
+        self.state = Condition(Lock())
+        self.connected = False
+        self.acked = []        # row ids acked but not yet deleted
+        self.work = self.stored_count > 0
+
+        self.dropped = 0
+        self.published = 0
+        self.retries = 0
+
+        # Check whether to kill thread
+        self.killThread = False
+
+    def put(self, topic, payload, qos=1):
+        """Store a message for delivery. Returns straight away."""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self.db_lock:
+            self.db.execute('INSERT INTO outbox (topic, payload, qos, created) VALUES (?, ?, ?, ?)',
+                            (topic, payload, qos, time.time()))
+            self.stored_bytes += len(payload) + len(topic) + ROW_OVERHEAD_BYTES
+            self.stored_count += 1
+            if self.stored_bytes > self.max_bytes:
+                self.drop_oldest()
+        with self.state:
+            self.work = True
+            self.state.notify()
+
+    def drop_oldest(self):
+        """Drop the oldest messages to get back under the disk cap. Call with db_lock held."""
+        sending = self.acks.sending()
+        count = max(1, int(self.stored_count * DROP_FRACTION))
+        rows = [row for (row,) in self.db.execute(
+            'SELECT id FROM outbox ORDER BY id LIMIT ?', (count + len(sending),))
+                if row not in sending][:count]
+        self.remove(rows)
+        self.db.execute('PRAGMA incremental_vacuum')
+        self.dropped += len(rows)
+        log.warn('Telemetry outbox full, dropped oldest messages', dropped=len(rows))
+
+    def remove(self, row_ids):
+        """Delete <row_ids> and take them off the stored totals. Call with db_lock held.
+
+        Only the deleted rows are measured, by primary key, so this does not
+        scan the table.
+        """
+        removed_bytes = removed_count = 0
+        self.db.execute('BEGIN')
+        try:
+            for start in range(0, len(row_ids), MAX_IDS_PER_STATEMENT):
+                chunk = list(row_ids[start:start + MAX_IDS_PER_STATEMENT])
+                where = 'WHERE id IN ({})'.format(','.join('?' * len(chunk)))
+                size, count = self.db.execute(
+                    'SELECT COALESCE(SUM(LENGTH(payload) + LENGTH(topic)), 0), COUNT(*) FROM outbox '
+                    + where, chunk).fetchone()
+                self.db.execute('DELETE FROM outbox ' + where, chunk)
+                removed_bytes += size + count * ROW_OVERHEAD_BYTES
+                removed_count += count
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.stored_bytes -= removed_bytes
+        self.stored_count -= removed_count
+
+    def recount(self):
+        """Count the stored messages from scratch. Scans the whole table, so only at startup."""
+        self.stored_bytes, self.stored_count = self.db.execute(
+            'SELECT COALESCE(SUM(LENGTH(payload) + LENGTH(topic)), 0), COUNT(*) FROM outbox').fetchone()
+        self.stored_bytes += self.stored_count * ROW_OVERHEAD_BYTES
+
+    def on_connect(self):
+        with self.state:
+            self.connected = True
+            self.work = True
+            self.state.notify()
+
+    def on_disconnect(self):
+        # Messages already handed to paho stay in flight, paho resends them on reconnect
+        with self.state:
+            self.connected = False
+
+    def ack(self, mid):
+        """Record a PUBACK. Safe to call from paho's callbacks."""
+        row_id = self.acks.ack(mid)
+        if row_id is None:
+            # The replay thread picks it up when publish() returns the mid
+            return
+        with self.state:
+            self.acked.append(row_id)
+            self.work = True
+            self.state.notify()
+
+    def pending(self):
+        """Number of messages stored and not yet acked"""
+        with self.db_lock:
+            return self.stored_count
+
+    def run(self):
+        while not self.killThread:
+            with self.state:
+                # Wake up at least every so often to check for lost acks
+                self.state.wait_for(lambda: self.work or self.killThread, timeout=self.ack_timeout_secs / 4)
+                self.work = False
+                acked, self.acked = self.acked, []
+                connected = self.connected
+
+            # Unacked messages are still on disk, so they go out again with the next replay
+            self.retries += len(self.acks.expire())
+            free = self.acks.free() if connected else 0
+            if acked:
+                self.delete(acked)
+                if self.on_delivered is not None:
+                    self.on_delivered(len(acked))
+            if free > 0:
+                self.replay(min(free, self.batch_size), self.acks.sending())
+
+    def delete(self, row_ids):
+        with self.db_lock:
+            self.remove(row_ids)
+
+    def replay(self, count, sending):
+        """Publish up to <count> stored messages that are not already in flight"""
+        with self.db_lock:
+            rows = self.db.execute('SELECT id, topic, payload, qos, created FROM outbox ORDER BY id LIMIT ?',
+                                   (count + len(sending),)).fetchall()
+        rows = [row for row in rows if row[0] not in sending][:count]
+
+        for row_id, topic, payload, qos, created in rows:
+            info = self.client.publish(topic, payload, qos=qos)
+            if info.rc != MQTT_ERR_SUCCESS:
+                # Not connected after all, wait for on_connect
+                break
+            if self.acks.track(info.mid, row_id, created):
+                with self.state:
+                    self.acked.append(row_id)
+                    self.work = True
+            self.published += 1
+
+        # Keep going if there is more stored than was sent in this pass
+        if len(rows) == count:
+            with self.state:
+                self.work = True
+
+    def stats(self):
+        """Outbox statistics, as a dictionary. Latencies are in seconds."""
+        stats = self.acks.stats()
+        with self.db_lock:
+            stats.update({
+                'stored': self.stored_count,
+                'stored_bytes': self.stored_bytes,
+                'published': self.published,
+                'retries': self.retries,
+                'dropped': self.dropped,
+            })
+        return stats
+
+    def kill(self):
+        with self.state:
+            self.killThread = True
+            self.state.notify()
+
+    def close(self):
+        """Stop the replay thread and close the database. Unsent messages stay on disk."""
+        self.kill()
+        if self.is_alive():
+            self.join()
+        with self.db_lock:
+            self.db.close()
@@ -14,6 +14,9 @@ I2C_SCL = 3
 TEMP = 4
 WATER_LEVEL = 17
 
+# ADS1115 ALERT/RDY output, only needed for continuous ADC acquisition
+ADC0_ALERT_RDY = 27
+
 #ADC0 PINS
 #P0 Outer Leak detector
 #P1 pH sensor
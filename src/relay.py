@@ -16,60 +16,236 @@ relay.init(src.pins.RELAY1)
 relay.on(src.pins.RELAY1)
 relay.off(src.pins.RELAY1)
 
+# Keep a relay off, e.g. while a leak alarm is raised
+relay.lock_out(src.pins.Water_level_solenoid)
+relay.release(src.pins.Water_level_solenoid)
+
+# Switch several relays in one GPIO call, by whether each should be energised
+relay.apply({src.pins.peristaltic_pump: False, src.pins.Water_level_solenoid: True})
+
+# Wear and dosing statistics: {pin: {'switches': ..., 'on_secs': ..., 'on': ...}}
+relay.stats()
+
+The module keeps a shadow register of each pin's configured mode and last
+written level, so setups and writes that would not change anything never
+reach the GPIO driver.
+
 '''
 
 import RPi.GPIO as GPIO
 import time
 import src.pins
-
-
-# Set all the pins to output pins
-GPIO.setmode(GPIO.BCM) # GPIO Assign mode so that the numbers below are the GPIO assigned names
-
+from threading import RLock
+
+
+# Guards the shadow register and statistics below
+_lock = RLock()
+
+# Shadow register: whether each pin set up as an output drives an active low
+# relay, and the level last written to it. Which relays are active low is
+# kept across cleanup(), so their statistics stay right.
+_active_low = {}
+_levels = {}
+
+# Pins set up as outputs since the last cleanup()
+_set_up = set()
+
+# Pins that must stay off, guarded by _lock. Writes that would switch them on are refused.
+locked_out = set()
+
+# Per-relay wear statistics
+switch_counts = {}
+_on_secs = {}
+_on_since = {}
+
+# GPIO calls made and skipped thanks to the shadow register
+writes = 0
+skipped_writes = 0
+
+# Whether the GPIO numbering mode is set. Done once, on the first pin set up
+# rather than at import, so importing this module touches no hardware.
+_mode_set = False
+
+def lock_out(pin):
+    # Under the lock, so a write already under way finishes first and later ones see it
+    with _lock:
+        locked_out.add(pin)
+
+def release(pin):
+    with _lock:
+        locked_out.discard(pin)
+
+def _energised(pin, level):
+    return level != _active_low.get(pin, False)
+
+def _setup(pin, active_low):
+    """Set <pin> up as an output unless it already is. Call with _lock held."""
+    global skipped_writes, _mode_set
+    if not _mode_set:
+        GPIO.setmode(GPIO.BCM) # GPIO Assign mode so that the numbers below are the GPIO assigned names
+        _mode_set = True
+    if pin in _set_up:
+        skipped_writes += 1
+    else:
+        GPIO.setup(pin, GPIO.OUT)
+        _set_up.add(pin)
+        # The level after setup is unknown, so the next write always goes out
+        _levels.pop(pin, None)
+    _active_low[pin] = active_low
+
+def _set_up_again(pins):
+    """Set <pins> up from scratch, after something called GPIO.cleanup(). Call with _lock held."""
+    global _mode_set
+    # GPIO.cleanup() also forgets the numbering mode
+    _mode_set = False
+    for pin in pins:
+        _set_up.discard(pin)
+        _setup(pin, _active_low.get(pin, False))
+
+def _account(pin, level, now):
+    """Track switches and on-time for a level that was just written. Call with _lock held."""
+    was_on = pin in _on_since
+    is_on = _energised(pin, level)
+    if is_on and not was_on:
+        _on_since[pin] = now
+    elif was_on and not is_on:
+        _on_secs[pin] = _on_secs.get(pin, 0.0) + now - _on_since.pop(pin)
+    if pin in _levels and _levels[pin] != level:
+        switch_counts[pin] = switch_counts.get(pin, 0) + 1
+    _levels[pin] = level
+
+def _write(pin, level, switch_on=False):
+    """Drive <pin> to <level>, skipping the GPIO call if it is there already
+
+    Args:
+        switch_on (bool): whether <level> switches the relay on, which a lock out refuses
+
+    Returns:
+        (int) : -1 if refused, otherwise None
+    """
+    global writes, skipped_writes
+    with _lock:
+        # Checked with the lock held, so a pulse cannot switch a relay back on after a cutoff
+        if switch_on and pin in locked_out:
+            return -1
+        if _levels.get(pin) == level:
+            skipped_writes += 1
+            return
+        try:
+            GPIO.output(pin, level)
+        except RuntimeError:
+            # Set up again after something called GPIO.cleanup(), and retry once
+            _set_up_again([pin])
+            GPIO.output(pin, level)
+        writes += 1
+        _account(pin, level, time.monotonic())
+
+def apply(states):
+    """Switch several relays with one GPIO call
+
+    Args:
+        states (dict): pin -> whether the relay should be energised, taking
+                       each pin's active low or high set up into account.
+                       Locked out pins are kept off.
+
+    Returns:
+        (int) : number of pins that actually changed
+    """
+    global writes, skipped_writes
+    with _lock:
+        changes = {}
+        for pin, energise in states.items():
+            if energise and pin in locked_out:
+                energise = False
+            level = energise != _active_low.get(pin, False)
+            if _levels.get(pin) == level:
+                skipped_writes += 1
+            else:
+                changes[pin] = level
+        if changes:
+            pins = list(changes)
+            levels = [changes[pin] for pin in pins]
+            try:
+                GPIO.output(pins, levels)
+            except RuntimeError:
+                # As in _write(), set up again and retry once
+                _set_up_again(pins)
+                GPIO.output(pins, levels)
+            writes += 1
+            now = time.monotonic()
+            for pin in pins:
+                _account(pin, changes[pin], now)
+        return len(changes)
+
+def stats():
+    """Switch count, total on-time in seconds and current state of each relay"""
+    with _lock:
+        now = time.monotonic()
+        return {pin: {
+            'switches': switch_counts.get(pin, 0),
+            'on_secs': _on_secs.get(pin, 0.0) + (now - _on_since[pin] if pin in _on_since else 0.0),
+            'on': pin in _on_since,
+        } for pin in _active_low}
+
+def cleanup():
+    """Release every GPIO pin and forget the shadow register. Statistics are kept."""
+    global _mode_set
+    with _lock:
+        GPIO.cleanup()
+        _mode_set = False
+        _set_up.clear()
+        _levels.clear()
+        # Released pins are off, count their on-time up to now
+        now = time.monotonic()
+        for pin, since in _on_since.items():
+            _on_secs[pin] = _on_secs.get(pin, 0.0) + now - since
+        _on_since.clear()
 
 #Default pull up configuration
 def init(pin):
-    GPIO.setup(pin, GPIO.OUT)
-    GPIO.output(pin,False) #set normally low
+    with _lock:
+        _setup(pin, active_low=False)
+        _write(pin, False) #set normally low
 
 # if your relay block is active LOW (you'll be pulling down the output), you'll need to init to high (pull-up default)
 def init_pullup(pin):
-    GPIO.setup(pin, GPIO.OUT ) #confusing, but we turn on the pull-up resistor, so that the default value is high. 
-    GPIO.output(pin, True)
+    with _lock:
+        _setup(pin, active_low=True) #confusing, but we turn on the pull-up resistor, so that the default value is high. 
+        _write(pin, True)
 
 
 #example function of turning on relay 1.
 
 def on(pin):
     try:
-        GPIO.output(pin,True)
+        return _write(pin, True, switch_on=True)
 
     except KeyboardInterrupt:
-        GPIO.cleanup()
+        cleanup()
         return -1
     
 def off(pin):
     try:
-        GPIO.output(pin,False)
+        _write(pin, False)
 
     except KeyboardInterrupt:
-        GPIO.cleanup()
+        cleanup()
         return -1
 
 def on_pu(pin):
     try:
-        GPIO.output(pin,False)
+        return _write(pin, False, switch_on=True)
 
     except KeyboardInterrupt:
-        GPIO.cleanup()
+        cleanup()
         return -1
     
 def off_pu(pin):
     try:
-        GPIO.output(pin,True)
+        _write(pin, True)
 
     except KeyboardInterrupt:
-        GPIO.cleanup()
+        cleanup()
         return -1
 
 
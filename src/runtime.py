@@ -0,0 +1,217 @@
+'''
+File: runtime.py
+
+Purpose: asyncio runtime for the main application loop. Sensor reads,
+         publishing, control decisions and relay pulses run as tasks
+         scheduled against monotonic deadlines, so the period does not drift
+         by however long each sensor read or pump pulse takes. Blocking
+         hardware and disk calls run in a thread pool executor, so the event
+         loop keeps its cadence under load.
+
+Date: October 18, 2026
+
+Usage:
+    import src.runtime as runtime
+    rt = runtime.AsyncRuntime(device, publish_sensor_data)
+    rt.run()    # blocks until stop() is called or a task fails
+'''
+
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import src.log as log
+import src.metrics as metrics
+import src.pins as pins
+import src.relay as relay
+import src.scheduler as scheduler
+
+# Time for one sensor cycle: reads, alarm checks, publishing and control decisions
+CYCLE_SECONDS = metrics.histogram('piponic_loop_cycle_seconds', 'Time for one main loop cycle',
+                                  runtime='asyncio')
+
+class AsyncRuntime(object):
+    """Runs the sensing, publishing and control tasks on one asyncio event loop.
+
+    Args:
+        device (Device): the device singleton
+        publish_sensor_data (function): publish_sensor_data(scheduled=False, urgent=False),
+                                        queues the latest readings for publishing
+        min_pH_accuracy (float): without <ph_dosing>, dose for a second when the pH is
+                                 further than this from the target
+        water_level_control (bool): whether to top up the tank when the water level is low
+        actuators (src.actuator.ActuatorService): runs relay pulses, or None to time them on the loop
+        ph_dosing (src.dosing.PHDosingController): works out the length of each pH dose
+        executor (Executor): runs the blocking calls, a small thread pool by default
+        loop (AbstractEventLoop): event loop to run on, a new one by default
+    """
+
+    def __init__(self, device, publish_sensor_data, min_pH_accuracy=0.5,
+                 water_level_control=False, actuators=None, ph_dosing=None,
+                 executor=None, loop=None):
+        self.device = device
+        self.publish_sensor_data = publish_sensor_data
+        self.min_pH_accuracy = min_pH_accuracy
+        self.water_level_control = water_level_control
+        self.actuators = actuators
+        self.ph_dosing = ph_dosing
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=2)
+        self.loop = loop if loop is not None else asyncio.new_event_loop()
+
+        # Pins with a pulse in progress, so pulses on one pin never overlap
+        self.pulsing = set()
+
+        # Deadlines missed because a cycle ran longer than its period
+        self.overruns = {}
+
+        self.sensor_lock = None
+        self.stopped = None
+
+    async def run_blocking(self, function, *args, **kwargs):
+        """Run a blocking call in the executor and wait for its result"""
+        return await self.loop.run_in_executor(self.executor, lambda: function(*args, **kwargs))
+
+    async def every(self, name, period, job):
+        """Run <job>() at a fixed rate, against monotonic deadlines
+
+        Args:
+            name (str): name for overrun statistics
+            period (function): returns the period in seconds, read every cycle
+                               so that configuration changes apply live
+            job (coroutine function): the work to do each cycle
+        """
+        self.overruns[name] = 0
+        deadline = self.loop.time()
+        while True:
+            await job()
+            interval = period()
+            deadline += interval
+            now = self.loop.time()
+            if deadline < now:
+                # Skip the slots we missed instead of running back to back to catch up
+                missed = math.ceil((now - deadline) / interval)
+                deadline += missed * interval
+                self.overruns[name] += missed
+            await asyncio.sleep(deadline - now)
+
+    async def pulse(self, pin, secs):
+        """Turn an active-low relay on for <secs> without blocking the loop"""
+        if pin in self.pulsing:
+            return
+        self.pulsing.add(pin)
+        try:
+            relay.on_pu(pin)
+            await asyncio.sleep(secs)
+        finally:
+            relay.off_pu(pin)
+            self.pulsing.discard(pin)
+
+    def start_pulse(self, pin, secs):
+        """Start a relay pulse, on the actuator service if there is one, otherwise as its own task"""
+        if self.actuators is not None:
+            return self.actuators.pulse(pin, secs)
+        return self.loop.create_task(self.pulse(pin, secs))
+
+    async def read_sensors(self, due_only=False):
+        """Read every sensor, or only those due by their sampling schedule
+
+        Returns:
+            (list) : names of the sensors read
+        """
+        async with self.sensor_lock:
+            if due_only:
+                return await self.run_blocking(self.device.update_due_sensors)
+            await self.run_blocking(self.device.update_sensor_data)
+            return list(scheduler.SENSORS)
+
+    async def sampling_loop(self):
+        """Run a sensor cycle whenever a sensor is due by its own schedule"""
+        while True:
+            await asyncio.sleep(self.device.sampling.time_until_due())
+            await self.sensor_cycle()
+
+    async def sensor_cycle(self):
+        """Read due sensors, publish early if unhealthy, and run the control decisions"""
+        with metrics.timer(CYCLE_SECONDS):
+            await self.run_sensor_cycle()
+
+    async def run_sensor_cycle(self):
+        due = await self.read_sensors(due_only=True)
+        if not due:
+            return
+
+        error_detected = await self.run_blocking(self.device.error_detected)
+        if error_detected:
+            log.warn('Unhealthy sensor readings detected. Publishing update early.')
+        await self.run_blocking(self.publish_sensor_data, urgent=error_detected)
+
+        # Only act on fresh readings, so a stale value is never dosed on twice
+        if 'pH' in due:
+            self.dose_pH()
+
+        if self.water_level_control and 'water_level' in due and self.device.water_level == 0:
+            # If water level is low, turn on solenoid
+            self.start_pulse(pins.Water_level_solenoid, 1)
+
+    def dose_pH(self):
+        """Start a pH dose for the fresh pH reading, if one is needed"""
+        if self.ph_dosing is None:
+            target_ph = self.device.get_config().target_ph
+            if abs(self.device.pH - target_ph) > self.min_pH_accuracy:
+                # Turn on the peristaltic pump
+                self.start_pulse(pins.peristaltic_pump, 1)
+            return
+        if pins.peristaltic_pump in self.pulsing or (
+                self.actuators is not None and self.actuators.busy(pins.peristaltic_pump)):
+            # The last dose is still running
+            return
+        secs = self.ph_dosing.update(self.device.pH, self.loop.time())
+        if secs > 0:
+            self.start_pulse(pins.peristaltic_pump, secs)
+
+    async def publish_cycle(self):
+        """Publish fresh sensor readings at the configured update interval"""
+        await self.read_sensors()
+        await self.run_blocking(self.publish_sensor_data, scheduled=True)
+
+    def publish_interval(self):
+        return self.device.get_config().update_interval_minutes * 60
+
+    async def main(self):
+        self.sensor_lock = asyncio.Lock()
+        self.stopped = asyncio.Event()
+        tasks = [
+            self.loop.create_task(self.every('publish', self.publish_interval, self.publish_cycle)),
+            self.loop.create_task(self.sampling_loop()),
+            self.loop.create_task(self.stopped.wait()),
+        ]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # Re-raise the error of a failed task
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Let cancelled pulses turn their relays off
+            await asyncio.gather(*asyncio.all_tasks(self.loop) - {asyncio.current_task()},
+                                 return_exceptions=True)
+
+    def run(self):
+        """Run until stop() is called or a task raises. Task errors are re-raised."""
+        try:
+            self.loop.run_until_complete(self.main())
+        finally:
+            # The loop may have been interrupted, e.g. by KeyboardInterrupt.
+            # Cancel what is left so that relay pulses still turn their relays off.
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.executor.shutdown(wait=True)
+            self.loop.close()
+
+    def stop(self):
+        """Stop the runtime. Safe to call from any thread."""
+        if self.stopped is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
@@ -0,0 +1,110 @@
+'''
+File: scheduler.py
+
+Purpose: Per-sensor sampling schedules. Each sensor has its own interval
+         and random jitter, set from the device configuration with the keys
+         '<sensor>_interval_secs' and '<sensor>_jitter_secs'. Only sensors
+         that are due get read, so slow-changing signals such as the battery
+         voltage do not cost a bus transaction every cycle. Jitter spreads
+         reads out so that sensors with equal intervals do not always land
+         on the same cycle.
+
+Date: October 18, 2026
+
+Usage:
+    import src.scheduler as scheduler
+    sampling = scheduler.SamplingScheduler(config)
+    due = sampling.due()                # e.g. ['pH', 'leak']
+    sampling.time_until_due()           # seconds until the next sensor is due
+    sampling.configure(new_config)      # apply a config update
+'''
+
+import random
+import time
+from threading import Lock
+
+# Sensors with their own schedule
+SENSORS = ('temperature', 'pH', 'leak', 'water_level', 'battery')
+
+# Default interval and jitter of each sensor, in seconds
+DEFAULT_SCHEDULE = {
+    'temperature': (60, 5),
+    'pH': (60, 5),
+    'leak': (60, 5),
+    'water_level': (60, 5),
+    'battery': (600, 30),
+}
+
+def config_keys(sensor):
+    """Names of the configuration settings for <sensor>'s interval and jitter"""
+    return sensor + '_interval_secs', sensor + '_jitter_secs'
+
+class SamplingScheduler(object):
+    """Tracks when each sensor is next due. Thread-safe.
+
+    Args:
+        config (dict): device configuration with the schedule settings
+        rng (random.Random): source of jitter
+    """
+
+    def __init__(self, config, rng=None):
+        self.lock = Lock()
+        self.rng = rng if rng is not None else random.Random()
+        self.schedule = {}
+        self.next_due = {}
+        self.configure(config)
+
+    def configure(self, config):
+        """Apply the schedule settings in <config>, keeping any setting it lacks
+
+        A sensor whose interval shrank is rescheduled so the change takes
+        effect straight away rather than after the old, longer interval.
+        """
+        now = time.monotonic()
+        with self.lock:
+            for sensor in SENSORS:
+                interval_key, jitter_key = config_keys(sensor)
+                old_interval, old_jitter = self.schedule.get(sensor, DEFAULT_SCHEDULE[sensor])
+                interval = float(config.get(interval_key, old_interval))
+                jitter = float(config.get(jitter_key, old_jitter))
+                if interval <= 0:
+                    raise ValueError('{} must be positive'.format(interval_key))
+                # Jitter larger than the interval could schedule reads in the past
+                jitter = min(max(jitter, 0.0), interval / 2)
+                self.schedule[sensor] = (interval, jitter)
+
+                if sensor not in self.next_due:
+                    # Everything is due on the first cycle
+                    self.next_due[sensor] = now
+                elif self.next_due[sensor] > now + interval + jitter:
+                    self.next_due[sensor] = now + self.jittered(interval, jitter)
+
+    def jittered(self, interval, jitter):
+        return interval + self.rng.uniform(-jitter, jitter)
+
+    def due(self, now=None):
+        """Sensors that are due now, in SENSORS order. Reschedules them.
+
+        Deadlines advance from the previous deadline, not from now, so the
+        average rate stays at the configured interval however late the
+        caller is.
+        """
+        now = time.monotonic() if now is None else now
+        due = []
+        with self.lock:
+            for sensor in SENSORS:
+                if self.next_due[sensor] <= now:
+                    due.append(sensor)
+                    interval, jitter = self.schedule[sensor]
+                    next_due = self.next_due[sensor] + self.jittered(interval, jitter)
+                    if next_due <= now:
+                        # Far behind, e.g. after a long stall: don't read back to back
+                        next_due = now + self.jittered(interval, jitter)
+                    self.next_due[sensor] = next_due
+        return due
+
+    def time_until_due(self, now=None):
+        """Seconds until the next sensor is due, 0 if one is due already"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return max(0.0, min(self.next_due.values()) - now)
@@ -0,0 +1,835 @@
+'''
+File: simulator.py
+
+Date: October 18, 2026
+
+Purpose: Simulated hardware backend for piponic. Provides in-process
+         stand-ins for RPi.GPIO, the ADS1115 ADC (board, busio and
+         adafruit_ads1x15) and the DS18B20 one-wire sysfs tree, plus
+         a virtual clock and a loopback MQTT client. This lets the
+         full main loop run on a plain Linux box, with a simulated
+         day passing in seconds.
+
+         The fake modules are registered in sys.modules, so install()
+         must be called BEFORE any of the src drivers are imported.
+
+Usage:
+         import src.simulator as simulator
+         simulator.install(hours=24)
+
+         import src.device as dev   # now uses the simulated hardware
+         ...
+         print(simulator.report())
+'''
+
+import asyncio
+import math
+import os
+import random
+import selectors
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import deque
+from concurrent.futures import Executor, Future
+from threading import Condition, Lock
+
+# Wall-clock functions, saved before the virtual clock patches the time module
+_real_time = time.time
+_real_monotonic = time.monotonic
+_real_sleep = time.sleep
+
+
+class SimulationFinished(Exception):
+    """Raised from sleep() once the simulated run time has elapsed."""
+
+
+def _ignore_simulation_finished(args, _default_hook=threading.excepthook):
+    """Let background threads end quietly when the simulated run is over."""
+    if not issubclass(args.exc_type, SimulationFinished):
+        _default_hook(args)
+
+
+class VirtualClock(object):
+    """Clock that advances instantly when slept on.
+
+    The thread that installs the clock drives it: its sleeps advance
+    virtual time straight away. Any other thread that sleeps blocks until
+    the driver has advanced virtual time past its deadline, so background
+    threads keep their cadence relative to the simulated time.
+
+    Background threads can also wait on a Condition with a virtual-time
+    timeout through wait_on(). The clock stops at such a deadline on its
+    way past, so timers wake on time even while the driver sleeps longer.
+
+    Listeners are called as fn(now, dt) every time the clock advances,
+    which is how the simulated plant integrates dosing and drift.
+    """
+
+    # Longest real time the driver waits for woken threads to go back to sleep
+    SETTLE_TIMEOUT_SECS = 0.5
+
+    def __init__(self, start=None, duration_secs=None):
+        self.lock = Lock()
+        self.advanced = Condition(self.lock)
+        self.start = _real_time() if start is None else start
+        # Kept apart from the epoch start, which is too large a float to
+        # absorb the sub-microsecond sleeps asyncio makes
+        self.elapsed_secs = 0.0
+        self.duration_secs = duration_secs
+        self.listeners = []
+        self.driver = threading.get_ident()
+
+        # Deadlines (in elapsed seconds) of blocked background threads, and
+        # the threads woken by the last advance that are not asleep again yet
+        self.sleeping = {}
+        self.woken = set()
+        # Conditions that threads in wait_on() are waiting on, and every
+        # thread that has used wait_on()
+        self.waiters = {}
+        self.waiter_threads = {}
+
+    @property
+    def now(self):
+        return self.start + self.elapsed_secs
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.elapsed_secs
+
+    def sleep(self, secs):
+        if secs < 0:
+            raise ValueError('sleep length must be non-negative')
+        if threading.get_ident() == self.driver:
+            self.advance(secs)
+        else:
+            self.wait_until(self.elapsed_secs + secs)
+
+    def wait_until(self, deadline):
+        """Block a background thread until elapsed virtual time reaches <deadline>."""
+        ident = threading.get_ident()
+        with self.advanced:
+            self.woken.discard(ident)
+            self.sleeping[ident] = deadline
+            self.advanced.notify_all()
+            while self.elapsed_secs < deadline and not self.finished():
+                self.advanced.wait()
+            del self.sleeping[ident]
+        if self.finished():
+            raise SimulationFinished()
+
+    def wait_on(self, condition, timeout=None):
+        """Condition.wait() for a background thread, with <timeout> in virtual time
+
+        Call with <condition> held, like Condition.wait().
+
+        Returns:
+            (bool) : False if the timeout passed, True if notified first
+        """
+        ident = threading.get_ident()
+        with self.advanced:
+            # Without a timeout the deadline is never reached, but the thread
+            # still counts as asleep, see advance()
+            deadline = math.inf if timeout is None else self.elapsed_secs + timeout
+            self.woken.discard(ident)
+            self.sleeping[ident] = deadline
+            self.waiters[ident] = condition
+            self.waiter_threads[ident] = threading.current_thread()
+            self.advanced.notify_all()
+        try:
+            # Notified by the owner of <condition>, or by advance() at the deadline
+            condition.wait()
+        finally:
+            with self.advanced:
+                self.sleeping.pop(ident, None)
+                self.waiters.pop(ident, None)
+        if self.finished():
+            raise SimulationFinished()
+        return self.elapsed_secs < deadline
+
+    def waiting_on_condition(self, ident):
+        """Whether thread <ident> is parked in wait_on(). Call with self.advanced held.
+
+        A notified thread is still in self.sleeping until it runs again, so
+        this also checks that its condition has not released it. This relies
+        on CPython's Condition keeping its waiters in _waiters.
+        """
+        condition = self.waiters.get(ident)
+        if condition is None or ident not in self.sleeping:
+            return False
+        registered = sum(1 for other in self.sleeping if self.waiters.get(other) is condition)
+        return len(condition._waiters) >= registered
+
+    def advance(self, secs):
+        target = self.elapsed_secs + secs
+        with self.advanced:
+            # A condition waiter notified by another thread may be about to set a
+            # new deadline. Let it get back to wait_on() before moving time on.
+            self.advanced.wait_for(lambda: all(
+                self.waiting_on_condition(ident) or not thread.is_alive()
+                for ident, thread in self.waiter_threads.items()), self.SETTLE_TIMEOUT_SECS)
+        while True:
+            # Stop at the deadline of every condition waiter on the way
+            with self.advanced:
+                deadlines = [deadline for ident, deadline in self.sleeping.items()
+                             if ident in self.waiters and self.elapsed_secs < deadline < target]
+            if not deadlines:
+                break
+            self.advance_to(min(deadlines))
+        self.advance_to(target)
+
+    def advance_to(self, elapsed_secs):
+        secs = elapsed_secs - self.elapsed_secs
+        for listener in self.listeners:
+            listener(self.start + elapsed_secs, secs)
+
+        with self.advanced:
+            self.elapsed_secs = elapsed_secs
+            woken = set(ident for ident, deadline in self.sleeping.items()
+                        if deadline <= elapsed_secs or self.finished())
+            self.woken.update(woken)
+            conditions = [self.waiters[ident] for ident in woken if ident in self.waiters]
+            self.advanced.notify_all()
+
+        # Not under self.advanced, waiters hold their condition while taking it
+        for condition in conditions:
+            with condition:
+                condition.notify_all()
+
+        with self.advanced:
+            # Let the woken threads do their work before time moves on again
+            self.advanced.wait_for(lambda: not self.woken, self.SETTLE_TIMEOUT_SECS)
+            self.woken.clear()
+
+        if self.finished():
+            raise SimulationFinished()
+
+    def elapsed(self):
+        return self.elapsed_secs
+
+    def finished(self):
+        return (self.duration_secs is not None and
+                self.elapsed() >= self.duration_secs)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def install(self):
+        """Patch the time module so every caller of time.sleep() etc. uses this clock."""
+        self.driver = threading.get_ident()
+        threading.excepthook = _ignore_simulation_finished
+        time.time = self.time
+        time.monotonic = self.monotonic
+        time.sleep = self.sleep
+
+
+class FakeGPIO(object):
+    """In-process stand-in for the RPi.GPIO module."""
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.lock = Lock()
+        self.mode = None
+        self.modes = {}
+        self.levels = {}
+        self.switch_counts = {}
+        self.output_calls = 0
+        self.event_callbacks = {}
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def getmode(self):
+        return self.mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        with self.lock:
+            if self.mode is None:
+                raise RuntimeError('Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) or GPIO.setmode(GPIO.BCM)')
+            self.modes[pin] = direction
+            if direction == self.IN:
+                self.levels.setdefault(pin, self.HIGH if pull_up_down == self.PUD_UP else self.LOW)
+            elif initial is not None:
+                self.levels[pin] = int(bool(initial))
+
+    def output(self, pin, value):
+        # Like RPi.GPIO, takes a list of pins with one value or a list of values
+        pins = list(pin) if isinstance(pin, (list, tuple)) else [pin]
+        values = list(value) if isinstance(value, (list, tuple)) else [value] * len(pins)
+        if len(values) != len(pins):
+            raise RuntimeError('Number of channels != number of values')
+        with self.lock:
+            if any(self.modes.get(p) != self.OUT for p in pins):
+                raise RuntimeError('The GPIO channel has not been set up as an OUTPUT')
+            self.output_calls += 1
+            for p, v in zip(pins, values):
+                v = int(bool(v))
+                if self.levels.get(p) != v:
+                    self.switch_counts[p] = self.switch_counts.get(p, 0) + 1
+                self.levels[p] = v
+
+    def input(self, pin):
+        with self.lock:
+            if pin not in self.modes:
+                raise RuntimeError('You must setup() the GPIO channel first')
+            return self.levels.get(pin, self.LOW)
+
+    def drive_input(self, pin, value):
+        """Set the level seen on an input pin, firing any registered edge callbacks."""
+        with self.lock:
+            old = self.levels.get(pin, self.LOW)
+            value = int(bool(value))
+            self.levels[pin] = value
+            callbacks = list(self.event_callbacks.get(pin, ()))
+        for edge, callback in callbacks:
+            if old != value and (edge == self.BOTH or
+                                 (edge == self.RISING and value) or
+                                 (edge == self.FALLING and not value)):
+                callback(pin)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        with self.lock:
+            self.event_callbacks[pin] = []
+            if callback is not None:
+                self.event_callbacks[pin].append((edge, callback))
+
+    def add_event_callback(self, pin, callback):
+        with self.lock:
+            edge = self.event_callbacks[pin][0][0] if self.event_callbacks.get(pin) else self.BOTH
+            self.event_callbacks.setdefault(pin, []).append((edge, callback))
+
+    def remove_event_detect(self, pin):
+        with self.lock:
+            self.event_callbacks.pop(pin, None)
+
+    def cleanup(self, pin=None):
+        with self.lock:
+            pins = [pin] if pin is not None else list(self.modes)
+            for p in pins:
+                self.modes.pop(p, None)
+                self.event_callbacks.pop(p, None)
+            if pin is None:
+                # Like RPi.GPIO, a full cleanup forgets the numbering mode too
+                self.mode = None
+
+    def is_output_low(self, pin):
+        with self.lock:
+            return self.modes.get(pin) == self.OUT and self.levels.get(pin) == self.LOW
+
+
+class Plant(object):
+    """Very small model of an aquaponic tank, driven by the relays.
+
+    Relays are active low, as wired in src/pins.py: a LOW output means
+    the pump or solenoid is running.
+    """
+
+    # Inverse of the probe calibration shipped in src/pH_calibration_values.txt
+    PROBE_OFFSET_VOLTS = 1.507
+    PROBE_SLOPE = -5.91
+
+    # Plant dynamics, per second
+    PH_DRIFT = -0.05 / 3600       # nitrification slowly acidifies the water
+    PH_DOSE_RATE = 0.02           # pH rise per second of peristaltic pumping
+    PH_MIX_DELAY_SECS = 120       # time for a dose to mix through to the probe
+    EVAPORATION = -0.005 / 3600   # fraction of the tank lost per second
+    FILL_RATE = 0.01              # fraction of the tank added per second of solenoid
+
+    def __init__(self, gpio, pump_pin, solenoid_pin, water_level_pin, seed=None):
+        self.gpio = gpio
+        self.pump_pin = pump_pin
+        self.solenoid_pin = solenoid_pin
+        self.water_level_pin = water_level_pin
+        self.random = random.Random(seed)
+
+        self.pH = 6.8
+        self.temperature = 20.0
+        self.water_fraction = 0.8
+        self.battery_volts = 3.7
+        self.leak_volts = 0.02
+        self.internal_leak_volts = 0.02
+        self.noise_volts = 0.002
+
+        self.relay_on_secs = {pump_pin: 0.0, solenoid_pin: 0.0}
+        self.pH_min = self.pH_max = self.pH
+        # Doses still mixing in, as (time they reach the probe, pH change)
+        self.mixing = deque()
+
+    def step(self, now, dt):
+        if dt < 0:
+            return
+        pump_on = self.gpio.is_output_low(self.pump_pin)
+        solenoid_on = self.gpio.is_output_low(self.solenoid_pin)
+
+        self.pH += self.PH_DRIFT * dt
+        if pump_on:
+            self.mixing.append((now + self.PH_MIX_DELAY_SECS, self.PH_DOSE_RATE * dt))
+            self.relay_on_secs[self.pump_pin] += dt
+        while self.mixing and self.mixing[0][0] <= now:
+            self.pH += self.mixing.popleft()[1]
+        self.pH_min = min(self.pH_min, self.pH)
+        self.pH_max = max(self.pH_max, self.pH)
+
+        self.water_fraction += self.EVAPORATION * dt
+        if solenoid_on:
+            self.water_fraction += self.FILL_RATE * dt
+            self.relay_on_secs[self.solenoid_pin] += dt
+        if self.leak_volts > 0.25:
+            self.water_fraction -= 0.001 * dt
+        self.water_fraction = min(max(self.water_fraction, 0.0), 1.0)
+
+        # Daily temperature swing, coldest at midnight
+        self.temperature = 20.0 - 3.0 * math.cos(2 * math.pi * (now % 86400) / 86400)
+
+        if self.water_level_pin in self.gpio.modes:
+            self.gpio.drive_input(self.water_level_pin, self.water_fraction > 0.5)
+
+    def channel_volts(self, channel):
+        """Voltage seen on ADS1115 input <channel>."""
+        if channel == 0:
+            volts = self.leak_volts
+        elif channel == 1:
+            volts = self.PROBE_OFFSET_VOLTS + (self.pH - 7.0) / self.PROBE_SLOPE
+        elif channel == 2:
+            volts = self.battery_volts
+        else:
+            volts = self.internal_leak_volts
+        return volts + self.random.gauss(0, self.noise_volts)
+
+
+class FakeADS1115(object):
+    """Stand-in for adafruit_ads1x15.ads1115.ADS1115.
+
+    Besides single-shot reads through FakeAnalogIn, it models the config,
+    conversion and threshold registers, so continuous mode with the
+    ALERT/RDY pin works: while converting, each advance of the clock
+    pulses <alert_pin> low once per finished conversion.
+    """
+
+    # GPIO the ALERT/RDY output is wired to, set by install()
+    alert_pin = None
+
+    # Cap on conversions simulated per clock advance, to keep long sleeps cheap
+    MAX_CONVERSIONS_PER_ADVANCE = 64
+
+    DATA_RATES = {0x0000: 8, 0x0020: 16, 0x0040: 32, 0x0060: 64,
+                  0x0080: 128, 0x00A0: 250, 0x00C0: 475, 0x00E0: 860}
+    FULL_SCALE_VOLTS = {0x0000: 6.144, 0x0200: 4.096, 0x0400: 2.048,
+                        0x0600: 1.024, 0x0800: 0.512, 0x0A00: 0.256}
+
+    def __init__(self, i2c, gain=1, data_rate=None, mode=None, address=0x48):
+        self.i2c = i2c
+        self.gain = gain
+        self.data_rate = 128 if data_rate is None else data_rate
+        self.mode = mode
+        self.address = address
+        self.conversions = 0
+        self.registers = {0: 0, 1: 0x8583, 2: 0x8000, 3: 0x7FFF}
+        self._last_pin_read = None
+        self.pending = 0.0
+        _state.clock.add_listener(self.tick)
+
+    def read_volts(self, channel):
+        self.conversions += 1
+        return _state.plant.channel_volts(channel)
+
+    def _write_register(self, reg, value):
+        self.registers[reg] = value & 0xFFFF
+
+    def _read_register(self, reg, fast=False):
+        return self.registers[reg]
+
+    def continuous(self):
+        config = self.registers[1]
+        return (not config & 0x0100 and config & 0x0003 != 0x0003 and
+                self.registers[3] & 0x8000 and not self.registers[2] & 0x8000)
+
+    def tick(self, now, dt):
+        if not self.continuous() or self.alert_pin is None:
+            self.pending = 0.0
+            return
+        self.pending += dt * self.DATA_RATES[self.registers[1] & 0x00E0]
+        conversions = min(int(self.pending), self.MAX_CONVERSIONS_PER_ADVANCE)
+        self.pending -= int(self.pending)
+        for i in range(conversions):
+            config = self.registers[1]
+            channel = ((config >> 12) & 0x7) - 4
+            full_scale = self.FULL_SCALE_VOLTS[config & 0x0E00]
+            code = int(round(self.read_volts(channel) / full_scale * 32768))
+            self.registers[0] = max(-32768, min(32767, code)) & 0xFFFF
+            _state.gpio.drive_input(self.alert_pin, 0)
+            _state.gpio.drive_input(self.alert_pin, 1)
+
+
+class FakeAnalogIn(object):
+    """Stand-in for adafruit_ads1x15.analog_in.AnalogIn."""
+
+    def __init__(self, ads, positive_pin, negative_pin=None):
+        self.ads = ads
+        self.pin = positive_pin
+
+    @property
+    def voltage(self):
+        return self.ads.read_volts(self.pin)
+
+    @property
+    def value(self):
+        return int(self.voltage / 4.096 * 32767)
+
+
+class FakeOneWire(object):
+    """Temporary directory laid out like /sys/bus/w1/devices with DS18B20s.
+
+    The first probe is in the plant's tank. The second one, for trying
+    out a topology with a second tank, reads a degree warmer.
+    """
+
+    DEVICE_ID = '28-00000000513d'
+    DEVICE_IDS = (DEVICE_ID, '28-00000000e2f1')
+
+    def __init__(self, plant, data_dir):
+        self.plant = plant
+        self.root = os.path.join(data_dir, 'w1')
+        self.slave_files = []
+        for device_id in self.DEVICE_IDS:
+            os.makedirs(os.path.join(self.root, device_id))
+            self.slave_files.append(os.path.join(self.root, device_id, 'w1_slave'))
+        self.slave_file = self.slave_files[0]
+        self.refresh()
+
+    def refresh(self, now=None, dt=None):
+        for offset, slave_file in enumerate(self.slave_files):
+            millidegrees = int(round((self.plant.temperature + offset) * 1000))
+            with open(slave_file, 'w') as f:
+                f.write('72 01 4b 46 7f ff 0e 10 57 : crc=57 YES\n')
+                f.write('72 01 4b 46 7f ff 0e 10 57 t={}\n'.format(millidegrees))
+
+
+
+class LoopbackPublishInfo(object):
+    """Mimics paho's MQTTMessageInfo for an immediately acked message."""
+
+    def __init__(self, mid, rc=0):
+        self.mid = mid
+        self.rc = rc
+
+    def is_published(self):
+        return self.rc == 0
+
+    def wait_for_publish(self, timeout=None):
+        return True
+
+
+class LoopbackClient(object):
+    """Minimal paho.mqtt.client.Client replacement that never leaves the process.
+
+    Publishes are acked straight away and kept in self.published.
+    set_online(False) simulates a network outage: the connection drops and
+    connection attempts are refused until set_online(True).
+    """
+
+    # paho's MQTT_ERR_NO_CONN
+    ERR_NO_CONN = 4
+
+    def __init__(self, client_id='', userdata=None):
+        self.client_id = client_id
+        self.userdata = userdata
+        self.next_mid = 1
+        self.published = []
+        self.subscriptions = []
+        self.online = True
+        self.connected = False
+        # Like paho, on_connect is called from the network loop once connected
+        self.connack_pending = False
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_publish = None
+        self.on_subscribe = None
+        self.on_message = None
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def tls_set(self, *args, **kwargs):
+        pass
+
+    def connect(self, host, port=1883, keepalive=60):
+        if not self.online:
+            raise ConnectionRefusedError('simulated network outage')
+        self.connected = True
+        self.connack_pending = True
+        return 0
+
+    def reconnect(self):
+        return self.connect(None)
+
+    def loop(self, timeout=1.0):
+        """One pass of the network loop: sleeps for <timeout> while connected"""
+        if self.connected and self.connack_pending:
+            self.connack_pending = False
+            if self.on_connect:
+                self.on_connect(self, self.userdata, {}, 0)
+        if not self.connected:
+            return self.ERR_NO_CONN
+        time.sleep(timeout)
+        return 0 if self.connected else self.ERR_NO_CONN
+
+    def loop_start(self):
+        if self.connected and self.connack_pending:
+            self.connack_pending = False
+            if self.on_connect:
+                self.on_connect(self, self.userdata, {}, 0)
+
+    def loop_stop(self, force=False):
+        pass
+
+    def disconnect(self):
+        was_connected, self.connected = self.connected, False
+        self.connack_pending = False
+        if was_connected and self.on_disconnect:
+            self.on_disconnect(self, self.userdata, 0)
+        return 0 if was_connected else self.ERR_NO_CONN
+
+    def subscribe(self, topic, qos=0):
+        mid = self._mid()
+        self.subscriptions.append((topic, qos))
+        if self.on_subscribe:
+            self.on_subscribe(self, self.userdata, mid, (qos,))
+        return 0, mid
+
+    def set_online(self, online):
+        """Drop or restore the simulated link. After an outage the client has to reconnect."""
+        self.online = online
+        if not online and self.connected:
+            self.connected = False
+            self.connack_pending = False
+            if self.on_disconnect:
+                # Same rc paho reports for a lost connection
+                self.on_disconnect(self, self.userdata, 7)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        mid = self._mid()
+        if not self.connected:
+            return LoopbackPublishInfo(mid, self.ERR_NO_CONN)
+        self.published.append((time.time(), topic, payload))
+        if self.on_publish:
+            self.on_publish(self, self.userdata, mid)
+        return LoopbackPublishInfo(mid)
+
+    def deliver(self, topic, payload, qos=1):
+        """Inject a message as if it had arrived from the MQTT bridge."""
+        message = types.SimpleNamespace(topic=topic, payload=payload.encode('utf-8'), qos=qos)
+        if self.on_message:
+            self.on_message(self, self.userdata, message)
+
+    def _mid(self):
+        mid = self.next_mid
+        self.next_mid += 1
+        return mid
+
+
+class VirtualSelector(selectors.DefaultSelector):
+    """Selector for an asyncio loop on the virtual clock.
+
+    Instead of blocking until the next timer is due, it advances the
+    virtual clock by the timeout. File descriptors are still polled.
+    """
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout is None or timeout <= 0:
+            return events
+        _state.clock.sleep(timeout)
+        return super().select(0)
+
+
+class InlineExecutor(Executor):
+    """Runs submitted calls straight away on the calling thread.
+
+    In simulation the blocking calls are fast, and running them inline
+    keeps them ordered with the virtual clock.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def new_event_loop():
+    """asyncio event loop whose timers run on the virtual clock"""
+    return asyncio.SelectorEventLoop(VirtualSelector())
+
+
+class _SimulatorState(object):
+    def __init__(self):
+        self.clock = None
+        self.gpio = None
+        self.plant = None
+        self.one_wire = None
+        self.data_dir = None
+        self.client = None
+        self.wall_start = None
+
+
+_state = _SimulatorState()
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+def _gpio_module(gpio):
+    module = types.ModuleType('RPi.GPIO')
+    for name in dir(gpio):
+        if not name.startswith('_'):
+            setattr(module, name, getattr(gpio, name))
+    return module
+
+
+class _FakeLED(object):
+    """Stand-in for gpiozero.LED."""
+
+    def __init__(self, pin, *args, **kwargs):
+        self.pin = pin
+        self.is_lit = False
+
+    def on(self):
+        self.is_lit = True
+
+    def off(self):
+        self.is_lit = False
+
+
+def install(hours=None, seed=None):
+    """Register the simulated hardware and start the virtual clock.
+
+    Args:
+        hours (float): simulated run time, after which sleeping raises
+                       SimulationFinished. None runs forever.
+        seed (int): seed for the sensor noise, for repeatable runs
+    """
+    if _state.clock is not None:
+        return
+
+    import src.pins as pins
+
+    duration_secs = None if hours is None else hours * 3600
+    _state.clock = VirtualClock(duration_secs=duration_secs)
+    _state.gpio = FakeGPIO(_state.clock)
+    _state.plant = Plant(_state.gpio, pins.peristaltic_pump,
+                         pins.Water_level_solenoid, pins.WATER_LEVEL, seed=seed)
+    _state.plant.step(_state.clock.now, 0)
+    _state.data_dir = tempfile.mkdtemp(prefix='piponic-sim-')
+    _state.one_wire = FakeOneWire(_state.plant, _state.data_dir)
+    _state.wall_start = _real_monotonic()
+
+    _state.clock.add_listener(_state.plant.step)
+    _state.clock.add_listener(_state.one_wire.refresh)
+
+    FakeADS1115.alert_pin = pins.ADC0_ALERT_RDY
+
+    gpio_module = _gpio_module(_state.gpio)
+    ads1115_module = _module('adafruit_ads1x15.ads1115', ADS1115=FakeADS1115,
+                             P0=0, P1=1, P2=2, P3=3, Mode=types.SimpleNamespace(
+                                 CONTINUOUS=0x0000, SINGLE=0x0100))
+    analog_in_module = _module('adafruit_ads1x15.analog_in', AnalogIn=FakeAnalogIn)
+    ads1x15_module = _module('adafruit_ads1x15.ads1x15', Mode=ads1115_module.Mode)
+    sys.modules.update({
+        'RPi': _module('RPi', GPIO=gpio_module),
+        'RPi.GPIO': gpio_module,
+        'board': _module('board', SCL=pins.I2C_SCL, SDA=pins.I2C_SDA),
+        'busio': _module('busio', I2C=lambda scl, sda, frequency=100000: (scl, sda)),
+        'adafruit_ads1x15': _module('adafruit_ads1x15', ads1115=ads1115_module,
+                                    analog_in=analog_in_module, ads1x15=ads1x15_module),
+        'adafruit_ads1x15.ads1x15': ads1x15_module,
+        'adafruit_ads1x15.ads1115': ads1115_module,
+        'adafruit_ads1x15.analog_in': analog_in_module,
+        'gpiozero': _module('gpiozero', LED=_FakeLED),
+    })
+
+    import src.temp as temp
+    temp.W1_DEVICES_DIR = _state.one_wire.root
+    temp.LOAD_KERNEL_MODULES = False
+
+    # Relay pulse timers run on the virtual clock
+    import src.actuator as actuator
+    actuator.wait = _state.clock.wait_on
+
+    _state.clock.install()
+
+
+def create_client(client_id=''):
+    """Create the loopback MQTT client used in place of paho in simulation."""
+    _state.client = LoopbackClient(client_id=client_id)
+    return _state.client
+
+
+def clock():
+    return _state.clock
+
+
+def plant():
+    return _state.plant
+
+
+def gpio():
+    return _state.gpio
+
+
+def data_dir():
+    """Scratch directory for files a simulated run writes, removed by uninstall()"""
+    return _state.data_dir
+
+
+def report():
+    """Human readable summary of a simulated run."""
+    wall_secs = _real_monotonic() - _state.wall_start
+    sim_hours = _state.clock.elapsed() / 3600
+    lines = ['Simulated {:.2f} hours in {:.2f} wall-clock seconds'.format(sim_hours, wall_secs)]
+    if _state.client is not None:
+        published = len(_state.client.published)
+        lines.append('Telemetry messages published: {}'.format(published))
+        if published:
+            lines.append('Wall-clock time per publish: {:.2f} ms'.format(
+                1000 * wall_secs / published))
+    lines.append('pH range: {:.2f} - {:.2f} (now {:.2f})'.format(
+        _state.plant.pH_min, _state.plant.pH_max, _state.plant.pH))
+    lines.append('Water level: {:.0f}%'.format(100 * _state.plant.water_fraction))
+    for pin, secs in sorted(_state.plant.relay_on_secs.items()):
+        lines.append('Relay on GPIO{}: {:.0f} s on, {} switches'.format(
+            pin, secs, _state.gpio.switch_counts.get(pin, 0)))
+    return '\n'.join(lines)
+
+
+def uninstall():
+    """Remove the simulator's scratch files. The time module stays patched."""
+    if _state.data_dir is not None:
+        shutil.rmtree(_state.data_dir, ignore_errors=True)
+        _state.data_dir = None
@@ -0,0 +1,112 @@
+'''
+File: startup.py
+
+Purpose: Time to first telemetry after a power cycle. Each startup phase
+         is marked as it finishes, so that --profile_startup can show where
+         a cold start spends its time, from the kernel starting the process
+         to the bridge acking the first message. Once the first message is
+         acked, systemd is told the service is ready over the sd_notify
+         protocol, so `systemctl start` and units ordered after piponic wait
+         until the Pi is actually back on the dashboard.
+
+Date: October 18, 2026
+
+Usage:
+    import src.startup as startup
+    startup.mark('imports')         # at the end of each phase, the first time
+    startup.ready()                 # on the first ack, safe to call again
+    startup.report()                # [(phase, seconds since start, seconds in phase), ...]
+'''
+
+import os
+import socket
+import time
+from threading import Lock
+
+# perf_counter, so the simulator's virtual clock does not hide a slow start
+_started = time.perf_counter()
+
+_lock = Lock()
+_phases = []          # (name, perf_counter when it finished)
+_ready = False
+
+# Called with the phases when ready() is first called, see on_ready()
+_listeners = []
+
+def process_age_secs():
+    """Seconds since the kernel started this process, None if unknown (not Linux)"""
+    try:
+        with open('/proc/self/stat') as stat_file:
+            # The command name may contain spaces, the fields after it do not
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        # Field 22 of stat, the start time in clock ticks after boot
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+# Time the interpreter took to get to this module, measured once at import
+_interpreter_secs = process_age_secs()
+
+def mark(name):
+    """Record that the startup phase <name> has just finished, the first time it does"""
+    with _lock:
+        # Only the first time, so phases can be marked from inside loops
+        if not _ready and all(phase != name for phase, finished in _phases):
+            _phases.append((name, time.perf_counter()))
+
+def report():
+    """The phases so far, as (name, seconds since the process started, seconds in the phase)
+
+    Seconds are counted from this module's import if the process start time is unknown.
+    """
+    offset = _interpreter_secs or 0.0
+    rows = []
+    if _interpreter_secs is not None:
+        rows.append(('interpreter', offset, offset))
+    with _lock:
+        previous = _started
+        for name, finished in _phases:
+            rows.append((name, offset + finished - _started, finished - previous))
+            previous = finished
+    return rows
+
+def on_ready(listener):
+    """Call listener(report()) once, when ready() is first called"""
+    with _lock:
+        _listeners.append(listener)
+
+def ready():
+    """Mark the first message as acked and tell systemd the service is up. Only the first call counts."""
+    global _ready
+    with _lock:
+        if _ready:
+            return
+        _phases.append(('first_publish_acked', time.perf_counter()))
+        _ready = True
+        listeners = list(_listeners)
+    notify('READY=1')
+    rows = report()
+    for listener in listeners:
+        listener(rows)
+
+def notify(state):
+    """Send <state> to systemd, e.g. 'READY=1'. Does nothing unless run by systemd with Type=notify.
+
+    Returns:
+        (bool) : whether the message was sent
+    """
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        # Abstract socket namespace
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode('utf-8'))
+        return True
+    except OSError:
+        return False
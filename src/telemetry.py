@@ -0,0 +1,151 @@
+'''
+File: telemetry.py
+
+Purpose: Compact binary encoding that packs many sensor samples into one
+         telemetry message. A JSON document costs ~190 bytes per sample plus
+         MQTT, TLS and Cloud IoT overhead per message; a batch of 10 samples
+         in this format is 138 bytes.
+
+Date: October 18, 2026
+
+Format (version 1), all fields big-endian:
+
+    Header, 8 bytes
+        uint8   version         (1)
+        uint8   reserved        (0)
+        uint16  sample count N
+        uint32  base timestamp  (seconds since the epoch)
+
+    N records, 13 bytes each
+        uint16  seconds since the previous sample (the base timestamp for the first)
+        int16   temperature     (0.01 C, -32768 if missing)
+        uint16  pH              (0.001 pH, 65535 if missing)
+        uint16  leak            (mV, 65535 if missing)
+        int8    water_level     (0 or 1, -1 if the read failed)
+        uint16  battery_voltage (mV, 65535 if missing)
+        uint16  internal_leak   (mV, 65535 if missing)
+
+Usage:
+    import src.telemetry as telemetry
+    batcher = telemetry.TelemetryBatcher(batch_size=10)
+    payload = batcher.add(time.time(), (temperature, pH, leak, water_level, battery, internal_leak))
+    if payload is not None:
+        client.publish(topic, payload)
+    telemetry.decode(payload)   # [(timestamp, values), ...]
+'''
+
+import struct
+
+import src.log as log
+
+VERSION = 1
+
+HEADER = struct.Struct('!BBHI')
+RECORD = struct.Struct('!HhHHbHH')
+
+# Order of the values in each record, matches src.device.SENSOR_METRICS
+FIELDS = ('temperature', 'pH', 'leak', 'water_level', 'battery_voltage', 'internal_leak')
+
+# Largest gap between two samples that fits in a record
+MAX_DELTA_SECS = 0xFFFF
+
+INT16_MISSING = -0x8000
+UINT16_MISSING = 0xFFFF
+
+def _fixed(value, scale, low, high, missing):
+    """Scale <value> to an integer field, clamped to [low, high]"""
+    if value is None or value != value:
+        return missing
+    return max(low, min(high, int(round(value * scale))))
+
+def _float(value, scale, missing):
+    return None if value == missing else value / scale
+
+def encode_record(delta_secs, values):
+    temperature, pH, leak, water_level, battery_voltage, internal_leak = values
+    return RECORD.pack(
+        delta_secs,
+        _fixed(temperature, 100, -0x7FFF, 0x7FFF, INT16_MISSING),
+        _fixed(pH, 1000, 0, 0xFFFE, UINT16_MISSING),
+        _fixed(leak, 1000, 0, 0xFFFE, UINT16_MISSING),
+        -1 if water_level is None or water_level < 0 else int(bool(water_level)),
+        _fixed(battery_voltage, 1000, 0, 0xFFFE, UINT16_MISSING),
+        _fixed(internal_leak, 1000, 0, 0xFFFE, UINT16_MISSING))
+
+def encode(samples):
+    """Pack [(timestamp, values), ...] into one payload. Timestamps must be non-decreasing."""
+    if not samples:
+        raise ValueError('Cannot encode an empty batch')
+    base = int(samples[0][0])
+    parts = [HEADER.pack(VERSION, 0, len(samples), base)]
+    previous = base
+    for timestamp, values in samples:
+        timestamp = int(timestamp)
+        delta = timestamp - previous
+        if not 0 <= delta <= MAX_DELTA_SECS:
+            raise ValueError('Samples must be in order and at most {} s apart'.format(MAX_DELTA_SECS))
+        parts.append(encode_record(delta, values))
+        previous = timestamp
+    return b''.join(parts)
+
+def decode(payload):
+    """Unpack a payload made by encode() into [(timestamp, values), ...]"""
+    version, reserved, count, timestamp = HEADER.unpack_from(payload, 0)
+    if version != VERSION:
+        raise ValueError('Unsupported telemetry version: {}'.format(version))
+    samples = []
+    offset = HEADER.size
+    for i in range(count):
+        (delta, temperature, pH, leak, water_level,
+         battery_voltage, internal_leak) = RECORD.unpack_from(payload, offset)
+        offset += RECORD.size
+        timestamp += delta
+        samples.append((timestamp, (
+            _float(temperature, 100, INT16_MISSING),
+            _float(pH, 1000, UINT16_MISSING),
+            _float(leak, 1000, UINT16_MISSING),
+            water_level,
+            _float(battery_voltage, 1000, UINT16_MISSING),
+            _float(internal_leak, 1000, UINT16_MISSING))))
+    return samples
+
+class TelemetryBatcher(object):
+    """Collects samples and hands back an encoded payload once a batch is ready.
+
+    A batch is ready when it holds <batch_size> samples, or when its oldest
+    sample is <max_age_secs> old.
+    """
+
+    def __init__(self, batch_size=10, max_age_secs=30*60):
+        self.batch_size = batch_size
+        self.max_age_secs = max_age_secs
+        self.samples = []
+
+    def add(self, timestamp, values):
+        """Add a sample. Returns the encoded batch if it is now ready, otherwise None"""
+        if self.samples and not 0 <= int(timestamp) - int(self.samples[-1][0]) <= MAX_DELTA_SECS:
+            # Too far apart for one record, or the clock stepped back, e.g. when
+            # NTP first syncs a Pi without an RTC. Send what we have and start again
+            payload = self.flush()
+            self.samples.append((timestamp, tuple(values)))
+            return payload
+        self.samples.append((timestamp, tuple(values)))
+        if (len(self.samples) >= self.batch_size or
+                timestamp - self.samples[0][0] >= self.max_age_secs):
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Encode and clear whatever is batched. Returns None if empty, or if it could not be encoded"""
+        samples, self.samples = self.samples, []
+        if not samples:
+            return None
+        try:
+            return encode(samples)
+        except (ValueError, struct.error) as e:
+            # Dropped, so one bad sample does not block every batch after it
+            log.error('Could not encode telemetry batch', samples=len(samples), error=e)
+            return None
+
+    def __len__(self):
+        return len(self.samples)
@@ -3,56 +3,288 @@ file: temp.py
 author: Carson Berry <carsonberry@hotmail.ca>
 Date: January 30th, 2021
 
-Purpose: To read data from the one-wire interface of the DS18B20 temperature sensor on teh raspberry pi. 
+Purpose: To read data from the one-wire interface of the DS18B20 temperature sensor on teh raspberry pi.
 This file is designed to be used in a obj oriented way, such as temp.read()
 
+Each DS18B20 conversion takes about 750 ms, so conversions run on a background
+thread. read() never waits on the sensor: it returns the last good reading
+straight away. The probe is found once and the kernel modules are loaded once.
+
+Several probes can share the one-wire bus, e.g. one per tank. They are
+named by their ID, such as '28-3c01b556d3de'. The one background thread
+converts every probe in turn, so only one conversion is on the bus at a
+time. A probe ID of None means the first probe found, as before.
+
 inputs: null
 outputs: float temp
 
 Usage:
 import temp
 python temp.read()
+temp_c, age_secs = temp.read_with_age()
+temp.list_devices()                 # IDs of every probe on the bus
+temp.read('28-3c01b556d3de')        # one probe of several
+temp.unwatch('28-3c01b556d3de')     # stop converting a probe no tank uses
 '''
 
-import os 
+import os
 import glob
 import time
+from threading import Event, Lock, Thread
+
+import src.log as log
+import src.metrics as metrics
 
 
 
-#name of specific temperature sensor in given system. Should try and automate this process. 
+#name of specific temperature sensor in given system. Should try and automate this process.
 #temp_sensor = '/sys/bus/w1/devices/28-3c01b556d3de/w1_slave'
 
-#Read from the file where the temperature information is stored for this device.
-def temp_raw():
-    try: 
+# Where the one-wire bus exposes its devices. The simulator points this at a fake tree.
+W1_DEVICES_DIR = '/sys/bus/w1/devices'
+
+# Whether to load the one-wire kernel modules before reading
+LOAD_KERNEL_MODULES = True
+
+# Time between the start of one conversion and the next
+READ_INTERVAL_SECS = 2
+
+# Number of failed CRC checks in a row before a conversion is abandoned
+MAX_CRC_RETRIES = 5
+
+# A reading older than this is treated as a sensor error by read()
+STALE_AFTER_SECS = 60
+
+# How long read() waits for a probe's first conversion after it is watched.
+# Later reads never wait, even if that conversion failed
+FIRST_READ_TIMEOUT_SECS = 2
+
+# Time taken by read(), which should never wait on the sensor
+READ_SECONDS = metrics.histogram('piponic_temperature_read_seconds', 'Time taken by temp.read()')
+
+# Cached paths of the probes' w1_slave files by probe ID, found once by find_device()
+_device_files = {}
+_kernel_modules_loaded = False
+_discovery_lock = Lock()
+
+def load_kernel_modules():
+    """Load the one-wire kernel modules, once per process."""
+    global _kernel_modules_loaded
+    if LOAD_KERNEL_MODULES and not _kernel_modules_loaded:
         os.system('modprobe w1-gpio')
         os.system('modprobe w1-therm')
-        temp_dir = '/sys/bus/w1/devices/28-*/w1_slave'
-        temp_sensor = glob.glob(temp_dir)
-    except:
-        print('Wrong Temperature Device ID')
-    f = open(temp_sensor[0], 'r')
+    _kernel_modules_loaded = True
+
+def find_device(probe_id=None):
+    """Return the w1_slave file of DS18B20 <probe_id>, or None if it is not on the bus.
+
+    A <probe_id> of None finds the first DS18B20 on the bus. The result
+    is cached; call forget_device() to search the bus again.
+    """
+    with _discovery_lock:
+        if _device_files.get(probe_id) is None:
+            load_kernel_modules()
+            pattern = '28-*' if probe_id is None else glob.escape(probe_id)
+            temp_sensor = sorted(glob.glob(os.path.join(W1_DEVICES_DIR, pattern, 'w1_slave')))
+            if temp_sensor:
+                _device_files[probe_id] = temp_sensor[0]
+        return _device_files.get(probe_id)
+
+def list_devices():
+    """IDs of every DS18B20 on the bus"""
+    load_kernel_modules()
+    return sorted(os.path.basename(path) for path in glob.glob(os.path.join(W1_DEVICES_DIR, '28-*')))
+
+def forget_device(probe_id=None):
+    """Drop the cached probe, e.g. after it was unplugged."""
+    with _discovery_lock:
+        _device_files.pop(probe_id, None)
+
+#Read from the file where the temperature information is stored for this device.
+def temp_raw(probe_id=None):
+    temp_sensor = find_device(probe_id)
+    if temp_sensor is None:
+        raise IOError('Wrong Temperature Device ID')
+    f = open(temp_sensor, 'r')
     lines = f.readlines()
     f.close()
     return lines
 
+def parse(lines):
+    """Convert the contents of a w1_slave file to degrees C.
 
-def read():
-    try:
-        lines = temp_raw()
-        #Wait for successful read from temperature sensor (denoted by YES) at the end of this file.
-        while lines[0].strip()[-3:] != 'YES': 
-            time.sleep(0.2) #try again in 200 ms if not successful
-            lines = temp_raw()
-        temp_output = lines[1].find('t=')
-        if temp_output != -1:
-            temp_string = lines[1].strip()[temp_output+2:]
-            temp_c = float(temp_string)/1000.0
-            temp_f = temp_c*9.0/5.0+32.0
-            return temp_c #, temp_f
-    except:
-        print('Temperature sensor error! Check Wiring or device ID is correct')
-        return -1
+    Returns:
+        (float) : temperature in C, or None if the CRC check failed
+    """
+    #Successful reads from the temperature sensor are denoted by YES at the end of the first line
+    if len(lines) < 2 or lines[0].strip()[-3:] != 'YES':
+        return None
+    temp_output = lines[1].find('t=')
+    if temp_output == -1:
+        return None
+    temp_string = lines[1].strip()[temp_output+2:]
+    return float(temp_string)/1000.0
+
+def convert(probe_id=None):
+    """Run one conversion, retrying on CRC errors.
 
+    Blocks for as long as the conversion takes, so it should only be
+    called from the background reader.
 
+    Returns:
+        (float) : temperature in C, or None if no good reading was made
+    """
+    for attempt in range(MAX_CRC_RETRIES):
+        try:
+            temp_c = parse(temp_raw(probe_id))
+        except (IOError, OSError):
+            # The probe may have been unplugged, look for it again next time
+            forget_device(probe_id)
+            return None
+        if temp_c is not None:
+            return temp_c
+        time.sleep(0.2) #try again in 200 ms if not successful
+    return None
+
+class TemperatureReader(Thread):
+    """
+    Background thread that keeps the latest reading of each DS18B20.
+
+    Args:
+        probes (tuple): probe IDs to convert, None for the first probe found
+    """
+
+    def __init__(self, probes=(None,)):
+        super().__init__(daemon=True)
+        self.lock = Lock()
+        self.probes = []
+        # Guarded by self.lock, by probe ID
+        self.readings = {}       # (temperature in C, timestamp) of the last good reading
+        self.first_conversion = {}  # set once the probe's first conversion finished, good or not
+        self.healthy = {}
+        self.conversion_seconds = {}
+        self.conversion_errors = {}
+        for probe_id in probes:
+            self.add_probe(probe_id)
+
+        # Check whether to kill thread
+        self.killThread = False
+
+    def add_probe(self, probe_id=None):
+        """Convert <probe_id> too, from the next round of conversions"""
+        with self.lock:
+            if probe_id not in self.first_conversion:
+                self.probes.append(probe_id)
+                self.first_conversion[probe_id] = Event()
+                self.healthy[probe_id] = True
+                label = probe_id or 'first'
+                self.conversion_seconds[probe_id] = metrics.histogram(
+                    'piponic_temperature_conversion_seconds',
+                    'Time for one DS18B20 conversion, with retries', probe=label)
+                self.conversion_errors[probe_id] = metrics.counter(
+                    'piponic_temperature_errors', 'Failed DS18B20 conversions', probe=label)
+            return self.first_conversion[probe_id]
+
+    def remove_probe(self, probe_id=None):
+        """Stop converting <probe_id>, from the next round of conversions"""
+        with self.lock:
+            if probe_id in self.first_conversion:
+                self.probes.remove(probe_id)
+                del self.first_conversion[probe_id]
+                self.readings.pop(probe_id, None)
+
+    def run(self):
+        while not self.killThread:
+            with self.lock:
+                probes = list(self.probes)
+            # One conversion at a time on the bus
+            for probe_id in probes:
+                with self.lock:
+                    first_conversion = self.first_conversion.get(probe_id)
+                if first_conversion is None:
+                    # No longer watched
+                    continue
+                with metrics.timer(self.conversion_seconds[probe_id]):
+                    temp_c = convert(probe_id)
+                name = 'Temperature sensor' if probe_id is None else 'Temperature sensor ' + probe_id
+                if temp_c is None:
+                    self.conversion_errors[probe_id].inc()
+                if temp_c is not None:
+                    with self.lock:
+                        if probe_id in self.first_conversion:
+                            self.readings[probe_id] = (temp_c, time.monotonic())
+                        recovered = not self.healthy[probe_id]
+                        self.healthy[probe_id] = True
+                    if recovered:
+                        log.info(name + ' recovered')
+                elif self.healthy[probe_id]:
+                    # Only report the transition, not every failed conversion
+                    log.error(name + ' error! Check Wiring or device ID is correct')
+                    self.healthy[probe_id] = False
+                # A missing probe must not hold up every read
+                first_conversion.set()
+            time.sleep(READ_INTERVAL_SECS)
+
+    def latest(self, probe_id=None):
+        """Returns (temperature in C, age in seconds) of the last good reading."""
+        with self.lock:
+            if probe_id not in self.readings:
+                return None, None
+            temp_c, timestamp = self.readings[probe_id]
+            return temp_c, time.monotonic() - timestamp
+
+    def kill(self):
+        self.killThread = True
+
+_reader = None
+_reader_lock = Lock()
+
+def start():
+    """Start the background reader if it is not already running."""
+    global _reader
+    with _reader_lock:
+        if _reader is None or not _reader.is_alive():
+            _reader = TemperatureReader()
+            _reader.start()
+        return _reader
+
+def stop():
+    """Stop the background reader."""
+    global _reader
+    with _reader_lock:
+        if _reader is not None:
+            _reader.kill()
+            _reader = None
+
+def watch(probe_id=None):
+    """Start converting <probe_id> in the background, ahead of the first read."""
+    return start().add_probe(probe_id)
+
+def unwatch(probe_id=None):
+    """Stop converting <probe_id>, e.g. once no tank uses it"""
+    with _reader_lock:
+        if _reader is not None:
+            _reader.remove_probe(probe_id)
+
+def read_with_age(probe_id=None):
+    """Latest temperature and how old it is, without waiting on the sensor.
+
+    Args:
+        probe_id (str): ID of the probe, None for the first probe found
+
+    Returns:
+        (float, float) : temperature in C and its age in seconds,
+                         or (None, None) if there is no reading yet
+    """
+    first_conversion = watch(probe_id)
+    if not first_conversion.is_set():
+        # Only until the probe's first conversion, later reads return straight away
+        first_conversion.wait(FIRST_READ_TIMEOUT_SECS)
+    return start().latest(probe_id)
+
+def read(probe_id=None):
+    with metrics.timer(READ_SECONDS):
+        temp_c, age_secs = read_with_age(probe_id)
+    if temp_c is None or age_secs > STALE_AFTER_SECS:
+        return -1
+    return temp_c #, temp_f
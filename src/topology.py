@@ -0,0 +1,208 @@
+'''
+File: topology.py
+
+Purpose: Which sensors and relays belong to which tank, so that one Pi can
+         monitor several tanks. Each tank has its own DS18B20 probe on the
+         shared one-wire bus, its own ADS1115 on the shared I2C bus, and
+         optionally its own water level sensor and relays. The first tank
+         is the primary tank. It is wired as in src/pins.py, and pH dosing,
+         water top-up and the leak monitor run on it.
+
+         The topology is read from a JSON file. Settings left out of the
+         first tank default to the wiring in src/pins.py:
+
+         {"tanks": [
+             {"name": "tank0", "temperature_probe": "28-3c01b556d3de"},
+             {"name": "tank1", "temperature_probe": "28-3c01b556aa01",
+              "adc_address": "0x49", "water_level_pin": 22,
+              "pump_pin": 13, "solenoid_pin": 6}
+         ]}
+
+Date: October 18, 2026
+
+Usage:
+    import src.topology as topology
+    tanks = topology.load('topology.json')    # raises ValueError if invalid
+    device.configure_tanks(tanks)
+    topology.relay_pins(tanks)                # every tank's relays
+'''
+
+import json
+from collections import namedtuple
+
+import src.adc as adc
+import src.pins as pins
+import src.temp as temp
+import src.water_level as WL
+
+Tank = namedtuple('Tank', ['name', 'temperature_probe', 'adc_address', 'channels',
+                           'water_level_pin', 'pump_pin', 'solenoid_pin'])
+
+# The single tank wired as in src/pins.py, with the first probe on the bus
+DEFAULT_TANK = Tank('tank0', None, adc.DEFAULT_ADDRESS, dict(adc.CHANNELS),
+                    pins.WATER_LEVEL, pins.peristaltic_pump, pins.Water_level_solenoid)
+
+# Pins already taken by the buses, which no tank can use
+RESERVED_PINS = (pins.I2C_SDA, pins.I2C_SCL, pins.TEMP, pins.ADC0_ALERT_RDY)
+
+def _address(value):
+    # JSON has no hexadecimal numbers, so "0x49" is accepted as well as 73
+    if isinstance(value, str):
+        return int(value, 0)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError('expected an I2C address, got {!r}'.format(value))
+    return value
+
+def _pin(value):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError('expected a GPIO number, got {!r}'.format(value))
+    return value
+
+def parse(data):
+    """Build the tanks from a decoded topology document
+
+    Raises:
+        ValueError: listing every problem with the topology
+    """
+    entries = data.get('tanks') if isinstance(data, dict) else None
+    if not entries or not isinstance(entries, list):
+        raise ValueError('Invalid topology: expected a non-empty "tanks" list')
+
+    tanks = []
+    problems = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            problems.append('tank {}: expected an object'.format(index))
+            continue
+        # Only the primary tank has defaults, the others must say how they are wired
+        defaults = DEFAULT_TANK._asdict() if index == 0 else {
+            'name': 'tank{}'.format(index), 'temperature_probe': None, 'channels': dict(adc.CHANNELS),
+            'water_level_pin': None, 'pump_pin': None, 'solenoid_pin': None}
+        unknown = set(entry) - set(Tank._fields)
+        if unknown:
+            problems.append('tank {}: unknown settings {}'.format(index, ', '.join(sorted(unknown))))
+        try:
+            tanks.append(Tank(
+                name=str(entry.get('name', defaults['name'])),
+                temperature_probe=entry.get('temperature_probe', defaults['temperature_probe']),
+                adc_address=_address(entry['adc_address'] if 'adc_address' in entry
+                                     else defaults['adc_address']),
+                channels=dict(entry.get('channels', defaults['channels'])),
+                water_level_pin=_pin(entry.get('water_level_pin', defaults['water_level_pin'])),
+                pump_pin=_pin(entry.get('pump_pin', defaults['pump_pin'])),
+                solenoid_pin=_pin(entry.get('solenoid_pin', defaults['solenoid_pin']))))
+        except KeyError as e:
+            problems.append('tank {}: {} is required'.format(index, e))
+        except (TypeError, ValueError) as e:
+            problems.append('tank {}: {}'.format(index, e))
+
+    if not problems:
+        problems = _validate(tanks)
+    if problems:
+        raise ValueError('Invalid topology: ' + '; '.join(problems))
+    return tuple(tanks)
+
+def _validate(tanks):
+    """Checks across tanks. Returns a list of problems."""
+    problems = []
+    primary = tanks[0]
+    if (primary.pump_pin, primary.solenoid_pin) != (pins.peristaltic_pump, pins.Water_level_solenoid):
+        problems.append('the first tank must use the relays in src/pins.py, dosing runs on them')
+    if primary.water_level_pin is None:
+        problems.append('the first tank needs a water level sensor')
+
+    seen = {}
+    def claim(kind, value, name):
+        if value is None:
+            return
+        if (kind, value) in seen:
+            problems.append('{} {} is used by both {} and {}'.format(kind, value, seen[kind, value], name))
+        seen[kind, value] = name
+
+    for tank in tanks:
+        claim('name', tank.name, tank.name)
+        if tank.adc_address not in adc.ADDRESSES:
+            problems.append('{}: ADC address {:#x} is not an ADS1115 address'.format(
+                tank.name, tank.adc_address))
+        claim('ADC address', '{:#x}'.format(tank.adc_address), tank.name)
+        try:
+            adc.check_channels(tank.channels)
+        except ValueError as e:
+            problems.append('{}: {}'.format(tank.name, e))
+        if len(tanks) > 1 and tank.temperature_probe is None:
+            # Otherwise "the first probe found" could be any tank's
+            problems.append('{}: temperature_probe is required with more than one tank'.format(tank.name))
+        claim('temperature probe', tank.temperature_probe, tank.name)
+        for pin in (tank.water_level_pin, tank.pump_pin, tank.solenoid_pin):
+            if pin in RESERVED_PINS:
+                problems.append('{}: GPIO{} is used by a bus'.format(tank.name, pin))
+            claim('GPIO', pin, tank.name)
+    return problems
+
+def load(path):
+    """Read the tanks from the JSON topology file at <path>
+
+    Raises:
+        ValueError: if the file is not valid JSON or the topology is invalid
+    """
+    with open(path) as topology_file:
+        try:
+            data = json.load(topology_file)
+        except json.JSONDecodeError as e:
+            raise ValueError('Invalid topology: {}'.format(e))
+    return parse(data)
+
+def relay_pins(tanks):
+    """Every tank's relay pins. All relays are active low."""
+    return tuple(pin for tank in tanks
+                 for pin in (tank.solenoid_pin, tank.pump_pin) if pin is not None)
+
+class TankSensors(object):
+    """The sensors of one tank. Every tank's ADC shares the I2C bus lock.
+
+    Args:
+        tank (Tank): how the tank is wired
+    """
+
+    def __init__(self, tank):
+        self.tank = tank
+        self.adc_sensors = adc.adc_sensors(tank.adc_address, tank.channels)
+        # The chip may already be in use, e.g. the primary tank's since Device started
+        self.adc_sensors.use_channels(tank.channels)
+        self.water_level_sensor = None
+        if tank.water_level_pin is not None:
+            self.water_level_sensor = WL.water_level(tank.water_level_pin)
+        # Converted in the background from now on, so the first read is ready
+        temp.watch(tank.temperature_probe)
+
+    def read_temperature(self):
+        """Latest temperature in C, -1 on a sensor error"""
+        return temp.read(self.tank.temperature_probe)
+
+    def read_adc(self, channels):
+        """Convert <channels>, see src.adc.CHANNELS
+
+        Returns:
+            (dict) : readings by metric name, e.g. {'pH': 6.9, 'leak': 0.02}
+        """
+        readings = {}
+        if channels:
+            # Bursts through each channel's filter pipeline, see src/filters.py
+            volts = self.adc_sensors.read_filtered(channels)
+            if 'pH' in volts:
+                readings['pH'] = self.adc_sensors.pH_from_voltage(volts['pH'])
+            if 'leak' in volts:
+                readings['leak'] = volts['leak']
+            if 'internal_leak' in volts:
+                readings['internal_leak'] = volts['internal_leak']
+            if 'battery' in volts:
+                readings['battery_voltage'] = volts['battery']
+        return readings
+
+    def read_water_level(self):
+        """1 if there is water at the sensor, 0 if not, None without a sensor"""
+        if self.water_level_sensor is None:
+            return None
+        return self.water_level_sensor.read()
@@ -0,0 +1,175 @@
+'''
+File: tracker.py
+
+Purpose: Tracks messages from publish to PUBACK. Each message ID paho hands
+         back is mapped to the stored sample it carries, when the sample
+         was taken and when it was sent, so we know which samples the
+         bridge has acked and how long that took end to end. Only a bounded
+         number of messages are in flight at once. The window halves when a
+         message times out, and grows back by one message per window's worth
+         of acks, so a slow bridge is not flooded. Timed-out messages are
+         handed back to be sent again; until then they stay spilled on disk
+         in the outbox. Ack latencies are kept for percentiles.
+
+Date: October 18, 2026
+
+Usage:
+    import src.tracker as tracker
+    acks = tracker.PublishTracker(max_in_flight=10, ack_timeout_secs=60)
+    if acks.free() > 0:
+        info = client.publish(topic, payload, qos=1)
+        acks.track(info.mid, row_id, created)
+    acks.ack(mid)            # from on_publish, returns the row ID once it is tracked
+    acks.expire()            # row IDs to send again
+    acks.stats()             # in flight, window, p50/p90/p99 ack latency, ...
+'''
+
+import time
+from collections import deque
+from threading import Lock
+
+import src.metrics as metrics
+
+# Time from handing a message to paho to its PUBACK
+ACK_SECONDS = metrics.histogram('piponic_publish_ack_seconds', 'Time from publish to PUBACK',
+                                buckets=metrics.ACK_BUCKETS)
+
+# Time from taking a sample to its PUBACK, including time spent on disk while offline
+DELIVERY_SECONDS = metrics.histogram('piponic_publish_delivery_seconds',
+                                     'Time from sample to PUBACK',
+                                     buckets=metrics.ACK_BUCKETS + (3600.0, 86400.0))
+
+TIMEOUTS = metrics.counter('piponic_publish_timeouts', 'Messages not acked in time')
+
+def percentile(values, p):
+    """The <p>th percentile of <values> by the nearest-rank method, None if empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(-(-p * len(ordered) // 100)))
+    return ordered[rank - 1]
+
+class PublishTracker(object):
+    """Maps message IDs to samples, and limits how many are unacked. Thread-safe.
+
+    Args:
+        max_in_flight (int): most messages published but not yet acked
+        ack_timeout_secs (float): after this long without an ack, a message is sent again
+        latency_window (int): number of recent acks kept for percentiles
+    """
+
+    def __init__(self, max_in_flight=10, ack_timeout_secs=600, latency_window=1000):
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1, got {}'.format(max_in_flight))
+        self.max_in_flight = max_in_flight
+        self.ack_timeout_secs = ack_timeout_secs
+
+        # Everything below is guarded by self.lock. paho calls on_publish
+        # while holding its own mutex, so this is never held around client.publish()
+        self.lock = Lock()
+        self.in_flight = {}      # mid -> (row id, sample time.time(), time.monotonic() sent)
+        self.early_acks = {}     # mid -> time.monotonic() acked, for acks of mids not in flight
+        self.window = float(max_in_flight)
+
+        self.ack_latencies = deque(maxlen=latency_window)
+        self.delivery_latencies = deque(maxlen=latency_window)
+        self.acked = 0
+        self.timeouts = 0
+        # Sample time of the newest sample the bridge has acked
+        self.last_acked_sample = None
+
+    def free(self):
+        """Number of messages that may be published now"""
+        with self.lock:
+            return max(0, int(self.window) - len(self.in_flight))
+
+    def sending(self):
+        """Row IDs of the messages in flight"""
+        with self.lock:
+            return set(row_id for row_id, created, sent in self.in_flight.values())
+
+    def track(self, mid, row_id, created):
+        """Record that <row_id>, a sample taken at <created>, was published as <mid>
+
+        Returns:
+            (bool) : True if the ack already arrived, so the message is done
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.early_acks.pop(mid, None) is not None:
+                # Acked before publish() even returned
+                self.record_ack(0.0, created)
+                return True
+            self.in_flight[mid] = (row_id, created, now)
+            return False
+
+    def ack(self, mid):
+        """Record a PUBACK. Safe to call from paho's callbacks.
+
+        Returns:
+            (int) : the row ID of the acked message, None if <mid> is not tracked yet
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.in_flight.pop(mid, None)
+            if entry is None:
+                # The ack beat track(), or it is for a message published without the outbox
+                self.early_acks[mid] = now
+                return None
+            row_id, created, sent = entry
+            self.record_ack(now - sent, created)
+            return row_id
+
+    def record_ack(self, latency, created):
+        """Call with self.lock held"""
+        self.acked += 1
+        self.ack_latencies.append(latency)
+        ACK_SECONDS.observe(latency)
+        delivery = max(0.0, time.time() - created)
+        self.delivery_latencies.append(delivery)
+        DELIVERY_SECONDS.observe(delivery)
+        if self.last_acked_sample is None or created > self.last_acked_sample:
+            self.last_acked_sample = created
+        # Additive increase: one more message per window's worth of acks
+        self.window = min(float(self.max_in_flight), self.window + 1.0 / self.window)
+
+    def expire(self):
+        """Forget messages that were never acked, so they are sent again
+
+        Returns:
+            (list) : row IDs of the messages that timed out
+        """
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            for mid, (row_id, created, sent) in list(self.in_flight.items()):
+                if now - sent > self.ack_timeout_secs:
+                    del self.in_flight[mid]
+                    expired.append(row_id)
+            if expired:
+                # Multiplicative decrease: the bridge is slow or the link is lossy
+                self.timeouts += len(expired)
+                TIMEOUTS.inc(len(expired))
+                self.window = max(1.0, self.window / 2)
+            # Kept, stray acks would ack an outbox message once the mids wrap around
+            for mid, acked in list(self.early_acks.items()):
+                if now - acked > self.ack_timeout_secs:
+                    del self.early_acks[mid]
+        return expired
+
+    def stats(self):
+        """Tracking statistics, as a dictionary. Latencies are in seconds."""
+        with self.lock:
+            ack_latencies = list(self.ack_latencies)
+            delivery_latencies = list(self.delivery_latencies)
+            stats = {
+                'in_flight': len(self.in_flight),
+                'window': int(self.window),
+                'acked': self.acked,
+                'timeouts': self.timeouts,
+                'last_acked_sample': self.last_acked_sample,
+            }
+        for p in (50, 90, 99):
+            stats['ack_p{}'.format(p)] = percentile(ack_latencies, p)
+            stats['delivery_p{}'.format(p)] = percentile(delivery_latencies, p)
+        return stats
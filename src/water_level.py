@@ -14,6 +14,7 @@ Usage:
     import src.water_level as WL
     WL_sensor = WL.water_level()
     print(WL_sensor.read())
+    WL_sensor2 = WL.water_level(pin=22)     # another tank's sensor
 
 '''
 
@@ -21,6 +22,7 @@ Usage:
 from threading import Lock
 
 import RPi.GPIO as GPIO
+import src.log as log
 import src.pins as pins
 import src.relay as relay
 
@@ -28,10 +30,15 @@ import src.relay as relay
 class water_level(object):
     """Class that reads data from the water level
 
-       Implemented using a Thread-safe Singleton"""
+       Implemented using a Thread-safe Singleton, one instance per GPIO
+
+       Args:
+           pin (int): BCM GPIO the sensor output is wired to
+    """
 
     class __water_level:
-        def __init__(self):
+        def __init__(self, pin=pins.WATER_LEVEL):
+            self.pin = pin
             self.level = 0
             self.setup()
             self.read() # update level 
@@ -41,34 +48,35 @@ class water_level(object):
                 GPIO.setmode(GPIO.BCM) #read GPIO labels not pin numbers 
                 GPIO.setwarnings(False)
                 #Enable input, pull-down resistor so GPIO pin is normally GND
-                GPIO.setup(pins.WATER_LEVEL,GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-            except:
-                print('GPIO setup issue')
+                GPIO.setup(self.pin,GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+            except Exception as e:
+                log.error('GPIO setup issue', gpio=self.pin, error=e)
                 
         def read(self):
             try:
-                self.level = GPIO.input(pins.WATER_LEVEL)
+                self.level = GPIO.input(self.pin)
                 return self.level
             except:
                 GPIO.cleanup()        
                 return -1
 
-    # The current singleton instance of __water_level
-    instance = None
+    # The singleton instance of __water_level for each pin
+    instances = {}
 
     # To ensure there is only one instance created across multiple threads
     instance_lock = Lock()
 
-    def __init__(self):
+    def __init__(self, pin=pins.WATER_LEVEL):
         """
-        Creates single instance of the __water_level class.
+        Creates single instance of the __water_level class per pin.
         This ensures that there is only one object interfacing
-        the adc in the application
+        each sensor in the application
         """
         water_level.instance_lock.acquire()
 
-        if not water_level.instance:
-            water_level.instance = water_level.__water_level()
+        if pin not in water_level.instances:
+            water_level.instances[pin] = water_level.__water_level(pin)
+        self.instance = water_level.instances[pin]
 
         water_level.instance_lock.release()
 
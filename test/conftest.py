@@ -0,0 +1,31 @@
+'''
+File: conftest.py
+
+Purpose: Shared setup of the unit tests. They run against the simulated
+         hardware backend, as --simulate does, so they need no Pi. The
+         simulator's virtual clock is installed for the whole session:
+         time.sleep() on the test thread advances time instantly.
+
+Date: October 18, 2026
+
+Usage:
+    python -m pytest -q test
+'''
+
+import os
+import sys
+
+# So the tests import src the way piponic.py does, from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.simulator as simulator
+
+# Scripts for trying out the real hardware, not unit tests
+collect_ignore = ['pH_test.py', 'water_level_test.py', 'pH_calibrate_4.py', 'pH_calibrate_7.py']
+
+def pytest_configure(config):
+    # Before any src driver is imported, see src/simulator.py
+    simulator.install(seed=0)
+
+def pytest_unconfigure(config):
+    simulator.uninstall()
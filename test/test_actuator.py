@@ -0,0 +1,134 @@
+import time
+
+import pytest
+
+import src.actuator as actuator
+import src.pins as pins
+import src.relay as relay
+import src.simulator as simulator
+
+PUMP = pins.peristaltic_pump
+SOLENOID = pins.Water_level_solenoid
+
+@pytest.fixture
+def service():
+    for pin in (PUMP, SOLENOID):
+        relay.init_pullup(pin)
+    service = actuator.ActuatorService()
+    yield service
+    service.stop(timeout=5)
+    for pin in (PUMP, SOLENOID):
+        relay.release(pin)
+
+def is_on(pin):
+    # Active low
+    return simulator.gpio().levels[pin] == 0
+
+def advance(service, secs):
+    """Sleep on the virtual clock, then do what the service thread does when woken
+
+    Sleeps are exact binary fractions, so later tests still see whole seconds.
+    """
+    time.sleep(secs)
+    with service.changed:
+        for request in service.wheel.expire(time.monotonic()):
+            service.end(request)
+
+def test_wheel_holds_timers_over_a_full_turn():
+    wheel = actuator.TimerWheel(tick_secs=1, slots=8)
+    wheel.expire(0)
+    wheel.schedule(20.5, 'late')
+    wheel.schedule(3, 'soon')
+    for now in range(1, 20):
+        expired = wheel.expire(now)
+        assert expired == (['soon'] if now == 3 else [])
+    assert len(wheel) == 1
+    assert wheel.next_deadline() == 20.5
+    assert wheel.expire(20) == []
+    assert wheel.expire(21) == ['late']
+    assert len(wheel) == 0 and wheel.next_deadline() is None
+
+def test_wheel_catches_up_after_more_than_a_turn():
+    wheel = actuator.TimerWheel(tick_secs=1, slots=8)
+    wheel.expire(0)
+    for deadline in (30, 5, 3, 12):
+        wheel.schedule(deadline, deadline)
+    cancelled = wheel.schedule(7, 7)
+    wheel.cancel(cancelled)
+    assert wheel.expire(100) == [3, 5, 12, 30]
+    assert len(wheel) == 0
+
+def test_pulse_switches_on_at_once_and_off_on_time(service):
+    pulse = service.pulse(PUMP, 2)
+    assert is_on(PUMP)
+    advance(service, 1.75)
+    assert is_on(PUMP) and not pulse.done.is_set()
+    advance(service, 0.5)
+    assert not is_on(PUMP)
+    assert pulse.ran
+    assert pulse.on_secs == pytest.approx(2, abs=0.25)
+    assert service.pulses[PUMP] == 1
+
+def test_pulses_on_one_pin_queue_by_priority(service):
+    first = service.pulse(PUMP, 1)
+    low = service.pulse(PUMP, 1, priority=0)
+    high = service.pulse(PUMP, 1, priority=5)
+    also_low = service.pulse(PUMP, 1, priority=0)
+    assert service.busy(PUMP) and service.pending() == 4
+
+    order = []
+    for i in range(4):
+        advance(service, 1.25)
+        for name, request in (('first', first), ('high', high), ('low', low), ('also_low', also_low)):
+            if request.done.is_set() and name not in order:
+                order.append(name)
+    assert order == ['first', 'high', 'low', 'also_low']
+    assert not service.busy(PUMP)
+    assert not is_on(PUMP)
+
+def test_pulses_on_different_pins_overlap(service):
+    service.pulse(PUMP, 2)
+    service.pulse(SOLENOID, 2)
+    assert is_on(PUMP) and is_on(SOLENOID)
+    advance(service, 2.5)
+    assert not is_on(PUMP) and not is_on(SOLENOID)
+
+def test_queue_drops_lowest_priority_newest_pulse():
+    relay.init_pullup(PUMP)
+    service = actuator.ActuatorService(max_queued=2)
+    try:
+        service.pulse(PUMP, 1)
+        kept = service.pulse(PUMP, 1, priority=1)
+        dropped = service.pulse(PUMP, 1)
+        urgent = service.pulse(PUMP, 1, priority=9)
+        assert dropped.done.is_set() and dropped.ran is False
+        assert not kept.done.is_set() and not urgent.done.is_set()
+        assert service.dropped == 1
+    finally:
+        service.stop()
+
+def test_locked_out_pulse_is_refused(service):
+    relay.lock_out(PUMP)
+    pulse = service.pulse(PUMP, 1)
+    assert pulse.done.is_set()
+    assert pulse.ran is False
+    assert pulse.on_secs == 0
+    assert service.refused == 1
+    assert not is_on(PUMP)
+    assert not service.busy(PUMP)
+
+def test_stop_switches_every_relay_off(service):
+    service.start()
+    pump = service.pulse(PUMP, 100)
+    solenoid = service.pulse(SOLENOID, 100)
+    queued = service.pulse(PUMP, 100)
+    assert is_on(PUMP) and is_on(SOLENOID)
+    service.stop(timeout=5)
+    assert not service.is_alive()
+    assert not is_on(PUMP) and not is_on(SOLENOID)
+    assert pump.ran and solenoid.ran
+    assert queued.ran is False
+    assert service.pending() == 0
+    # Refused once stopped
+    assert service.pulse(PUMP, 1).ran is False
+    assert not is_on(PUMP)
@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import src.adc as adc
+
+@pytest.fixture
+def sensors():
+    sensors = adc.adc_sensors()
+    yield sensors
+    sensors.stop_continuous()
+
+def test_failed_conversion_releases_the_bus(sensors, monkeypatch):
+    def fail(channel):
+        raise OSError('I2C transfer failed')
+    monkeypatch.setattr(sensors.ads, 'read_volts', fail)
+    for read in (sensors.read_leak, sensors.read_battery, sensors.read_internal_leak,
+                 sensors.read_pH, sensors.read_all):
+        with pytest.raises(OSError):
+            read()
+        assert not adc.i2c_bus.busy
+    monkeypatch.undo()
+    assert sensors.read_leak() >= 0
+
+def test_continuous_scan_serves_every_channel(sensors):
+    sensors.start_continuous()
+    # Nothing converted yet, and the bus is still released
+    with pytest.raises(RuntimeError):
+        sensors.read_battery()
+    assert not adc.i2c_bus.busy
+
+    time.sleep(1)
+    config = sensors.ads.registers[adc.REG_CONFIG]
+    conversions = sensors.ads.conversions
+    sample = sensors.read_all()
+    assert 0 < sample.pH_voltage < 5
+    assert sample.battery > 0
+    # Served from the scan, the chip was left converting
+    assert sensors.ads.registers[adc.REG_CONFIG] == config
+    assert sensors.ads.conversions == conversions
+
+def test_unscanned_channel_is_refused(sensors):
+    sensors.start_continuous(channels=('pH', 'leak'))
+    time.sleep(1)
+    config = sensors.ads.registers[adc.REG_CONFIG]
+    assert sensors.read_leak() >= 0
+    with pytest.raises(RuntimeError):
+        sensors.read_internal_leak()
+    assert sensors.ads.registers[adc.REG_CONFIG] == config
+    assert not adc.i2c_bus.busy
+
+def test_bus_goes_to_higher_priority_first():
+    bus = adc.BusArbiter()
+    bus.acquire()
+    order = []
+    def claim(priority):
+        bus.acquire(priority)
+        order.append(priority)
+        bus.release()
+    threads = [threading.Thread(target=claim, args=(priority,)) for priority in (0, 5)]
+    for queued, thread in enumerate(threads, 1):
+        thread.start()
+        # Queued in this order
+        while len(bus.waiting) < queued:
+            pass
+    bus.release()
+    for thread in threads:
+        thread.join()
+    assert order == [5, 0]
+
+def test_import_leaves_the_adafruit_drivers_alone():
+    # In a fresh interpreter, where the drivers cannot be imported at all
+    script = (
+        "import sys\n"
+        "import src.simulator as simulator\n"
+        "simulator.install()\n"
+        "for name in ('board', 'busio', 'adafruit_ads1x15.ads1115', 'adafruit_ads1x15.analog_in'):\n"
+        "    sys.modules[name] = None\n"
+        "import src.adc as adc\n"
+        "adc.check_channels(adc.CHANNELS)\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', script], cwd=root,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,99 @@
+import threading
+
+import src.alarms as alarms
+import src.config as config
+
+def sample(pH=7.0, leak=0.0, temperature=20.0, battery_voltage=3.7):
+    return (temperature, pH, leak, 1, battery_voltage, 0.0)
+
+def events(engine, now, values):
+    return [(event.name, event.raised) for event in engine.evaluate(now, values)]
+
+def test_alarm_waits_for_min_duration():
+    engine = alarms.AlarmEngine(config.ConfigStore().current)
+    assert events(engine, 0, sample(pH=4.5)) == []
+    assert events(engine, 119, sample(pH=4.5)) == []
+    assert events(engine, 120, sample(pH=4.5)) == [('pH_low', True)]
+    # Raised once, not on every sample
+    assert events(engine, 180, sample(pH=4.5)) == []
+    assert engine.active() == ['pH_low']
+
+def test_short_excursion_is_not_raised():
+    engine = alarms.AlarmEngine(config.ConfigStore().current)
+    engine.evaluate(0, sample(pH=4.5))
+    engine.evaluate(60, sample(pH=6.0))
+    assert events(engine, 130, sample(pH=4.5)) == []
+    assert events(engine, 250, sample(pH=4.5)) == [('pH_low', True)]
+
+def test_clears_only_past_the_hysteresis_band():
+    engine = alarms.AlarmEngine(config.ConfigStore().current)
+    # No minimum duration for leaks
+    assert events(engine, 0, sample(leak=0.3)) == [('leak', True)]
+    assert events(engine, 1, sample(leak=0.24)) == []
+    assert events(engine, 2, sample(leak=0.26)) == []
+    assert events(engine, 3, sample(leak=0.19)) == [('leak', False)]
+    assert engine.active() == []
+
+def test_missing_readings_are_skipped():
+    engine = alarms.AlarmEngine(config.ConfigStore().current)
+    assert events(engine, 0, (None, None, None, None, None, None)) == []
+
+def test_state_carries_over_a_config_change():
+    store = config.ConfigStore()
+    engine = alarms.AlarmEngine(store.current)
+    store.subscribe(engine.on_config_changed)
+    engine.evaluate(0, sample(leak=0.3))
+    store.update({'leak_threshold_volts': 0.5})
+    assert engine.active() == ['leak']
+    assert events(engine, 1, sample(leak=0.4)) == [('leak', False)]
+
+def test_listeners_hear_each_edge_and_failures_are_contained():
+    engine = alarms.AlarmEngine(config.ConfigStore().current)
+    heard = []
+    def broken(event):
+        raise RuntimeError('listener bug')
+    engine.add_listener(broken)
+    engine.add_listener(heard.append)
+    engine.evaluate(0, sample(leak=0.3))
+    engine.evaluate(1, sample(leak=0.3))
+    assert [(event.name, event.raised) for event in heard] == [('leak', True)]
+
+def test_listeners_hear_events_in_the_order_they_happened():
+    engine = alarms.AlarmEngine(config.ConfigStore().current)
+    heard = []
+    raising = threading.Event()
+    release = threading.Event()
+
+    def slow_listener(event):
+        if event.raised:
+            raising.set()
+            # Stands in for a slow publish, while another thread clears the alarm
+            release.wait(5)
+        heard.append((event.name, event.raised))
+
+    engine.add_listener(slow_listener)
+    raiser = threading.Thread(target=engine.evaluate, args=(0, sample(leak=0.3)))
+    raiser.start()
+    assert raising.wait(5)
+    clearer = threading.Thread(target=engine.evaluate, args=(1, sample(leak=0.0)))
+    clearer.start()
+    # The clear waits for the raise to be delivered
+    clearer.join(0.2)
+    assert clearer.is_alive()
+    release.set()
+    raiser.join(5)
+    clearer.join(5)
+    assert heard == [('leak', True), ('leak', False)]
+
+def test_listener_may_evaluate_from_its_own_thread():
+    engine = alarms.AlarmEngine(config.ConfigStore().current)
+    heard = []
+
+    def listener(event):
+        heard.append((event.name, event.raised))
+        if event.raised:
+            engine.evaluate(1, sample(leak=0.0))
+
+    engine.add_listener(listener)
+    engine.evaluate(0, sample(leak=0.3))
+    assert heard == [('leak', True), ('leak', False)]
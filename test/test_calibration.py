@@ -0,0 +1,96 @@
+import json
+import math
+
+import pytest
+
+import src.calibration as calibration
+
+LEGACY = """pH_offset 1.5 # volts at pH 7
+pH_slope -6.0
+pH_intercept 7.0
+"""
+
+@pytest.fixture
+def store(tmp_path):
+    legacy = tmp_path / 'pH_calibration_values.txt'
+    legacy.write_text(LEGACY)
+    return calibration.CalibrationStore(str(tmp_path / 'pH_calibration_0x48.json'),
+                                        fallbacks=(str(legacy),))
+
+def test_two_point_fit_is_exact():
+    slope, intercept, rms_error = calibration.fit([(1.5, 7.0), (2.0, 4.0)])
+    assert slope == pytest.approx(-6.0)
+    assert intercept == pytest.approx(16.0)
+    assert rms_error == pytest.approx(0.0)
+
+def test_three_point_fit_is_least_squares():
+    slope, intercept, rms_error = calibration.fit([(1.0, 10.0), (1.5, 7.1), (2.0, 4.0)])
+    assert slope == pytest.approx(-6.0)
+    # Through the mean of the points
+    assert intercept == pytest.approx(21.1 / 3 + 6.0 * 1.5)
+    # Residuals of 1/30, -2/30 and 1/30 pH
+    assert rms_error == pytest.approx(math.sqrt(6 / 900 / 3))
+
+def test_single_point_keeps_the_slope():
+    slope, intercept, rms_error = calibration.fit([(1.6, 7.0)], slope=-6.0)
+    assert slope == -6.0
+    assert slope * 1.6 + intercept == pytest.approx(7.0)
+    with pytest.raises(ValueError):
+        calibration.fit([(1.6, 7.0)])
+
+def test_points_at_one_voltage_are_rejected():
+    with pytest.raises(ValueError):
+        calibration.fit([(1.5, 7.0), (1.5, 4.0)])
+
+def test_legacy_file_is_version_zero(store):
+    current = store.current
+    assert current.version == 0
+    assert current.slope == -6.0
+    # pH 7 at the offset voltage
+    assert current.slope * 1.5 + current.intercept == pytest.approx(7.0)
+
+def test_points_are_saved_as_new_versions(store):
+    store.add_point(1, 1.52, 7.0)
+    calibrated = store.add_point(2, 2.02, 4.0)
+    assert calibrated.version == 2
+    assert calibrated.slope == pytest.approx(-6.0)
+    reopened = calibration.CalibrationStore(store.path)
+    assert [entry.version for entry in reopened.history()] == [0, 1, 2]
+    assert reopened.current == calibrated
+
+def test_out_of_order_point_changes_nothing(store):
+    with pytest.raises(ValueError):
+        store.add_point(2, 2.0, 4.0)
+    with pytest.raises(ValueError):
+        store.add_point(0, 2.0, 4.0)
+    assert store.current.version == 0
+
+def test_restore_is_a_new_version(store):
+    store.add_point(1, 1.52, 7.0)
+    store.add_point(2, 2.02, 4.0)
+    restored = store.restore(1)
+    assert restored.version == 3
+    assert restored.slope == store.history()[1].slope
+    with pytest.raises(ValueError):
+        store.restore(42)
+
+def test_history_is_capped(store):
+    for _ in range(calibration.MAX_HISTORY + 5):
+        store.add_point(1, 1.5, 7.0)
+    history = store.history()
+    assert len(history) == calibration.MAX_HISTORY
+    assert history[-1].version == calibration.MAX_HISTORY + 5
+
+def test_failed_write_leaves_the_old_file(store, monkeypatch):
+    store.add_point(1, 1.52, 7.0)
+    with open(store.path) as saved:
+        before = saved.read()
+    def fail(*args):
+        raise OSError('disk full')
+    monkeypatch.setattr(calibration.os, 'replace', fail)
+    with pytest.raises(OSError):
+        store.add_point(1, 1.6, 7.0)
+    with open(store.path) as saved:
+        assert saved.read() == before
+    assert store.current.version == 1
+    assert json.loads(before)['versions'][-1]['version'] == 1
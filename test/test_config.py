@@ -0,0 +1,94 @@
+import pytest
+
+import src.config as config
+
+def test_defaults_are_converted():
+    snapshot = config.ConfigStore().current
+    assert snapshot.version == 0
+    assert snapshot.as_dict() == config.DEFAULT_CONFIG
+    assert snapshot['target_ph'] == snapshot.get('target_ph') == 7.0
+    assert snapshot.get('no_such_setting', 'default') == 'default'
+    with pytest.raises(KeyError):
+        snapshot['no_such_setting']
+
+def test_update_converts_types_and_bumps_the_version():
+    store = config.ConfigStore()
+    snapshot = store.update({'target_ph': '6.5', 'update_interval_minutes': 15.0})
+    assert snapshot is store.current
+    assert snapshot.version == 1
+    assert snapshot.target_ph == 6.5
+    assert snapshot.update_interval_minutes == 15
+    assert isinstance(snapshot.update_interval_minutes, int)
+
+def test_unchanged_update_keeps_the_version():
+    store = config.ConfigStore()
+    calls = []
+    store.subscribe(lambda snapshot, changed: calls.append(changed))
+    before = store.current
+    assert store.update({'target_ph': 7, 'unknown_setting': 1}) is before
+    assert store.current.version == 0
+    assert calls == []
+
+def test_subscribers_get_only_the_changed_settings():
+    store = config.ConfigStore()
+    calls = []
+    store.subscribe(lambda snapshot, changed: calls.append((snapshot.version, changed)))
+    store.update({'target_ph': 6.5, 'max_ph': 10})
+    store.update({'max_ph': 9})
+    assert calls == [(1, {'target_ph': (7.0, 6.5)}), (2, {'max_ph': (10.0, 9.0)})]
+
+def test_failing_subscriber_does_not_stop_the_update():
+    store = config.ConfigStore()
+    calls = []
+    store.subscribe(lambda snapshot, changed: 1 / 0)
+    store.subscribe(lambda snapshot, changed: calls.append(snapshot.version))
+    store.update({'target_ph': 6.5})
+    assert calls == [1]
+
+@pytest.mark.parametrize('changes', [
+    {'target_ph': 'acidic'},
+    {'target_ph': float('nan')},
+    {'max_ph': True},
+    {'update_interval_minutes': 0},
+    {'update_interval_minutes': 2.5},
+    {'leak_threshold_volts': -0.1},
+    {'min_ph': 8, 'max_ph': 7},
+    {'target_ph': 11},
+    {'ph_min_pulse_secs': 20},
+    {'pH_filter': 'no_such_stage'},
+])
+def test_invalid_updates_are_rejected_whole(changes):
+    store = config.ConfigStore()
+    before = store.current
+    with pytest.raises(ValueError):
+        store.update(dict(changes, low_battery_volts=2.0))
+    assert store.current is before
+
+def test_every_invalid_setting_is_reported():
+    with pytest.raises(ValueError) as error:
+        config.ConfigStore().update({'target_ph': 'x', 'max_temperature': None})
+    assert 'target_ph' in str(error.value)
+    assert 'max_temperature' in str(error.value)
+
+def test_snapshots_are_immutable():
+    store = config.ConfigStore()
+    snapshot = store.current
+    with pytest.raises(AttributeError):
+        snapshot.target_ph = 6.0
+    with pytest.raises(TypeError):
+        snapshot['target_ph'] = 6.0
+    with pytest.raises(AttributeError):
+        snapshot.extra = 1
+    # Changing the dictionary copy does not change the snapshot
+    values = snapshot.as_dict()
+    values['target_ph'] = 6.0
+    assert snapshot.target_ph == 7.0
+    # Old snapshots are left as they were by updates
+    store.update({'target_ph': 6.5})
+    assert snapshot.target_ph == 7.0 and snapshot.version == 0
+
+def test_diff():
+    old = config.ConfigStore().current
+    new = config.ConfigStore({'min_ph': 6.0}).current
+    assert config.diff(old, new) == {'min_ph': (5.0, 6.0)}
+    assert config.diff(old, old) == {}
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+import src.connection as connection
+
+class RecordingRandom(object):
+    """Stands in for random.Random, records the range of every uniform() call"""
+
+    def __init__(self):
+        self.ranges = []
+
+    def uniform(self, low, high):
+        self.ranges.append((low, high))
+        return low
+
+class FakeClient(object):
+    """MQTT client whose connection attempts fail <failures> times, then connect and drop"""
+
+    def __init__(self, failures, connections=1):
+        self.failures = failures
+        self.connections = connections
+        self.manager = None
+        self.connected = False
+        self.attempts = 0
+
+    def connect(self, host, port, keepalive):
+        return self.reconnect()
+
+    def reconnect(self):
+        self.attempts += 1
+        if self.failures:
+            self.failures -= 1
+            return 1
+        self.connected = True
+        return connection.MQTT_ERR_SUCCESS
+
+    def loop(self, timeout=1.0):
+        if self.connected:
+            self.connected = False
+            self.manager.on_connect(self, None, {}, connection.MQTT_ERR_SUCCESS)
+            return connection.MQTT_ERR_SUCCESS
+        # The link dropped
+        self.manager.on_disconnect(self, None, 1)
+        self.connections -= 1
+        if not self.connections:
+            self.manager.killThread = True
+        return 1
+
+    def subscribe(self, topic, qos=0):
+        pass
+
+    def disconnect(self):
+        pass
+
+def make(client=None, rng=None, **kwargs):
+    manager = connection.ConnectionManager(client or FakeClient(0), 'localhost', 8883,
+                                           rng=rng or random.Random(0), **kwargs)
+    if client is not None:
+        client.manager = manager
+    return manager
+
+def test_backoff_doubles_up_to_the_maximum():
+    rng = RecordingRandom()
+    manager = make(rng=rng, min_backoff_secs=1, max_backoff_secs=30)
+    for failures in range(8):
+        manager.failures = failures
+        manager.backoff_secs()
+    assert rng.ranges == [(1, 1), (1, 2), (1, 4), (1, 8), (1, 16), (1, 30), (1, 30), (1, 30)]
+
+def test_backoff_is_jittered_within_bounds():
+    manager = make(min_backoff_secs=1, max_backoff_secs=120)
+    manager.failures = 4
+    delays = [manager.backoff_secs() for i in range(200)]
+    assert all(1 <= delay <= 16 for delay in delays)
+    # Spread out, so devices that dropped together do not reconnect together
+    assert max(delays) - min(delays) > 10
+
+def test_failures_grow_the_backoff_and_a_connection_resets_it():
+    rng = RecordingRandom()
+    client = FakeClient(failures=3, connections=2)
+    manager = make(client, rng=rng, min_backoff_secs=0.001, max_backoff_secs=0.01)
+    manager.run()
+    # Three refused attempts, a connection that drops, then a second one.
+    # The backoff ceiling doubles per failure and starts over after the drop.
+    assert client.attempts == 5
+    assert [high for low, high in rng.ranges] == [0.002, 0.004, 0.008, 0.001]
+    assert manager.connects == 2
+    assert manager.state == connection.STOPPED
+
+def test_connection_statistics():
+    client = FakeClient(failures=1)
+    manager = make(client, min_backoff_secs=0.001, max_backoff_secs=0.001)
+    manager.run()
+    stats = manager.stats()
+    assert stats['attempts'] == 2
+    assert stats['connects'] == 1
+    assert stats['reconnects'] == 0
+    assert stats['uptime_secs'] == 0
+    assert stats['last_error'] == 'disconnect 1'
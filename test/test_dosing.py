@@ -0,0 +1,60 @@
+import pytest
+
+import src.config as config
+import src.dosing as dosing
+
+def controller(**changes):
+    store = config.ConfigStore()
+    if changes:
+        store.update(changes)
+    return dosing.PHDosingController(store), store
+
+def test_no_dose_at_or_above_target():
+    ph_dosing, store = controller()
+    assert ph_dosing.update(7.0, 0) == 0.0
+    assert ph_dosing.update(7.5, 60) == 0.0
+    # Inside the deadband
+    assert ph_dosing.update(6.97, 120) == 0.0
+
+def test_dose_is_capped_at_the_longest_pulse():
+    ph_dosing, store = controller()
+    assert ph_dosing.update(4.0, 0) == store.current.ph_max_pulse_secs
+
+def test_doses_respect_the_minimum_interval():
+    ph_dosing, store = controller(ph_dead_time_secs=0.0)
+    interval = store.current.ph_min_dose_interval_secs
+    assert ph_dosing.update(6.5, 0) > 0
+    assert ph_dosing.update(6.5, interval - 1) == 0.0
+    assert ph_dosing.update(6.5, interval) > 0
+
+def test_dose_still_mixing_is_not_dosed_again():
+    # The modelled dose alone, so it covers the whole error
+    ph_dosing, store = controller(ph_min_dose_interval_secs=0.0, ph_feed_forward=1.0,
+                                  ph_kp=0.0, ph_ki=0.0)
+    secs = ph_dosing.update(6.9, 0)
+    assert secs == pytest.approx(0.1 / store.current.ph_dose_gain)
+    # The probe has not seen the dose yet, the predicted pH has
+    assert ph_dosing.update(6.9, 10) == 0.0
+    assert ph_dosing.stats()['last_error'] == pytest.approx(0.0, abs=1e-9)
+    # Once it has mixed in, what is left is dosed again
+    assert ph_dosing.update(6.9, store.current.ph_dead_time_secs + 1) > 0
+
+def test_pulses_shorter_than_the_pump_can_give_are_skipped():
+    ph_dosing, store = controller(ph_kp=0.0, ph_ki=0.0, ph_feed_forward=0.001)
+    assert ph_dosing.update(6.9, 0) == 0.0
+
+def test_integral_does_not_wind_up():
+    ph_dosing, store = controller(ph_min_dose_interval_secs=1e9)
+    ph_dosing.update(6.9, 0)
+    for minute in range(1, 24 * 60):
+        ph_dosing.update(6.9, minute * 60)
+    current = store.current
+    assert ph_dosing.stats()['integral'] <= current.ph_max_pulse_secs / current.ph_ki
+
+def test_config_change_resets_the_integral():
+    ph_dosing, store = controller(ph_min_dose_interval_secs=1e9)
+    ph_dosing.update(6.9, 0)
+    ph_dosing.update(6.9, 600)
+    assert ph_dosing.stats()['integral'] > 0
+    store.update({'target_ph': 6.8})
+    assert ph_dosing.stats()['integral'] == 0.0
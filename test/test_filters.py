@@ -0,0 +1,79 @@
+import pytest
+
+import src.adc as adc
+import src.config as config
+import src.filters as filters
+
+def test_median_drops_a_spike():
+    assert filters.parse('median').process([1.51, 1.50, 1.93, 1.51, 1.49], 0) == 1.51
+    assert filters.parse('median').process([1.0, 2.0], 0) == 1.5
+
+def test_ema_block_matches_one_sample_at_a_time():
+    block = filters.parse('ema:0.3')
+    single = filters.parse('ema:0.3')
+    samples = [1.0, 1.2, 0.9, 1.4, 1.1]
+    block.process([0.5], 0)
+    single.process([0.5], 0)
+    for sample in samples:
+        expected = single.process([sample], 1)
+    assert block.process(samples, 1) == pytest.approx(expected)
+
+def test_kalman_burst_is_one_measurement_of_its_mean():
+    kalman = filters.KalmanStage(process_variance=0.0, measurement_variance=4e-6)
+    kalman.process([1.0] * 4, 0)
+    assert kalman.variance == pytest.approx(1e-6)
+    # Equal noise on both sides, so the estimate goes halfway
+    assert kalman.process([1.2] * 4, 1) == [pytest.approx(1.1)]
+
+def test_kalman_follows_a_level_that_moves():
+    kalman = filters.parse('kalman:1e-4:4e-6')
+    kalman.process([1.0], 0)
+    for second in range(1, 60):
+        estimate = kalman.process([1.5], second)
+    assert estimate == pytest.approx(1.5, abs=1e-3)
+
+def test_empty_spec_passes_the_latest_sample():
+    for spec in ('', 'none', ' '):
+        assert filters.parse(spec).process([1.0, 2.0], 0) == 2.0
+    with pytest.raises(ValueError):
+        filters.parse('').process([], 0)
+
+@pytest.mark.parametrize('spec', ['foo', 'ema', 'ema:0', 'ema:1.5', 'kalman:1', 'kalman:-1:1',
+                                  'kalman:1:0', 'ema:nan', 'ema:x', 'median:3'])
+def test_invalid_specs_are_rejected(spec):
+    with pytest.raises(ValueError):
+        filters.parse(spec)
+
+def test_reset_forgets_the_state():
+    pipeline = filters.parse('median,ema:0.5')
+    pipeline.process([1.0], 0)
+    pipeline.reset()
+    assert pipeline.process([3.0], 1) == 3.0
+
+def test_config_validates_filter_settings():
+    store = config.ConfigStore()
+    store.update({'pH_filter': 'median', 'pH_burst_samples': 9})
+    for changes in ({'pH_burst_samples': 0}, {'pH_burst_samples': filters.MAX_BURST_SAMPLES + 1},
+                    {'leak_filter': 'bogus'}, {'battery_filter': 3}):
+        with pytest.raises(ValueError):
+            store.update(changes)
+    assert store.current.pH_filter == 'median'
+
+def test_adc_reads_a_filtered_burst():
+    sensors = adc.adc_sensors()
+    store = config.ConfigStore()
+    try:
+        store.update({'pH_filter': 'median', 'pH_burst_samples': 7})
+        sensors.configure_filters(store.current)
+        conversions = sensors.ads.conversions
+        volts = sensors.read_filtered(['pH', 'leak'])
+        assert sensors.ads.conversions - conversions == 7 + 1
+        assert 0 < volts['pH'] < 5
+
+        # Unchanged specs keep their state
+        battery = sensors.filters['battery']
+        store.update({'pH_burst_samples': 3})
+        sensors.configure_filters(store.current)
+        assert sensors.filters['battery'] is battery
+    finally:
+        sensors.configure_filters(config.ConfigStore().current)
@@ -0,0 +1,137 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import src.gateway as gateway
+
+class FakeClient(object):
+    """Records what the gateway sends, in order"""
+
+    def __init__(self):
+        self.sent = []
+        self.on_message = None
+
+    def publish(self, topic, payload, qos=0):
+        self.sent.append(('publish', topic, payload))
+
+    def subscribe(self, topic, qos=0):
+        self.sent.append(('subscribe', topic))
+
+class FakeConnection(object):
+    """The parts of src.connection.ConnectionManager the gateway uses"""
+
+    def __init__(self, connected=False):
+        self.client = FakeClient()
+        self.connected = connected
+        self.subscriptions = []
+        self.forward_connect = None
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions.append(topic)
+
+    def is_connected(self):
+        return self.connected
+
+    def connect(self):
+        """What the manager does on a CONNACK"""
+        self.connected = True
+        self.forward_connect(self.client, None, {}, 0)
+
+def message(topic, payload=''):
+    return SimpleNamespace(topic=topic, payload=payload.encode('utf-8'))
+
+def attach_sequence(device_id):
+    return [('publish', '/devices/{}/attach'.format(device_id), json.dumps({'authorization': ''})),
+            ('subscribe', '/devices/{}/config'.format(device_id)),
+            ('subscribe', '/devices/{}/commands/#'.format(device_id))]
+
+@pytest.fixture
+def conn():
+    return FakeConnection()
+
+def test_gateway_subscribes_to_its_own_topics(conn):
+    gateway.Gateway(conn, 'gw')
+    assert conn.subscriptions == ['/devices/gw/errors', '/devices/gw/config', '/devices/gw/commands/#']
+
+def test_attach_waits_for_the_connection(conn):
+    gw = gateway.Gateway(conn, 'gw')
+    gw.attach('pi-1', None)
+    assert conn.client.sent == []
+    conn.connect()
+    assert conn.client.sent == attach_sequence('pi-1')
+    # Attached straight away once connected
+    gw.attach('pi-2', None)
+    assert conn.client.sent[3:] == attach_sequence('pi-2')
+    assert gw.attached() == ['pi-1', 'pi-2']
+
+def test_devices_are_attached_again_before_on_connect_is_forwarded(conn):
+    sent_before_forward = []
+    conn.forward_connect = lambda client, userdata, flags, rc: sent_before_forward.append(list(client.sent))
+    gw = gateway.Gateway(conn, 'gw')
+    gw.attach('pi-1', None)
+    gw.attach('pi-2', None)
+    conn.connect()
+    # Dropped and connected again, Cloud IoT has forgotten the attachments
+    conn.connected = False
+    conn.connect()
+    expected = attach_sequence('pi-1') + attach_sequence('pi-2')
+    assert sent_before_forward == [expected, expected + expected]
+    assert gw.stats()['attaches'] == 4
+
+def test_failed_connect_attaches_nothing(conn):
+    forwarded = []
+    conn.forward_connect = lambda client, userdata, flags, rc: forwarded.append(rc)
+    gw = gateway.Gateway(conn, 'gw')
+    gw.attach('pi-1', None)
+    gw.on_connect(conn.client, None, {}, 5)
+    assert conn.client.sent == []
+    assert forwarded == [5]
+
+def test_messages_are_routed_to_their_device(conn):
+    received = []
+    own = []
+    gw = gateway.Gateway(conn, 'gw', on_message=lambda client, userdata, msg: own.append(msg.topic))
+    gw.attach('pi-1', lambda client, userdata, msg: received.append(('pi-1', msg.topic)))
+    gw.attach('pi-2', lambda client, userdata, msg: received.append(('pi-2', msg.topic)))
+    assert conn.client.on_message == gw.on_message
+
+    gw.on_message(conn.client, None, message('/devices/pi-2/config', '{}'))
+    gw.on_message(conn.client, None, message('/devices/pi-1/commands/pump', 'on'))
+    gw.on_message(conn.client, None, message('/devices/gw/config', '{}'))
+    gw.on_message(conn.client, None, message('/devices/unknown/config', '{}'))
+    assert received == [('pi-2', '/devices/pi-2/config'), ('pi-1', '/devices/pi-1/commands/pump')]
+    assert own == ['/devices/gw/config']
+    stats = gw.stats()
+    assert stats['routed'] == {'pi-1': 1, 'pi-2': 1}
+    assert stats['unrouted'] == 1
+
+def test_gateway_errors_are_counted_not_routed(conn):
+    own = []
+    gw = gateway.Gateway(conn, 'gw', on_message=lambda client, userdata, msg: own.append(msg))
+    gw.on_message(conn.client, None, message('/devices/gw/errors', 'pi-1 is not bound'))
+    assert own == []
+    assert gw.stats()['errors'] == 1
+    assert gw.stats()['last_error'] == 'pi-1 is not bound'
+
+def test_failing_handler_does_not_stop_routing(conn):
+    received = []
+    gw = gateway.Gateway(conn, 'gw')
+    gw.attach('bad', lambda client, userdata, msg: 1 / 0)
+    gw.attach('good', lambda client, userdata, msg: received.append(msg.topic))
+    gw.on_message(conn.client, None, message('/devices/bad/config', '{}'))
+    gw.on_message(conn.client, None, message('/devices/good/config', '{}'))
+    assert received == ['/devices/good/config']
+
+def test_detached_devices_are_not_attached_again(conn):
+    gw = gateway.Gateway(conn, 'gw')
+    gw.attach('pi-1', None)
+    gw.attach('pi-2', None)
+    conn.connect()
+    gw.detach('pi-1')
+    assert conn.client.sent[-1] == ('publish', '/devices/pi-1/detach', '')
+    conn.client.sent.clear()
+    conn.connect()
+    assert conn.client.sent == attach_sequence('pi-2')
+    gw.detach_all()
+    assert gw.attached() == []
@@ -0,0 +1,73 @@
+import math
+
+import pytest
+
+import src.history as history
+
+def test_ring_buffer_wraps_and_keeps_newest_rows():
+    ring = history.RingBuffer(('time', 'value'), 3)
+    for t in range(5):
+        ring.append((t, t * 10))
+    assert len(ring) == 3
+    assert ring.rows(('value',)) == [(2, 20), (3, 30), (4, 40)]
+    assert list(ring.indices()) == [2, 0, 1]
+
+def test_ring_buffer_since_after_wrap():
+    ring = history.RingBuffer(('time', 'value'), 4)
+    for t in range(10):
+        ring.append((t, t))
+    assert ring.rows(('value',), since=7.5) == [(8, 8), (9, 9)]
+    assert ring.rows(('value',), since=0) == [(6, 6), (7, 7), (8, 8), (9, 9)]
+    assert ring.rows(('value',), since=100) == []
+
+def test_raw_samples_wrap_at_capacity():
+    store = history.TimeSeriesStore(('pH',), raw_capacity=5)
+    for t in range(8):
+        store.add(t, (7.0 + t,))
+    assert store.raw('pH') == [(3, 10.0), (4, 11.0), (5, 12.0), (6, 13.0), (7, 14.0)]
+    assert store.latest('pH') == (7, 14.0)
+
+def test_minute_rollups_min_mean_max():
+    store = history.TimeSeriesStore(('pH', 'temperature'))
+    store.add(0, (6.0, 20.0))
+    store.add(20, (7.0, None))
+    store.add(40, (8.0, 22.0))
+    assert store.rollups('pH') == [] # Bucket is still open
+    store.add(60, (7.0, 21.0))
+    assert store.rollups('pH') == [(0, 6.0, 7.0, 8.0)]
+    assert store.rollups('temperature') == [(0, 20.0, 21.0, 22.0)]
+
+def test_missing_metric_rolls_up_to_nan():
+    store = history.TimeSeriesStore(('pH', 'temperature'))
+    store.add(0, (7.0, None))
+    store.add(60, (7.0, None))
+    (start, low, mean, high), = store.rollups('temperature')
+    assert start == 0
+    assert math.isnan(low) and math.isnan(mean) and math.isnan(high)
+
+def test_hour_rollup_weights_minutes_by_sample_count():
+    store = history.TimeSeriesStore(('pH',))
+    # First minute: three samples of 6.0, second minute: one sample of 8.0
+    for t in (0, 10, 20):
+        store.add(t, (6.0,))
+    store.add(60, (8.0,))
+    for t in range(120, history.HOUR, 60):
+        store.add(t, (None,))
+    assert store.rollups('pH', 'hour') == []
+    store.add(history.HOUR, (7.0,))
+    assert store.rollups('pH', 'hour') == [(0, 6.0, pytest.approx(6.5), 8.0)]
+    assert len(store.rollups('pH', 'minute')) == 60
+
+def test_rollup_tiers_wrap_at_capacity():
+    store = history.TimeSeriesStore(('pH',), minute_capacity=3, hour_capacity=2)
+    for t in range(0, 4 * history.HOUR + 1, 60):
+        store.add(t, (float(t // history.HOUR),))
+    minutes = store.rollups('pH', 'minute')
+    assert [row[0] for row in minutes] == [4 * history.HOUR - 180, 4 * history.HOUR - 120, 4 * history.HOUR - 60]
+    assert store.rollups('pH', 'hour') == [(2 * history.HOUR, 2.0, 2.0, 2.0),
+                                           (3 * history.HOUR, 3.0, 3.0, 3.0)]
+
+def test_unknown_resolution_is_rejected():
+    store = history.TimeSeriesStore(('pH',))
+    with pytest.raises(ValueError):
+        store.rollups('pH', 'day')
@@ -0,0 +1,54 @@
+import time
+
+import src.log as log
+
+def messages(logger):
+    return [(record['message'], record['fields']) for record in logger.dump()]
+
+def test_repeats_are_rate_limited():
+    logger = log.RingLogger(burst=2, period_secs=10)
+    for _ in range(5):
+        logger.log(log.WARN, 'Water level low', {})
+    assert len(logger.dump()) == 2
+    time.sleep(10)
+    logger.log(log.WARN, 'Water level low', {})
+    assert messages(logger)[-1] == ('Water level low', {'suppressed': 3})
+
+def test_suppressed_burst_is_reported_when_it_does_not_recur():
+    logger = log.RingLogger(burst=1, period_secs=10)
+    for _ in range(4):
+        logger.log(log.ERROR, 'Could not read sensors', {})
+    logger.expire()
+    assert len(logger.dump()) == 1
+    time.sleep(10)
+    logger.expire()
+    assert messages(logger)[-1] == ('Could not read sensors', {'suppressed': 3})
+    assert logger.limits == {}
+    # Written out with the rest
+    assert [record.fields for record in logger.take()][-1] == (('suppressed', 3),)
+
+def test_rate_limits_are_forgotten():
+    logger = log.RingLogger(burst=5, period_secs=10, max_limits=50)
+    for i in range(200):
+        logger.log(log.INFO, 'Message {}'.format(i), {})
+        time.sleep(1)
+    assert len(logger.limits) <= 51
+    assert len(logger.dump()) == 200
+
+def test_level_filters_output_but_not_the_ring():
+    logger = log.RingLogger()
+    logger.level = log.WARN
+    logger.log(log.DEBUG, 'Detail', {'value': object()})
+    logger.log(log.WARN, 'Warning', {})
+    assert [record.message for record in logger.take()] == ['Warning']
+    assert [message for message, fields in messages(logger)] == ['Detail', 'Warning']
+    # Kept JSON-friendly
+    assert isinstance(logger.dump()[0]['fields']['value'], str)
+
+def test_dump_counts_from_the_end():
+    logger = log.RingLogger(ring_size=3)
+    for i in range(5):
+        logger.log(log.INFO, 'Sample', {'i': i})
+    assert [record['fields']['i'] for record in logger.dump(2)] == [3, 4]
+    assert [record['fields']['i'] for record in logger.dump()] == [2, 3, 4]
+    assert logger.dump(0) == []
@@ -0,0 +1,45 @@
+import json
+
+import src.log as log
+import src.metrics as metrics
+
+def test_quantile_picks_the_bucket_bound():
+    histogram = metrics.Histogram('test_seconds', '', (), buckets=(0.1, 1.0, 10.0))
+    assert histogram.quantile(0.5) is None
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 1.0
+    assert histogram.quantile(0.99) == 10.0
+
+def test_quantile_above_the_last_bucket_stays_finite():
+    histogram = metrics.Histogram('test_seconds', '', (), buckets=(0.1, 1.0))
+    histogram.observe(86400 * 3)
+    assert histogram.quantile(0.99) == 1.0
+
+def test_snapshot_is_valid_json():
+    registry = metrics.Registry()
+    registry.get(metrics.Histogram, 'test_delivery_seconds', '', {}).observe(1e9)
+    registry.get(metrics.Counter, 'test_total', '', {}).inc(3)
+    summary = json.loads(json.dumps(metrics.snapshot(registry), allow_nan=False))
+    assert summary['test_total'] == 3
+    assert summary['test_delivery_seconds']['p99'] == metrics.DEFAULT_BUCKETS[-1]
+
+def test_render_has_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.get(metrics.Histogram, 'test_seconds', 'help', {'channel': 'pH'},
+                             buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    text = metrics.render(registry)
+    assert 'test_seconds_bucket{channel="pH",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{channel="pH",le="+Inf"} 2' in text
+
+def test_reporter_failures_go_to_the_log():
+    def fail(summary):
+        reporter.kill()
+        raise RuntimeError('publish failed')
+    reporter = metrics.MetricsReporter(fail, interval_secs=1)
+    # On this thread, so sleeping advances the virtual clock
+    reporter.run()
+    assert any(record['message'] == 'Could not report metrics' and
+               record['fields']['error'] == 'publish failed' for record in log.dump(20))
@@ -0,0 +1,67 @@
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+import src.outbox as outbox
+
+class Client(object):
+    """Records what is published, acks nothing by itself"""
+
+    def __init__(self):
+        self.mids = itertools.count(1)
+        self.published = []
+
+    def publish(self, topic, payload, qos=0):
+        info = SimpleNamespace(rc=outbox.MQTT_ERR_SUCCESS, mid=next(self.mids))
+        self.published.append((info.mid, topic, payload))
+        return info
+
+@pytest.fixture
+def box(tmp_path):
+    box = outbox.Outbox(Client(), str(tmp_path / 'outbox.db'), max_in_flight=5)
+    yield box
+    box.close()
+
+def totals(box):
+    stored_bytes, stored_count = box.stored_bytes, box.stored_count
+    box.recount()
+    return (stored_bytes, stored_count), (box.stored_bytes, box.stored_count)
+
+def test_acks_update_the_totals_without_a_rescan(box):
+    for i in range(10):
+        box.put('/devices/tank/events', 'sample {}'.format(i) * (i + 1))
+    box.replay(5, box.acks.sending())
+    assert len(box.client.published) == 5
+
+    acked = [box.acks.ack(mid) for mid, topic, payload in box.client.published]
+    box.delete(acked)
+    # Deleting rows that are already gone changes nothing
+    box.delete(acked[:2])
+    kept, counted = totals(box)
+    assert kept == counted
+    assert box.pending() == 5
+
+def test_cap_drops_the_oldest_and_keeps_the_totals(box):
+    box.max_bytes = 20 * (len('/t') + 100 + outbox.ROW_OVERHEAD_BYTES)
+    for i in range(30):
+        box.put('/t', bytes([i]) * 100)
+    assert box.dropped > 0
+    assert box.stored_bytes <= box.max_bytes
+    kept, counted = totals(box)
+    assert kept == counted
+    oldest = box.db.execute('SELECT MIN(id) FROM outbox').fetchone()[0]
+    assert oldest > 1
+
+def test_stored_messages_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    box = outbox.Outbox(Client(), path)
+    box.put('/t', b'kept')
+    box.close()
+    box = outbox.Outbox(Client(), path)
+    try:
+        assert box.pending() == 1
+        box.replay(1, set())
+        assert box.client.published[0][2] == b'kept'
+    finally:
+        box.close()
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def simulate(hours, *args):
+    """Run piponic.py on the simulator, returns its output"""
+    result = subprocess.run(
+        [sys.executable, 'piponic.py', '--simulate', '--simulate_hours={}'.format(hours),
+         '--metrics_port=0'] + list(args),
+        cwd=ROOT, capture_output=True, text=True, timeout=120)
+    output = result.stdout + result.stderr
+    assert 'Traceback' not in output
+    return output
+
+def count(output, message):
+    return sum(1 for line in output.splitlines() if message in line)
+
+def test_threaded_binary_telemetry_batches_fresh_readings_only():
+    hours = 2
+    json_messages = count(simulate(hours), 'Publishing sensor data')
+    # One sample per message, so messages count samples
+    samples = count(simulate(hours, '--telemetry_format=binary', '--telemetry_batch_size=1'),
+                    'Publishing batch of sensor data')
+    assert json_messages == 60 * hours
+    # At most one sample per one-minute cycle, never one per pass of the inner loop
+    assert samples <= 60 * hours
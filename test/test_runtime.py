@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+
+import src.runtime as runtime
+import src.simulator as simulator
+
+class Done(Exception):
+    pass
+
+@pytest.fixture
+def rt():
+    rt = runtime.AsyncRuntime(None, None, executor=simulator.InlineExecutor(),
+                              loop=simulator.new_event_loop())
+    yield rt
+    rt.loop.close()
+
+def run_every(rt, period, work_secs, cycles, blocking=False):
+    """Run a job on rt.every() for <cycles> cycles, returns the loop time each one started"""
+    starts = []
+
+    async def job():
+        starts.append(rt.loop.time())
+        if len(starts) == cycles:
+            raise Done()
+        if blocking:
+            # A slow hardware call, on the virtual clock
+            await rt.run_blocking(time.sleep, work_secs)
+        else:
+            await asyncio.sleep(work_secs)
+
+    with pytest.raises(Done):
+        rt.loop.run_until_complete(rt.every('job', lambda: period, job))
+    return starts
+
+@pytest.mark.parametrize('blocking', [False, True])
+def test_fixed_rate_does_not_drift(rt, blocking):
+    starts = run_every(rt, 60, 7, 100, blocking=blocking)
+    offsets = [start - starts[0] for start in starts]
+    assert offsets == [pytest.approx(60 * i, abs=1e-6) for i in range(100)]
+    assert rt.overruns['job'] == 0
+
+def test_overrun_skips_missed_slots(rt):
+    starts = run_every(rt, 10, 25, 4)
+    offsets = [start - starts[0] for start in starts]
+    # Each 25 s job misses two 10 s deadlines and restarts on the next slot
+    assert offsets == [pytest.approx(30 * i, abs=1e-6) for i in range(4)]
+    assert rt.overruns['job'] == 6
+
+def test_period_changes_apply_on_the_next_cycle(rt):
+    periods = iter([60, 60, 30, 30, 30])
+    starts = []
+
+    async def job():
+        starts.append(rt.loop.time())
+        if len(starts) == 5:
+            raise Done()
+
+    with pytest.raises(Done):
+        rt.loop.run_until_complete(rt.every('job', lambda: next(periods), job))
+    offsets = [start - starts[0] for start in starts]
+    assert offsets == [pytest.approx(t, abs=1e-6) for t in (0, 60, 120, 150, 180)]
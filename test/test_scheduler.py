@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+import src.scheduler as scheduler
+
+NO_JITTER = {scheduler.config_keys(sensor)[1]: 0 for sensor in scheduler.SENSORS}
+
+def make(config=None, seed=0):
+    settings = dict(NO_JITTER)
+    settings.update(config or {})
+    return scheduler.SamplingScheduler(settings, rng=random.Random(seed))
+
+def test_everything_is_due_on_the_first_cycle():
+    sampling = make()
+    start = sampling.next_due['pH']
+    assert sampling.due(start) == list(scheduler.SENSORS)
+    assert sampling.due(start) == []
+
+def test_each_sensor_keeps_its_own_interval():
+    sampling = make({'battery_interval_secs': 600})
+    start = sampling.next_due['pH']
+    reads = {sensor: 0 for sensor in scheduler.SENSORS}
+    for minute in range(60):
+        for sensor in sampling.due(start + minute * 60):
+            reads[sensor] += 1
+    assert reads == {'temperature': 60, 'pH': 60, 'leak': 60, 'water_level': 60, 'battery': 6}
+
+def test_deadlines_advance_from_the_last_deadline():
+    sampling = make()
+    start = sampling.next_due['pH']
+    sampling.due(start)
+    # Called late, the next deadline is still a whole interval after the last one
+    assert 'pH' in sampling.due(start + 70)
+    assert sampling.next_due['pH'] == start + 120
+    assert sampling.time_until_due(start + 70) == 50
+
+def test_far_behind_does_not_read_back_to_back():
+    sampling = make()
+    start = sampling.next_due['pH']
+    sampling.due(start)
+    assert 'pH' in sampling.due(start + 1000)
+    assert sampling.next_due['pH'] == start + 1060
+    assert sampling.due(start + 1001) == []
+
+def test_jitter_is_bounded():
+    sampling = make({'pH_jitter_secs': 5})
+    start = sampling.next_due['pH']
+    sampling.due(start)
+    for i in range(100):
+        deadline = sampling.next_due['pH']
+        sampling.due(deadline)
+        assert 55 <= sampling.next_due['pH'] - deadline <= 65
+
+def test_jitter_is_clamped_to_half_the_interval():
+    sampling = make({'leak_interval_secs': 10, 'leak_jitter_secs': 60})
+    assert sampling.schedule['leak'] == (10.0, 5.0)
+
+def test_shorter_interval_reschedules_straight_away():
+    sampling = make({'battery_interval_secs': 3600})
+    start = sampling.next_due['battery']
+    sampling.due(start)
+    assert sampling.next_due['battery'] == start + 3600
+
+    sampling.configure({'battery_interval_secs': 60})
+    # Settings missing from the update are kept
+    assert sampling.schedule['pH'] == (60.0, 0.0)
+    assert sampling.next_due['battery'] <= start + 60
+    assert 'battery' in sampling.due(start + 60)
+
+def test_longer_interval_applies_after_the_next_read():
+    sampling = make()
+    start = sampling.next_due['pH']
+    sampling.due(start)
+    sampling.configure({'pH_interval_secs': 600})
+    assert sampling.next_due['pH'] == start + 60
+    sampling.due(start + 60)
+    assert sampling.next_due['pH'] == start + 660
+
+def test_interval_must_be_positive():
+    sampling = make()
+    with pytest.raises(ValueError):
+        sampling.configure({'pH_interval_secs': 0})
@@ -0,0 +1,30 @@
+import time
+
+import src.pins as pins
+import src.simulator as simulator
+
+def test_sleep_advances_virtual_time_instantly():
+    start = time.monotonic()
+    wall_start = time.perf_counter()
+    time.sleep(3600)
+    assert time.monotonic() - start == 3600
+    assert time.perf_counter() - wall_start < 5
+
+def test_gpio_counts_switches():
+    gpio = simulator.gpio()
+    gpio.setmode(gpio.BCM)
+    gpio.setup(pins.peristaltic_pump, gpio.OUT, initial=gpio.HIGH)
+    switches = gpio.switch_counts.get(pins.peristaltic_pump, 0)
+    gpio.output(pins.peristaltic_pump, gpio.LOW)
+    gpio.output(pins.peristaltic_pump, gpio.LOW)
+    assert gpio.switch_counts[pins.peristaltic_pump] == switches + 1
+    assert gpio.is_output_low(pins.peristaltic_pump)
+    gpio.output(pins.peristaltic_pump, gpio.HIGH)
+
+def test_adc_reads_the_plant():
+    # Imported here, so the fake ADS1115 is in place first
+    import src.adc as adc
+    sensors = adc.adc_sensors()
+    volts = sensors.read_channels(['pH', 'leak'])
+    assert set(volts) == {'pH', 'leak'}
+    assert 0 < volts['pH'] < 5
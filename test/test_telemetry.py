@@ -0,0 +1,64 @@
+import math
+
+import pytest
+
+import src.telemetry as telemetry
+
+VALUES = (21.5, 6.912, 0.019, 1, 3.7, 0.02)
+
+def test_round_trip():
+    samples = [(1700000000, VALUES), (1700000060, (None, 7.0, None, -1, None, 0.0))]
+    decoded = telemetry.decode(telemetry.encode(samples))
+    assert [timestamp for timestamp, values in decoded] == [1700000000, 1700000060]
+    for (timestamp, expected), (_, values) in zip(samples, decoded):
+        for want, got in zip(expected, values):
+            if want is None:
+                assert got is None
+            else:
+                assert got == pytest.approx(want, abs=0.01)
+
+def test_out_of_range_values_are_clamped_or_missing():
+    values = telemetry.decode(telemetry.encode([(0, (1000.0, -1.0, float('nan'), 0, 100.0, 0.0))]))[0][1]
+    assert values[0] == pytest.approx(327.67)
+    assert values[1] == 0
+    assert values[2] is None
+    assert values[4] == pytest.approx(65.534)
+
+def test_encode_rejects_out_of_order_samples():
+    with pytest.raises(ValueError):
+        telemetry.encode([(100, VALUES), (99, VALUES)])
+
+def test_batch_is_sent_when_full():
+    batcher = telemetry.TelemetryBatcher(batch_size=3)
+    assert batcher.add(0, VALUES) is None
+    assert batcher.add(60, VALUES) is None
+    payload = batcher.add(120, VALUES)
+    assert len(telemetry.decode(payload)) == 3
+    assert len(batcher) == 0
+
+def test_clock_stepping_back_starts_a_new_batch():
+    batcher = telemetry.TelemetryBatcher(batch_size=10)
+    batcher.add(1600000000.5, VALUES)
+    batcher.add(1600000060.5, VALUES)
+    # NTP syncs and time jumps back
+    payload = batcher.add(1500000000.0, VALUES)
+    assert [timestamp for timestamp, values in telemetry.decode(payload)] == [1600000000, 1600000060]
+    assert len(batcher) == 1
+    # Less than a second back still moves the whole seconds back
+    payload = batcher.add(1499999999.9, VALUES)
+    assert len(telemetry.decode(payload)) == 1
+    assert len(telemetry.decode(batcher.flush())) == 1
+
+def test_long_gap_starts_a_new_batch():
+    batcher = telemetry.TelemetryBatcher(batch_size=10, max_age_secs=math.inf)
+    batcher.add(0, VALUES)
+    payload = batcher.add(telemetry.MAX_DELTA_SECS + 1, VALUES)
+    assert len(telemetry.decode(payload)) == 1
+    assert len(batcher) == 1
+
+def test_unencodable_batch_is_dropped():
+    batcher = telemetry.TelemetryBatcher()
+    batcher.samples = [(100, VALUES), (50, VALUES)]
+    assert batcher.flush() is None
+    assert len(batcher) == 0
+    assert batcher.add(200, VALUES) is None
@@ -0,0 +1,23 @@
+import time
+
+import src.temp as temp
+
+def test_parse_checks_crc():
+    assert temp.parse(['72 01 4b 46 7f ff 0e 10 57 : crc=57 YES\n',
+                       '72 01 4b 46 7f ff 0e 10 57 t=23125\n']) == 23.125
+    assert temp.parse(['72 01 4b 46 7f ff 0e 10 57 : crc=00 NO\n',
+                       '72 01 4b 46 7f ff 0e 10 57 t=23125\n']) is None
+
+def test_missing_probe_does_not_block_later_reads():
+    first_conversion = temp.watch('28-000000000000')
+    # Let the reader get round to the probe, on the virtual clock
+    for _ in range(10):
+        if first_conversion.is_set():
+            break
+        time.sleep(temp.READ_INTERVAL_SECS)
+    assert first_conversion.is_set()
+
+    started = time.perf_counter()
+    for _ in range(3):
+        assert temp.read('28-000000000000') == -1
+    assert time.perf_counter() - started < temp.FIRST_READ_TIMEOUT_SECS
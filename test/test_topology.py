@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+import src.adc as adc
+import src.temp as temp
+import src.topology as topology
+
+SWAPPED = {'leak': 1, 'pH': 0, 'battery': 2, 'internal_leak': 3}
+
+def test_first_tank_defaults_to_the_pins_wiring():
+    tanks = topology.parse({'tanks': [{'name': 'main'}]})
+    assert tanks[0]._replace(name='tank0') == topology.DEFAULT_TANK
+
+def test_problems_are_all_listed():
+    with pytest.raises(ValueError) as error:
+        topology.parse({'tanks': [
+            {'name': 'a', 'temperature_probe': '28-a', 'channels': {'pH': 0}},
+            {'name': 'a', 'temperature_probe': '28-a', 'adc_address': '0x50',
+             'pump_pin': 13, 'solenoid_pin': 13}]})
+    message = str(error.value)
+    for problem in ('channels must map', 'not an ADS1115 address', 'name a is used',
+                    'temperature probe 28-a is used', 'GPIO 13 is used'):
+        assert problem in message
+
+def test_channels_of_a_chip_already_in_use_are_applied():
+    sensors = adc.adc_sensors()
+    tank = topology.parse({'tanks': [{'channels': SWAPPED}]})[0]
+    try:
+        tank_sensors = topology.TankSensors(tank)
+        assert tank_sensors.adc_sensors.channels == SWAPPED
+        assert sensors.leak_sensor.pin == 1
+        assert sensors.pH_sensor.pin == 0
+    finally:
+        sensors.use_channels(adc.CHANNELS)
+    assert sensors.pH_sensor.pin == 1
+
+def test_channels_cannot_change_during_a_scan():
+    sensors = adc.adc_sensors()
+    sensors.start_continuous()
+    try:
+        with pytest.raises(RuntimeError):
+            sensors.use_channels(SWAPPED)
+    finally:
+        sensors.stop_continuous()
+    assert sensors.channels == adc.CHANNELS
+
+def test_unwatched_probe_is_no_longer_converted():
+    temp.watch('28-0000000000aa')
+    reader = temp.start()
+    assert '28-0000000000aa' in reader.probes
+    temp.unwatch('28-0000000000aa')
+    assert '28-0000000000aa' not in reader.probes
+    time.sleep(temp.READ_INTERVAL_SECS * 2)
+    assert reader.latest('28-0000000000aa') == (None, None)
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+import src.tracker as tracker
+
+def test_percentile_nearest_rank():
+    assert tracker.percentile([], 50) is None
+    assert tracker.percentile([3, 1, 2], 50) == 2
+    assert tracker.percentile(list(range(1, 101)), 99) == 99
+    assert tracker.percentile([5], 99) == 5
+
+def test_window_limits_messages_in_flight():
+    acks = tracker.PublishTracker(max_in_flight=3, ack_timeout_secs=60)
+    for mid in range(3):
+        acks.track(mid, row_id=100 + mid, created=time.time())
+    assert acks.free() == 0
+    assert acks.sending() == {100, 101, 102}
+    assert acks.ack(1) == 101
+    assert acks.free() == 1
+
+def test_timeout_halves_the_window_and_acks_grow_it_back():
+    acks = tracker.PublishTracker(max_in_flight=8, ack_timeout_secs=60)
+    for mid in range(8):
+        acks.track(mid, mid, time.time())
+    time.sleep(61)
+    assert sorted(acks.expire()) == list(range(8))
+    assert acks.stats()['window'] == 4
+    assert acks.stats()['timeouts'] == 8
+
+    # Multiplicative decrease again, but never below one
+    for attempt in range(5):
+        acks.track(100 + attempt, 0, time.time())
+        time.sleep(61)
+        acks.expire()
+    assert acks.free() == 1
+
+    # Additive increase: about one more message per window's worth of acks
+    mid = 200
+    for expected in (2, 3, 4):
+        while acks.stats()['window'] < expected:
+            acks.track(mid, mid, time.time())
+            acks.ack(mid)
+            mid += 1
+    assert mid - 200 <= 1 + 2 + 3 + 1
+    for _ in range(100):
+        acks.track(mid, mid, time.time())
+        acks.ack(mid)
+        mid += 1
+    assert acks.stats()['window'] == 8
+
+def test_ack_before_track_is_not_lost():
+    acks = tracker.PublishTracker(max_in_flight=2, ack_timeout_secs=60)
+    assert acks.ack(7) is None
+    assert acks.track(7, row_id=1, created=time.time()) is True
+    assert acks.sending() == set()
+    assert acks.stats()['acked'] == 1
+
+def test_stray_acks_are_forgotten():
+    acks = tracker.PublishTracker(max_in_flight=2, ack_timeout_secs=60)
+    acks.ack(9)
+    time.sleep(61)
+    acks.expire()
+    assert acks.track(9, row_id=1, created=time.time()) is False
+
+def test_stats_report_latencies():
+    acks = tracker.PublishTracker(max_in_flight=2, ack_timeout_secs=60)
+    acks.track(1, row_id=1, created=time.time() - 30)
+    time.sleep(2)
+    acks.ack(1)
+    stats = acks.stats()
+    assert stats['ack_p50'] == pytest.approx(2)
+    assert stats['delivery_p99'] == pytest.approx(32)
+    assert stats['in_flight'] == 0